@@ -0,0 +1,67 @@
+import argparse
+import queue
+import time
+import numpy as np
+
+from SpacePartition import DHC, maxcovering
+
+"""
+Regression check of the batched DHC against the former queue-based DHC: both
+must return the same regions (same rows, same row order, same region order)
+python3 CheckPartition.py [--seeds seeds.npy] [--num 100000]
+"""
+
+
+def LegacyDHC(arrs):
+    # former implementation (one bincount per dimension, copies of every
+    # sub-array), only used for comparison
+    q = queue.LifoQueue()
+    q.put(arrs)
+    regions_arrs = []
+    while not q.empty():
+        arrs = q.get()
+        if len(arrs) < 16:
+            regions_arrs.append(arrs)
+            continue
+        splits = maxcovering(arrs)
+        for s in splits:
+            q.put(arrs[s])
+
+    return regions_arrs
+
+
+def SyntheticSeeds(num, seed=0):
+    # clustered seeds: a few hundred networks with structured interface ids,
+    # without duplicates (the former DHC does not terminate on 16 or more
+    # identical rows)
+    rng = np.random.RandomState(seed)
+    nets = rng.randint(0, 16, (max(num // 200, 1), 16))
+    arrs = np.zeros((num, 32), dtype=np.uint8)
+    arrs[:, :16] = nets[rng.randint(0, len(nets), num)]
+    low = rng.randint(0, 16, (num, 16))
+    low[:, :12] *= rng.random_sample((num, 12)) < 0.05
+    arrs[:, 16:] = low
+    arrs = np.unique(arrs, axis=0)
+    return arrs[rng.permutation(len(arrs))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seeds", type=str, default=None, help="seeds.npy written by convert.py")
+    parser.add_argument("--num", type=int, default=100000, help="number of synthetic seeds")
+    args = parser.parse_args()
+
+    data = np.load(args.seeds) if args.seeds else SyntheticSeeds(args.num)
+
+    t_start = time.time()
+    legacy = LegacyDHC(data)
+    t_legacy = time.time() - t_start
+    t_start = time.time()
+    results = DHC(data)
+    t_batched = time.time() - t_start
+
+    assert len(results) == len(legacy), "{} regions, expected {}".format(len(results), len(legacy))
+    for i, (r, l) in enumerate(zip(results, legacy)):
+        assert np.array_equal(r, l), "region {} differs".format(i)
+    print("{} seeds, {} identical regions".format(len(data), len(results)))
+    print("legacy DHC: {:.3f} s, batched DHC: {:.3f} s".format(t_legacy, t_batched))
@@ -1,25 +1,31 @@
+import os
+import sys
 import numpy as np
-import queue
 
-from numpy.lib.shape_base import split
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from partition_utils import dhc_regions, dhc_ranges, map_regions
 
 
 def DHC(arrs):
-    # q = queue.Queue()
-    q = queue.LifoQueue()
-    q.put(arrs)
-    regions_arrs = []
-    while not q.empty():
-        arrs = q.get()
-        if len(arrs) < 16:
-            regions_arrs.append(arrs)
-            continue
-        splits = maxcovering(arrs)
-        # splits  = leftmost(arrs)
-        for s in splits:
-            q.put(arrs[s])
-
-    return regions_arrs
+    # regions are split depth-first (like a LIFO queue of regions), the split
+    # dimensions of all regions of a tree level are chosen in one batch
+    return dhc_regions(arrs, maxcovering_dims, min_split=16, lifo=True)
+
+
+def DHCRanges(arrs):
+    # the regions of DHC as (lo, hi) row ranges of the reordered seeds
+    return dhc_ranges(arrs, maxcovering_dims, min_split=16, lifo=True)
+
+
+def maxcovering_dims(hist):
+    # batched maxcovering on the nibble histograms (regions x 32 x 16)
+    nonzero = np.count_nonzero(hist, axis=2)
+    Covering = np.where(nonzero == 1, -1, np.sum(hist*(hist != 1), axis=2))
+    leftmost_index = np.argmax(nonzero > 1, axis=1)
+    index = np.argmax(Covering, axis=1)
+    regions = np.arange(len(hist))
+    leftmost = Covering[regions, index] - Covering[regions, leftmost_index] <= index - leftmost_index
+    return np.where(leftmost, leftmost_index, index)
 
 
 def maxcovering(arrs):
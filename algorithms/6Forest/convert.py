@@ -1,17 +1,34 @@
 # convert IPv6 str to numpy seeds.npy
 
 import numpy as np
-from IPy import IP
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import V6BIN_EXT, read_v6bin_header, load_v6bin, parse_bulk, to_nibbles
 
-with open("./seeds") as f:
-    arrs = []
-    for ip in f.read().splitlines()[:10000]:
-        arrs.append([int(x, 16)
-                    for x in IP(ip).strFullsize().replace(":", "")])
+fn_seeds = sys.argv[1] if len(sys.argv) > 1 else "./seeds"
+# number of seeds to partition, 0 uses all seeds of the file
+limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
 
-    np.save("seeds.npy", np.array(arrs, dtype=np.uint8))
+# .v6bin seed files are mapped without parsing text, text seed files are
+# parsed in bulk and lines without a valid address are skipped
+# The limit keeps the first seeds in file order for both formats. A sorted
+# .v6bin file no longer has the order of the original seed file, its first
+# seeds would all come from the lowest prefixes, so a uniform random sample
+# (fixed seed, kept in file order) is taken instead
+if fn_seeds.endswith(V6BIN_EXT):
+    _, is_sorted, _ = read_v6bin_header(fn_seeds)
+    addrs = load_v6bin(fn_seeds)
+    if limit and is_sorted and len(addrs) > limit:
+        addrs = addrs[np.sort(np.random.RandomState(0).choice(len(addrs), limit, replace=False))]
+else:
+    with open(fn_seeds) as f:
+        addrs, valid = parse_bulk(f.read().splitlines()[:limit or None])
+        addrs = addrs[valid]
+
+seeds = to_nibbles(addrs[:limit or None])
+np.save("seeds.npy", seeds)
 
 
 # with open("responsive-addresses.txt") as f:
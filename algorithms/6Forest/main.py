@@ -1,4 +1,5 @@
-
+import os
+import argparse
 
 from OutlierDetection import OutlierDetect
 from SpacePartition import *
@@ -8,15 +9,17 @@ from SpacePartition import show_regions
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args()
+
     data = np.load("./seeds.npy")
 
     outliers = []
     patterns = []
-    results = DHC(data)
-
-    for r in results:
+    # the regions are processed in parallel, the results keep the region order
+    for p, o in map_regions(OutlierDetect, *DHCRanges(data), workers=args.workers):
 
-        p, o = OutlierDetect(r)
         patterns += p
         outliers += o
         # show_regions(p)
@@ -22,6 +22,11 @@ ec_id_path = category_path + 'ec/id/'
 ipv62vec_id_path = category_path + 'ipv62vec/id/'
 
 
+def id_translation(vocab_dict):
+    # str.translate table from every nibble character to its id and a space
+    return {ord(word): str(id) + ' ' for word, id in vocab_dict.items() if len(word) == 1}
+
+
 class RFCBased(object):
     def __init__(self, batch_size):
         self.classify_dict = {}
@@ -97,8 +102,9 @@ class EntropyClustering(object):
         self.ec_id_path = ec_id_path
         self.batch_size = batch_size
         self.emb_data_num = []
+        self.id_written = False
 
-    def create_category(self):
+    def create_category(self, vocab_dict=None):
         for filename in os.listdir(self.ec_data_path):
             os.remove(self.ec_data_path + filename)
         for filename in os.listdir(self.ec_id_path):
@@ -107,7 +113,7 @@ class EntropyClustering(object):
         # os.system(self.profile_cmd)
         # os.system(self.cluster_cmd)
         for i in range(self.k):
-            self.classify_dict[str(i)] = []
+            self.classify_dict[str(i)] = 0
             self.classify_prefix_dict[str(i)] = []
         type_pointer = 0
         class_prefix = []
@@ -125,25 +131,50 @@ class EntropyClustering(object):
         f.close()
         print(self.classify_prefix_dict['3'])
 
+        # prefix -> clusters (a prefix listed n times is written n times)
+        prefix_types = {}
         for type in self.classify_prefix_dict.keys():
             for prefix in self.classify_prefix_dict[type]:
-                f = open(self.source_data, 'r')
-                for line in f:
-                    if prefix == line[:8]:
-                        self.classify_dict[type].append(line)
-                f.close()
-
-        for type in self.classify_dict.keys():
-            f = open(self.ec_data_path + 'cluster_' + type + '.txt', 'w')
-            f.writelines(self.classify_dict[type])
-            f.close()
+                prefix_types.setdefault(prefix, []).append(type)
+
+        # single pass over the source data, every address is appended to the
+        # data (and id) files of the clusters of its prefix
+        data_files = {type: open(self.ec_data_path + 'cluster_' + type + '.txt', 'w')
+                      for type in self.classify_prefix_dict.keys()}
+        id_files = {}
+        if vocab_dict is not None:
+            id_table = id_translation(vocab_dict)
+            id_files = {type: open(self.ec_id_path + 'cluster_' + type + '.id', 'w')
+                        for type in self.classify_prefix_dict.keys()}
+        f = open(self.source_data, 'r')
+        for line in f:
+            types = prefix_types.get(line[:8])
+            if types is None:
+                continue
+            if id_files:
+                id_line = line.rstrip('\n').translate(id_table)[:-1] + '\n'
+            for type in types:
+                data_files[type].write(line)
+                self.classify_dict[type] += 1
+                if id_files:
+                    id_files[type].write(id_line)
+        f.close()
+        for g in list(data_files.values()) + list(id_files.values()):
+            g.close()
+        self.id_written = bool(id_files)
 
     def gen_id_file(self, vocab_dict):
         emb_file_list = []
         for filename in sorted(os.listdir(self.ec_data_path)):
             emb_id_file = self.ec_id_path + filename[:-3] + 'id'
             emb_data_file = self.ec_data_path + filename
-            data_num = self.gen_id_data(emb_id_file, emb_data_file, vocab_dict)
+            if self.id_written:
+                # written by create_category already
+                data_num = self.classify_dict[filename[len('cluster_'):-4]]
+                if data_num >= self.batch_size:
+                    self.emb_data_num.append(data_num)
+            else:
+                data_num = self.gen_id_data(emb_id_file, emb_data_file, vocab_dict)
             if data_num >= self.batch_size:
                 emb_file_list.append(emb_id_file)
             else:
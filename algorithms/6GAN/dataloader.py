@@ -1,6 +1,13 @@
+import os
+import sys
+import time
 import numpy as np
 import ipaddress
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import from_nibbles, unique_sorted, isin_sorted, parse_hex_bulk
+from prefix_utils import prefix_ranges
+
 
 class DataProcessing(object):
     def __init__(self, data_path, vocab_path, num_data):
@@ -87,47 +94,21 @@ class DisDataLoader(object):
 
     def load_train_data(self, positive_file_list, negative_file_list):
         # Load data
-        positive_examples = []
-        negative_examples = []
-        for positive_file in positive_file_list:
-            class_examples = []
-            with open(positive_file)as fin:
-                for line in fin:
-                    line = line.strip()
-                    line = line.split()
-                    parse_line = [int(x) for x in line]
-                    class_examples .append(parse_line)
-            positive_examples.append(class_examples)
-        for negative_file in negative_file_list:
-            with open(negative_file)as fin:
-                for line in fin:
-                    line = line.strip()
-                    line = line.split()
-                    parse_line = [int(x) for x in line]
-                    negative_examples.append(parse_line)
-
-        examples = []
-        for class_examples in positive_examples:
-            examples = examples + class_examples
-        examples = examples + negative_examples
-        self.sentences = np.array(examples)
-        self.sentences = self.padding(self.sentences, self.max_sequence_length)
-
-        # Generate labels
-        positive_class_num = len(positive_file_list) + 1
-        onehot_labels = np.zeros((positive_class_num, positive_class_num))
-        for i in range(positive_class_num):
-            onehot_labels[i][i] = 1
-        count = 0
-        for label, class_examples in zip(onehot_labels[:-1], positive_examples):
-            if count == 0:
-                self.labels = [label for _ in class_examples]
-            else:
-                self.labels = np.concatenate([self.labels, [label for _ in class_examples]], 0)
-            count += 1
-
-        negative_labels = [onehot_labels[-1] for _ in negative_examples]
-        self.labels = np.concatenate([self.labels, negative_labels], 0)
+        positive_examples = [read_id_file(positive_file, self.max_sequence_length)
+                             for positive_file in positive_file_list]
+        negative_examples = [read_id_file(negative_file, self.max_sequence_length)
+                             for negative_file in negative_file_list]
+        self.load_train_arrays(positive_examples, negative_examples)
+
+    def load_train_arrays(self, positive_examples, negative_examples):
+        """positive_examples: one padded id matrix per class, negative_examples: padded id matrices"""
+        self.sentences = np.concatenate(list(positive_examples) + list(negative_examples), 0)
+
+        # Generate labels, the negative examples are the last class
+        class_sizes = [len(class_examples) for class_examples in positive_examples]
+        class_sizes.append(sum(len(examples) for examples in negative_examples))
+        self.labels = np.zeros((len(self.sentences), len(class_sizes)))
+        self.labels[np.arange(len(self.sentences)), np.repeat(np.arange(len(class_sizes)), class_sizes)] = 1
 
         # Shuffle the data
         shuffle_indices = np.random.permutation(np.arange(len(self.labels)))
@@ -152,12 +133,99 @@ class DisDataLoader(object):
         self.pointer = 0
 
     def padding(self, inputs, max_sequence_length):
-        batch_size = len(inputs)
-        inputs_batch_major = np.zeros(shape=[batch_size, max_sequence_length], dtype=np.int32)  # == PAD
-        for i, seq in enumerate(inputs):
-            for j, element in enumerate(seq):
-                inputs_batch_major[i, j] = element
-        return inputs_batch_major
+        lengths = [len(seq) for seq in inputs]
+        ids = np.concatenate([np.zeros(0, dtype=np.int32)] + [np.asarray(seq, dtype=np.int32) for seq in inputs])
+        return pad_sequences(ids, lengths, max_sequence_length)
+
+
+def pad_sequences(ids, lengths, max_sequence_length):
+    """copy the concatenated id sequences of the given lengths into the rows of a PAD (0) padded int32 matrix"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    inputs_batch_major = np.zeros(shape=[len(lengths), max_sequence_length], dtype=np.int32)  # == PAD
+    if len(lengths) > 0 and (lengths == lengths[0]).all():
+        inputs_batch_major[:, :lengths[0]] = np.reshape(ids, (len(lengths), lengths[0]))
+    else:
+        starts = np.cumsum(lengths) - lengths
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        inputs_batch_major[rows, np.arange(len(ids)) - np.repeat(starts, lengths)] = ids
+    return inputs_batch_major
+
+
+def read_id_file(id_file, max_sequence_length):
+    """read a file of space separated ids (one sequence per line) into a padded int32 matrix"""
+    with open(id_file, 'r') as f:
+        text = f.read()
+    if text and text[-1] != '\n':
+        text += '\n'
+    # the number of ids of every line is the number of id starts before its newline
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    id_starts = np.flatnonzero(is_digit & ~np.concatenate([[False], is_digit[:-1]]))
+    line_ends = np.flatnonzero(chars == ord('\n'))
+    lengths = np.diff(np.concatenate([[0], np.searchsorted(id_starts, line_ends)]))
+    ids = np.fromstring(text, dtype=np.int32, sep=' ') if len(id_starts) else np.zeros(0, dtype=np.int32)
+    return pad_sequences(ids, lengths, max_sequence_length)
+
+
+def cut_at_eos(samples, max_sequence_length, eos_id=1):
+    """pad generated id sequences to max_sequence_length, the <EOS> and everything after it become PAD (0)"""
+    samples = np.asarray(samples, dtype=np.int32)
+    width = min(samples.shape[1], max_sequence_length)
+    padded = np.zeros(shape=[len(samples), max_sequence_length], dtype=np.int32)  # == PAD
+    padded[:, :width] = samples[:, :width]
+    padded[np.cumsum(padded == eos_id, axis=1) > 0] = 0
+    return padded
+
+
+def format_candidates(samples, vocab_list, eos_id=1):
+    """address strings of generated samples: the words before the last one preceding <EOS>, a colon after
+    every 4th word but the 32nd; duplicates are dropped, first occurrences keep their order"""
+    samples = np.asarray(samples)
+    is_eos = samples == eos_id
+    lengths = np.where(is_eos.any(axis=1), np.argmax(is_eos, axis=1), samples.shape[1]) - 1
+    lengths = np.maximum(lengths, 0)
+    width = samples.shape[1]
+    words = np.array(vocab_list, dtype=object)[samples]
+    words[np.arange(width) >= lengths[:, None]] = ''
+    columns = []
+    for j in range(width):
+        columns.append(words[:, j])
+        if (j + 1) % 4 == 0 and j + 1 != 32:
+            columns.append(np.where(lengths >= j + 1, ':', ''))
+    table = np.stack(columns, axis=1).tolist()
+    return list(dict.fromkeys(''.join(row) for row in table))
+
+
+class SampleBuffer(object):
+    """generated samples of every generator, kept in memory as padded int32 matrices for the discriminator"""
+    def __init__(self, generator_num, max_sequence_length, eos_id=1):
+        self.max_sequence_length = max_sequence_length
+        self.eos_id = eos_id
+        self.samples = [np.zeros(shape=[0, max_sequence_length], dtype=np.int32) for _ in range(generator_num)]
+        self.reset_stats()
+
+    def generate(self, sess, trainable_model, num_batches):
+        """run num_batches generation batches, returns the raw id matrix"""
+        start = time.time()
+        batches = [np.asarray(trainable_model.generate(sess)) for _ in range(int(num_batches))]
+        samples = np.concatenate(batches, 0) if batches else np.zeros(shape=[0, self.max_sequence_length], dtype=np.int32)
+        self.generated_num += len(samples)
+        self.generate_time += time.time() - start
+        return samples
+
+    def fill(self, sess, trainable_model, generator_id, num_batches):
+        """replace the samples of a generator by num_batches new batches"""
+        self.samples[generator_id] = cut_at_eos(self.generate(sess, trainable_model, num_batches),
+                                                self.max_sequence_length, self.eos_id)
+        return self.samples[generator_id]
+
+    def reset_stats(self):
+        self.generated_num = 0
+        self.generate_time = 0.0
+
+    def throughput(self):
+        """generated samples per second since the last reset_stats"""
+        return self.generated_num / self.generate_time if self.generate_time > 0 else 0.0
 
 
 class PrefixLoader(object):
@@ -176,3 +244,43 @@ class PrefixLoader(object):
             prefix = ''.join(prefix.split(':'))[:int(int(prefix_len[:-1]) / 4)]
             self.prefix_data.append(prefix)
         return self.prefix_data
+
+    def load_index(self, vocab_dict):
+        """index of the aliased prefixes for id sequences, built once and reused for every batch"""
+        return AliasedPrefixIndex(self.load_prefixes(), vocab_dict)
+
+
+class AliasedPrefixIndex(object):
+    """sorted, deduplicated prefix addresses for every prefix length (in nibbles), looked up for a whole
+    batch of id sequences with one binary search per prefix length"""
+    def __init__(self, aliased_prefixes, vocab_dict):
+        self.nibble_lut = np.full(max(vocab_dict.values()) + 1, 255, dtype=np.uint8)
+        for i in range(16):
+            self.nibble_lut[vocab_dict[format(i, 'x')]] = i
+        self.prefixes = {}
+        if len(aliased_prefixes) == 0:
+            return
+        nibble_lengths = np.array([len(prefix) for prefix in aliased_prefixes])
+        arr, valid = parse_hex_bulk([prefix.ljust(32, '0') for prefix in aliased_prefixes])
+        for length in np.unique(nibble_lengths[valid & (nibble_lengths > 0)]):
+            rows = valid & (nibble_lengths == length)
+            self.prefixes[int(length)] = unique_sorted(prefix_ranges(arr[rows], np.full(rows.sum(), length * 4))[0])
+
+    def longest_match(self, samples):
+        """length (in nibbles) of the longest aliased prefix of every id sequence, 0 if there is none"""
+        nibbles = np.full((len(samples), 32), 255, dtype=np.uint8)
+        for i, sample in enumerate(samples):
+            sample = np.asarray(sample[:32], dtype=np.int64)
+            nibbles[i, :len(sample)] = self.nibble_lut[np.clip(sample, 0, len(self.nibble_lut) - 1)]
+        # only the leading nibbles of a sequence can match a prefix
+        is_nibble = nibbles < 16
+        valid_lengths = np.where(is_nibble.all(axis=1), 32, np.argmin(is_nibble, axis=1))
+        arr = from_nibbles(np.where(is_nibble, nibbles, 0))
+        matches = np.zeros(len(samples), dtype=np.int64)
+        for length in sorted(self.prefixes.keys(), reverse=True):
+            candidates = np.flatnonzero((matches == 0) & (valid_lengths >= length))
+            if len(candidates) == 0:
+                continue
+            starts = prefix_ranges(arr[candidates], np.full(len(candidates), length * 4))[0]
+            matches[candidates[isin_sorted(starts, self.prefixes[length])]] = length
+        return matches
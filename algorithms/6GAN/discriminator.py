@@ -1,3 +1,5 @@
+import time
+from collections import OrderedDict
 import tensorflow as tf
 import numpy as np
 
@@ -60,7 +62,14 @@ class Discriminator(object):
 
     def __init__(
             self, sequence_length, num_classes, vocab_size,
-            embedding_size, filter_sizes, num_filters, l2_reg_lambda=0.0):
+            embedding_size, filter_sizes, num_filters, l2_reg_lambda=0.0,
+            score_batch_size=4096, score_cache_size=1 << 20):
+        # LRU cache of the rewards of complete sequences, only valid until the next training step
+        self.score_batch_size = score_batch_size
+        self.score_cache_size = score_cache_size
+        self.score_cache = OrderedDict()
+        self.reset_score_stats()
+
         # Placeholders for input, output and dropout
         self.input_x = tf.placeholder(tf.int32, [None, sequence_length], name="input_x")
         self.input_y = tf.placeholder(tf.int32, [None, num_classes], name="input_y")
@@ -155,6 +164,49 @@ class Discriminator(object):
 
         self.saver = tf.train.Saver(tf.global_variables(), max_to_keep=1)
 
+    def reward_scores(self, sess, samples):
+        """reward (probability of the first class) of every padded sequence; sequences seen before are taken
+        from the cache, the others are scored without duplicates in batches of score_batch_size"""
+        start = time.time()
+        samples = np.ascontiguousarray(samples, dtype=np.int32)
+        keys = [row.tobytes() for row in samples]
+        scores = np.zeros(len(samples), dtype=np.float32)
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            score = self.score_cache.get(key)
+            if score is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                self.score_cache.move_to_end(key)
+                scores[i] = score
+        self.cache_hits += len(samples) - sum(len(rows) for rows in missing.values())
+
+        rows = np.array([rows[0] for rows in missing.values()], dtype=np.int64)
+        for begin in range(0, len(rows), self.score_batch_size):
+            batch = rows[begin:begin + self.score_batch_size]
+            feed = {self.input_x: samples[batch], self.dropout_keep_prob: 1.0}
+            ypred = sess.run(self.ypred_for_auc, feed)[:, 0]
+            self.score_calls += 1
+            self.scored_sequences += len(batch)
+            for row, score in zip(batch, ypred):
+                for i in missing[keys[row]]:
+                    scores[i] = score
+                self.score_cache[keys[row]] = score
+        while len(self.score_cache) > self.score_cache_size:
+            self.score_cache.popitem(last=False)
+        self.score_time += time.time() - start
+        return scores
+
+    def clear_score_cache(self):
+        """the cached rewards are stale once the discriminator is trained"""
+        self.score_cache.clear()
+
+    def reset_score_stats(self):
+        self.score_calls = 0
+        self.scored_sequences = 0
+        self.cache_hits = 0
+        self.score_time = 0.0
+
     def save_model(self, sess, model_path):
         save_path = model_path + 'discriminator' + '.ckpt'
         self.saver.save(sess, save_path)
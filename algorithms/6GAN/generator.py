@@ -289,43 +289,31 @@ class Generator(object):
         # x = self.pad_input_data(input_x, go_id)
         x, lengths_x = self.pad_input_data(input_x)
         input_x = self.padding(input_x, self.max_sequence_length)
-        rewards = []
+        batch_size = len(input_x)
 
+        # Monte Carlo completions of every prefix length in every rollout, all of
+        # them are scored by the discriminator at once
+        rollouts = []
         for i in range(rollout_num):
             for given_num in range(1, self.max_sequence_length):
-
-                rollout_next_id = []
-                for _item in x:
-                    rollout_next_id.append(_item[given_num])
-
                 feed = {
                     self.rollout_input_ids: x,
                     self.rollout_input_length: given_num,
                     self.rollout_input_lengths: [given_num] * self.batch_size,
-                    self.rollout_next_id: rollout_next_id
+                    self.rollout_next_id: x[:, given_num]
                 }
 
                 mc_samples = sess.run(self.sample_id_MC, feed)
-                fix_samples = np.array(input_x)[:, 0: given_num]
-                samples = np.concatenate((fix_samples, mc_samples), axis=1)
-                samples = self.padding(samples, self.max_sequence_length)
-
-                feed = {discriminator.input_x: samples, discriminator.dropout_keep_prob: 1.0}
-                ypred_for_auc = sess.run(discriminator.ypred_for_auc, feed)
-                ypred = np.array([item[0] for item in ypred_for_auc])
-                if i == 0:
-                    rewards.append(ypred)
-                else:
-                    rewards[given_num - 1] += ypred
-
-            # the last token reward
-            feed = {discriminator.input_x: input_x, discriminator.dropout_keep_prob: 1.0}
-            ypred_for_auc = sess.run(discriminator.ypred_for_auc, feed)
-            ypred = np.array([item[0] for item in ypred_for_auc])
-            if i == 0:
-                rewards.append(ypred)
-            else:
-                rewards[self.max_sequence_length - 1] += ypred
+                samples = np.zeros(shape=[batch_size, self.max_sequence_length], dtype=np.int32)  # == PAD
+                samples[:, :given_num] = input_x[:, :given_num]
+                samples[:, given_num:given_num + mc_samples.shape[1]] = mc_samples
+                rollouts.append(samples)
+
+        # the last token reward is the score of the sample itself, the same for every rollout
+        rollouts.append(input_x)
+        scores = discriminator.reward_scores(sess, np.concatenate(rollouts, 0)).reshape(len(rollouts), batch_size)
+        rewards = scores[:-1].reshape(rollout_num, self.max_sequence_length - 1, batch_size).sum(axis=0)
+        rewards = np.concatenate([rewards, scores[-1:] * rollout_num], 0)
 
         rewards = np.transpose(np.array(rewards)) / (1.0 * rollout_num)  # batch_size x seq_length
         rewards = self.get_new_rewards(lengths_x, rewards)
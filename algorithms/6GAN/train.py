@@ -2,7 +2,9 @@ import numpy as np
 import tensorflow as tf
 import os
 import random
-from dataloader import GenDataLoader, DisDataLoader, DataProcessing, PrefixLoader
+import time
+from dataloader import GenDataLoader, DisDataLoader, DataProcessing, PrefixLoader, SampleBuffer, \
+    read_id_file, format_candidates
 from classifier import RFCBased, EntropyClustering, IPv62Vec
 import pickle
 from generator import Generator
@@ -86,26 +88,11 @@ def generate_samples(sess, trainable_model, generated_num, output_file, vocab_li
             fout.write(buffer)
 
 
-def generate_infer(sess, trainable_model, epoch, vocab_list, generator_id):
-    generated_samples = []
-    for _ in range(int(TOTAL_GENERATION / BATCH_SIZE)):
-        generated_samples.extend(trainable_model.generate(sess))
+def generate_infer(sess, trainable_model, epoch, vocab_list, generator_id, sample_buffer):
+    generated_samples = sample_buffer.generate(sess, trainable_model, int(TOTAL_GENERATION / BATCH_SIZE))
     file = candidate_path + 'candidate_generator_' + str(generator_id) + '_epoch_' + str(epoch) + '.txt'
-    target_generation = []
-    for address in generated_samples:
-        address = list(address)
-        if 1 in address:
-            address = address[:address.index(1)]
-        count = 0
-        predict_address_str = ""
-        for i in address[:-1]:
-            predict_address_str += vocab_list[i]
-            count += 1
-            if count % 4 == 0 and count != 32:
-                predict_address_str += ":"
-        target_generation.append(predict_address_str + '\n')
     fout = open(file, 'w')
-    fout.writelines(list(set(target_generation)))
+    fout.writelines(address + '\n' for address in format_candidates(generated_samples, vocab_list))
     fout.close()
     print("%s saves" % file)
     return
@@ -177,22 +164,21 @@ def data_zoom(data, interval, alpha=1e-8):
     return data
 
 
-def aliased_reward(aliased_prefixes, samples, rewards):
-    aliased_rewards = data_zoom([i / MAX_SEQ_LENGTH for i in range(1, MAX_SEQ_LENGTH + 1)], [1e-20, 1])
-    for i, sample in enumerate(samples):
-        for aliased_prefix in aliased_prefixes:
-            if aliased_prefix == sample[:len(aliased_prefix)]:
-                rewards[i] = aliased_rewards[:len(aliased_prefix)].extend(rewards[i][len(aliased_prefix):])
-                break
+def aliased_reward(prefix_index, samples, rewards):
+    # the rewards of the words inside the longest aliased prefix of a sample are replaced by tiny rewards
+    aliased_rewards = np.array(data_zoom([i / MAX_SEQ_LENGTH for i in range(1, MAX_SEQ_LENGTH + 1)], [1e-20, 1]))
+    rewards = np.array(rewards)
+    prefix_lengths = prefix_index.longest_match(samples)
+    aliased = np.arange(rewards.shape[1]) < prefix_lengths[:, None]
+    rewards[aliased] = np.broadcast_to(aliased_rewards[:rewards.shape[1]], rewards.shape)[aliased]
     return rewards
 
 
-def create_negative_file_path(generator_num):
-    negative_file_list = []
-    for i in range(generator_num):
-        negative_file = save_path + 'generator_' + str(i + 1) + '_sample.txt'
-        negative_file_list.append(negative_file)
-    return negative_file_list
+def negative_batch_num(classifier, i):
+    # number of generation batches per generator for the discriminator
+    if CLASSIFICATION_METHOD == -1:
+        return int(TOTAL_GENERATION / BATCH_SIZE)
+    return int(classifier.emb_data_num[i] / BATCH_SIZE)
 
 
 def seed_classification(method_id=0, classifier=RFCBased(BATCH_SIZE)):
@@ -223,17 +209,22 @@ def main():
 
     # seed classification
     positive_file_list = [emb_id_file]
+    classifier = None
     if CLASSIFICATION_METHOD != -1:
         classifier = seed_classification(CLASSIFICATION_METHOD)
-        classifier.create_category()
+        if CLASSIFICATION_METHOD == 1:
+            # entropy clustering writes the id files in the same pass
+            classifier.create_category(vocab_dict)
+        else:
+            classifier.create_category()
         positive_file_list = classifier.gen_id_file(vocab_dict)
     generator_num = len(positive_file_list)
 
     # prepare data
-    aliased_prefixes = []
+    aliased_prefixes = None
     if ALIAS_DETECTION:
         prefix_loader = PrefixLoader(aliased_prefix_file)
-        aliased_prefixes = prefix_loader.load_prefixes()
+        aliased_prefixes = prefix_loader.load_index(vocab_dict)
 
     gen_id_data(emb_id_file, emb_data_file, vocab_dict)
     pre_train_data_loaders = np.array([GenDataLoader(BATCH_SIZE, vocab_dict) for i in range(generator_num)])
@@ -284,19 +275,13 @@ def main():
     buffer = 'Start pre-training discriminator...'
     print(buffer)
     log.write(buffer)
-    negative_file_list = create_negative_file_path(generator_num)
-    for filename in os.listdir(save_path):
-        if 'generator' in filename:
-            os.remove(save_path + filename)
+    # the generated (negative) samples stay in memory, the positive samples are read once
+    sample_buffer = SampleBuffer(generator_num, MAX_SEQ_LENGTH, vocab_dict['<EOS>'])
+    positive_examples = [read_id_file(positive_file, MAX_SEQ_LENGTH) for positive_file in positive_file_list]
     for _ in range(10):   # 10
         for i in range(generator_num):
-            if CLASSIFICATION_METHOD == -1:
-                generate_samples(sess, generators[i], int(TOTAL_GENERATION / BATCH_SIZE), negative_file_list[i],
-                                 vocab_list)
-            else:
-                generate_samples(sess, generators[i], int(classifier.emb_data_num[i] / BATCH_SIZE), negative_file_list[i],
-                                 vocab_list)
-        dis_data_loader.load_train_data(positive_file_list, negative_file_list)
+            sample_buffer.fill(sess, generators[i], i, negative_batch_num(classifier, i))
+        dis_data_loader.load_train_arrays(positive_examples, sample_buffer.samples)
         for _ in range(3):
             dis_data_loader.reset_pointer()
             for it in range(dis_data_loader.num_batch):
@@ -315,6 +300,9 @@ def main():
     log.write('adversarial training...')
     rewards_loss_list = []
     for total_batch in range(1, TOTAL_BATCH + 1):
+        sample_buffer.reset_stats()
+        # the discriminator was trained since the rewards were cached
+        discriminator.clear_score_cache()
         # Train the generator
         for it in range(2):
             rewards_loss_list = []
@@ -338,7 +326,7 @@ def main():
                 little1_samples = gen_data_loaders[i].next_batch()
                 rewards = generators[i].get_reward(sess, little1_samples, 16, discriminator)
                 if ALIAS_DETECTION:
-                    rewards = aliased_reward(aliased_prefixes, samples, rewards)
+                    rewards = aliased_reward(aliased_prefixes, little1_samples, rewards)
                 a = str(little1_samples[0])
                 b = str(rewards[0])
                 buffer = "%s\n%s\n\n" % (a, b)
@@ -347,11 +335,18 @@ def main():
                 rewards_loss = generators[i].update_with_rewards(sess, little1_samples, rewards)
                 rewards_loss_list.append(rewards_loss)
 
+                buffer = '    rewards: %d discriminator calls, %d sequences scored, %d cache hits, %.2f s' % (
+                    discriminator.score_calls, discriminator.scored_sequences, discriminator.cache_hits,
+                    discriminator.score_time)
+                print(buffer)
+                log.write(buffer + '\n')
+                discriminator.reset_score_stats()
+
         # Test
         if total_batch % 5 == 0:
             for i in range(generator_num):
                 print('Generator %s/%s' % (i + 1, generator_num))
-                generate_infer(sess, generators[i], total_batch, vocab_list, i + 1)
+                generate_infer(sess, generators[i], total_batch, vocab_list, i + 1, sample_buffer)
                 buffer = 'reward-train epoch %s train loss %s' % (str(total_batch), str(rewards_loss_list[i]))
                 print(buffer)
                 log.write(buffer + '\n')
@@ -361,13 +356,10 @@ def main():
         begin = True
         for _ in range(1):
             for i in range(generator_num):
-                if CLASSIFICATION_METHOD == -1:
-                    generate_samples(sess, generators[i], int(TOTAL_GENERATION / BATCH_SIZE), negative_file_list[i],
-                                     vocab_list)
-                else:
-                    generate_samples(sess, generators[i], int(classifier.emb_data_num[i] / BATCH_SIZE),
-                                     negative_file_list[i], vocab_list)
-            dis_data_loader.load_train_data(positive_file_list, negative_file_list)
+                sample_buffer.fill(sess, generators[i], i, negative_batch_num(classifier, i))
+            dis_data_loader.load_train_arrays(positive_examples, sample_buffer.samples)
+            dis_steps = 0
+            dis_start = time.time()
             for _ in range(3):
                 dis_data_loader.reset_pointer()
                 for it in range(dis_data_loader.num_batch):
@@ -379,13 +371,20 @@ def main():
                     }
                     d_loss, d_acc, _ = sess.run([discriminator.loss, discriminator.accuracy, discriminator.train_op],
                                                 feed)
+                    dis_steps += 1
                     if total_batch % 5 == 0 and begin:
                         buffer = "discriminator loss %f acc %f\n" % (d_loss, d_acc)
                         print(buffer)
                         log.write(buffer)
                         begin = False
+            dis_time = time.time() - dis_start
             discriminator.save_model(sess, model_path)
 
+        buffer = 'epoch %s throughput: %.1f samples/sec, %.1f discriminator steps/sec' % (
+            total_batch, sample_buffer.throughput(), dis_steps / max(dis_time, 1e-9))
+        print(buffer)
+        log.write(buffer + '\n')
+
         # pretrain
         for _ in range(10):
             for i in range(generator_num):
@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 
-import argparse, os
+import argparse, os, sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import iter_parse_file, format_hex, format_exploded, NibbleWriter
+
+dataset_path = 'data/processed_data/data.txt'
+addresses_path = 'data/processed_data/flatten_addresses.txt'
+nibbles_path = 'data/processed_data/data.npy'
 
 # 读取数据
 def read_data(filename):
@@ -49,9 +56,6 @@ def data_save(addresses, address_class):
     # dataset_path = 'data/processed_data/' + address_class + '_measurement.txt'
     # addresses_path = 'data/processed_data/' + address_class + '_measurement_flatten_addresses.txt'
 
-    dataset_path = 'data/processed_data/data.txt'
-    addresses_path = 'data/processed_data/flatten_addresses.txt'
-
     dataset = []
     flatten_addresses = []
     for address in addresses:
@@ -74,6 +78,21 @@ def data_save(addresses, address_class):
     print('flattened addresses saved path: ', addresses_path)
 
 
+# 分块流式处理: 每块地址解析后直接写入训练数据集, flatten地址和nibble矩阵(uint8, N x 32)
+def stream_process(filename):
+    nibbles = NibbleWriter(nibbles_path)
+    with open(dataset_path, 'w', encoding='utf-8') as fd, open(addresses_path, 'w', encoding='utf-8') as fa:
+        for arr in iter_parse_file(filename):
+            fd.writelines(address + '\n' for address in format_hex(arr))
+            fa.writelines(address + '\n' for address in format_exploded(arr))
+            nibbles.write(arr)
+    nibbles.close()
+
+    print('processed data saved path: ', dataset_path)
+    print('flattened addresses saved path: ', addresses_path)
+    print('nibble matrix saved path: ', nibbles_path, '({} addresses)'.format(nibbles.count))
+
+
 # 地址手工分类
 def address_classification(addresses):
     fixed_iid_addresses = []
@@ -130,46 +149,40 @@ def cluster_process(cluster_path):
 
     data_path = "data/processed_data/gasser_data_1107.txt"
 
-    cluster_data = []
-    for cluster in total_prefix:
-        cluster_i = []
+    # 前缀 -> 所属聚类, 数据文件只读取一遍, 每个地址直接写入其前缀所属聚类的文件
+    prefix_clusters = {}
+    for count, cluster in enumerate(total_prefix):
         for prefix in cluster:
-            f = open(data_path, "r")
-            for line in f:
-                if prefix == line[:8]:
-                    cluster_i.append(line)
-            f.close()
-        cluster_data.append(cluster_i)
-
-    # print(cluster_data[0])
-
-    count = 0
-    for cluster in cluster_data:
-        f = open("data/processed_data/gasser_cluster_" + str(count) + "_1107.txt", "w")
-        f.writelines(cluster)
+            prefix_clusters.setdefault(prefix, []).append(count)
+
+    cluster_files = [open("data/processed_data/gasser_cluster_" + str(count) + "_1107.txt", "w")
+                     for count in range(len(total_prefix))]
+    f = open(data_path, "r")
+    for line in f:
+        for count in prefix_clusters.get(line[:8], []):
+            cluster_files[count].write(line)
+    f.close()
+    for f in cluster_files:
         f.close()
-        count += 1
 
 
 if __name__ == '__main__':
     gasser_ipv6hitlist = 'data/public_datasets/responsive-addresses.txt'
 
-    #
-    addresses = read_data(gasser_ipv6hitlist)
-    fixed_iid_addresses, low_64bit_subnet_addresses, slaac_eui64_addresses, slaac_privacy_addresses = \
-        address_classification(addresses)
+    # addresses = read_data(gasser_ipv6hitlist)
+    # fixed_iid_addresses, low_64bit_subnet_addresses, slaac_eui64_addresses, slaac_privacy_addresses = \
+    #     address_classification(addresses)
     #
     # flatten_fixed_iid_addresses = flatten(fixed_iid_addresses)
     # flatten_low_64bit_subnet_addresses = flatten(low_64bit_subnet_addresses)
     # flatten_slaac_eui64_addresses = flatten(slaac_eui64_addresses)
     # flatten_slaac_privacy_addresses = flatten(slaac_privacy_addresses)
-    flatten_total_data = flatten(addresses)
     #
     # data_save(flatten_fixed_iid_addresses, address_class="fixed_iid_addresses")
     # data_save(flatten_low_64bit_subnet_addresses, address_class="low_64bit_subnet_addresses")
     # data_save(flatten_slaac_eui64_addresses, address_class="slaac_eui64_addresses")
     # data_save(flatten_slaac_privacy_addresses, address_class="slaac_privacy_addresses")
-    data_save(flatten_total_data, address_class="")
+    stream_process(gasser_ipv6hitlist)
 
     # cluster process
     # cluster_path = "/Users/cuitianyu/Tools/entropy-clustering/clusters_1107.txt"
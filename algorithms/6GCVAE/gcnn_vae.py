@@ -1,3 +1,5 @@
+import os
+import sys
 import numpy as np
 from keras.models import Model
 from keras.layers import *
@@ -6,59 +8,43 @@ from keras.engine.topology import Layer
 from keras.callbacks import Callback
 from sklearn.model_selection import train_test_split
 
-dataset_path = 'data/processed_data/data.txt'
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import load_nibbles, index_batches
+
+# nibble matrix written by data_process.py
+dataset_path = 'data/processed_data/data.npy'
 generated_path = 'data/generated_data/6gcvae_generation.txt'
-# dataset_path = 'data/processed_data/slaac_privacy_addresses_gasser_data.txt'
+# dataset_path = 'data/processed_data/slaac_privacy_addresses_gasser_data.npy'
 # generated_path = 'data/generated_data/6vae_generation_slaac_privacy_addresses.txt'
 
 n = 32
 latent_dim = 64
 hidden_dim = 64
 
+epochs = 3
+batch_size = 64
+
 
 def load_data(filename):
+    # 训练数据以只读内存映射方式读取, 只划分行号
+    data = load_nibbles(filename)
+    train_index, test_index = train_test_split(np.arange(len(data)),
+                                               test_size=0.2,
+                                               random_state=0)
+    return data, np.sort(train_index), np.sort(test_index)
+
 
-    f = open(filename, 'r', encoding='utf-8')
-    raw_data = f.readlines()
-    f.close()
-
-    # 去除末尾换行符
-    for i in range(len(raw_data)):
-        raw_data[i] = raw_data[i][:-1]
-
-    # 提取地址字符
-    word_data = []
-    for address in raw_data:
-        address_data = []
-        for i in range(len(address)):
-            address_data.append(address[i])
-        word_data.append(address_data)
-
-    # 将地址字符转换为id
-    v6dict = {
-        '0': 0, '1': 1, '2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7,
-        '8': 8, '9': 9, 'a': 10, 'b': 11, 'c': 12, 'd': 13, 'e': 14, 'f': 15
-    }
-    data = []
-    for address in word_data:
-        address_data = []
-        for bit in address:
-            address_data.append(v6dict[bit])
-        data.append(address_data)
-
-    target = np.ones(len(raw_data))
-    x_train, x_test, y_train, y_test = train_test_split(data,
-                                                        target,
-                                                        test_size=0.2,
-                                                        random_state=0)
-    return x_train, x_test, y_train, y_test
+def batch_generator(data, index, batch_size):
+    # 每轮打乱顺序, 按批从内存映射中读取地址
+    rng = np.random.RandomState(0)
+    while True:
+        for batch in index_batches(len(index), batch_size, rng):
+            yield data[index[batch]].astype('int32'), None
 
 
 def run_model():
 
-    x_train, x_test, y_train, y_test = load_data(dataset_path)
-    x_train = np.array(x_train)
-    x_test = np.array(x_test)
+    data, train_index, test_index = load_data(dataset_path)
     # x_train = x_train.astype('float32') / 15.
     # x_test = x_test.astype('float32') / 15.
 
@@ -158,12 +144,11 @@ def run_model():
 
     evaluator = Evaluate()
 
-    vae.fit(x_train,
-            shuffle=True,
-            epochs=3,
-            batch_size=64,
-            callbacks=[evaluator]
-            )
+    vae.fit_generator(batch_generator(data, train_index, batch_size),
+                      steps_per_epoch=int(np.ceil(len(train_index) / batch_size)),
+                      epochs=epochs,
+                      callbacks=[evaluator]
+                      )
 
     vae.save_weights('models/gcnn_vae.model')
 
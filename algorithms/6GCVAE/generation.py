@@ -1,3 +1,6 @@
+import os
+import sys
+import numpy as np
 import keras
 from keras.models import load_model
 from keras.models import Model
@@ -5,11 +8,22 @@ from keras.layers import *
 from keras import backend as K
 from keras.engine.topology import Layer
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import AddrSet, from_nibbles, load_nibbles, format_exploded
+
 model_dir = "models/"
 generation_dir = 'data/generated_data/'
+seeds_path = 'data/processed_data/data.npy'
 
+# number of unique new candidates (neither seeds nor generated before)
 generation_number = 10000000
 
+# latent vectors drawn per block and decoded per predict batch
+block_size = 65536
+predict_batch_size = 4096
+# stop when this many blocks in a row bring no new candidate
+max_stale_blocks = 100
+
 n = 32
 latent_dim = 64
 hidden_dim = 64
@@ -78,15 +92,20 @@ def rebuild_model(model_path):
     return generator
 
 
-def generation_store(target_generation, generation_path):
-    f = open(generation_path, 'w', encoding='utf-8')
-    f.writelines(target_generation)
-    f.close()
+def load_seeds(path):
+    # seed set of the training addresses, read chunk by chunk from the nibble matrix
+    seen = AddrSet()
+    if not os.path.exists(path):
+        return seen
+    seeds = load_nibbles(path)
+    for i in range(0, len(seeds), block_size):
+        seen.add(from_nibbles(seeds[i:i + block_size]))
+    return seen
 
 
-def gen():
-    r = generator.predict(np.random.randn(1, latent_dim))[0]
-    r = r.argmax(axis=1)
+def gen(number):
+    r = generator.predict(np.random.randn(number, latent_dim), batch_size=predict_batch_size)
+    r = r.argmax(axis=2)
     return r
 
 
@@ -113,18 +132,16 @@ if __name__ == "__main__":
         generation_path = generation_dir + generation_filename
         generator = rebuild_model(model_path)
 
-        target_generation = []
-        for i in range(generation_number):
-            r = gen()
-            gen_address = ""
-            count = 0
-            gen_address_list = [str(hex(i))[-1] for i in r]
-            for i in gen_address_list:
-                count += 1
-                gen_address += i
-                if count % 4 == 0:
-                    gen_address += ":"
-            gen_address = gen_address[:-1]
-            target_generation.append(gen_address + '\n')
-            # print(gen_address)
-        generation_store(target_generation, generation_path)
+        # candidates are deduplicated against the seeds and each other on the
+        # fly and written block by block
+        seen = load_seeds(seeds_path)
+        count = 0
+        stale = 0
+        with open(generation_path, 'w', encoding='utf-8') as f:
+            while count < generation_number and stale < max_stale_blocks:
+                addrs = from_nibbles(gen(block_size).astype(np.uint8))
+                new = addrs[seen.add(addrs)][:generation_number - count]
+                stale = 0 if len(new) else stale + 1
+                f.writelines(a + '\n' for a in format_exploded(new))
+                count += len(new)
+        print('{}: {} new candidates'.format(generation_path, count))
@@ -0,0 +1,92 @@
+import argparse
+import time
+import numpy as np
+
+from SpacePartition import DHC
+from PatternMining import OutlierDetect, density, seed_distance, threshold
+from CheckPartition import SyntheticSeeds
+
+"""
+Regression check of the union-find OutlierDetect against the former
+networkx-based one on the DHC regions of the seeds and on single large regions:
+both must find the same patterns and outliers (requires networkx)
+python3 CheckPatterns.py [--seeds seeds.npy] [--num 100000] [--region 500]
+"""
+
+
+def LegacyOutlierDetect(arrs):
+    # former implementation (pairwise distances in python, reachability by
+    # graph traversal for every edge), only used for comparison; the rows of
+    # a pattern are sorted by their index
+    import networkx as nx
+
+    if len(arrs) <= 1:
+        return [], [arrs]
+
+    dis = []
+    for i in range(len(arrs)):
+        for j in range(i + 1, len(arrs)):
+            w = seed_distance(arrs[i], arrs[j])
+            if w > threshold:
+                continue
+            dis.append((i, j, w))
+
+    dis = sorted(dis, key=lambda x: x[2])
+
+    G = nx.Graph()
+    G.add_nodes_from(range(len(arrs)))
+    for i, j, w in dis:
+        idescendants = nx.algorithms.descendants(G, i)
+        jdescendants = nx.algorithms.descendants(G, j)
+        idescendants.add(i)
+        jdescendants.add(j)
+        if (i in jdescendants):
+            continue
+        if density(arrs[list(idescendants | jdescendants)]) > density(
+                arrs[list(idescendants)]) and density(
+                    arrs[list(idescendants | jdescendants)]) > density(
+                        arrs[list(jdescendants)]):
+            G.add_edge(i, j, len=w)
+    patterns = []
+    outliers = []
+    for l in list(nx.connected_components(G)):
+        l = sorted(l)
+        if len(l) > 1:
+            patterns.append(arrs[l])
+        else:
+            outliers.append(arrs[l[0]])
+    return patterns, outliers
+
+
+def Compare(regions, detect):
+    # runs detect on every region, returns all patterns, outliers and the time
+    patterns, outliers = [], []
+    t_start = time.time()
+    for r in regions:
+        p, o = detect(r)
+        patterns += p
+        outliers += o
+    return patterns, outliers, time.time() - t_start
+
+
+def Check(name, regions):
+    patterns, outliers, t_new = Compare(regions, OutlierDetect)
+    legacy_patterns, legacy_outliers, t_legacy = Compare(regions, LegacyOutlierDetect)
+    assert len(patterns) == len(legacy_patterns) and len(outliers) == len(legacy_outliers)
+    for p, l in zip(patterns + outliers, legacy_patterns + legacy_outliers):
+        assert np.array_equal(p, l), "{}: patterns differ".format(name)
+    print("{}: {} regions, {} identical patterns, {} outliers".format(name, len(regions), len(patterns), len(outliers)))
+    print("legacy OutlierDetect: {:.3f} s, union-find OutlierDetect: {:.3f} s".format(t_legacy, t_new))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seeds", type=str, default=None, help="seeds.npy written by convert.py")
+    parser.add_argument("--num", type=int, default=100000, help="number of synthetic seeds")
+    parser.add_argument("--region", type=int, default=500, help="number of seeds of the single large regions")
+    args = parser.parse_args()
+
+    data = np.load(args.seeds) if args.seeds else SyntheticSeeds(args.num)
+    Check("DHC regions", DHC(data))
+    rng = np.random.RandomState(1)
+    Check("large regions", [data[rng.choice(len(data), min(args.region, len(data)), replace=False)] for _ in range(3)])
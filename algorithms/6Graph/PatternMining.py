@@ -1,60 +1,99 @@
 
+import os
+import sys
 import numpy as np
 
-import networkx as nx
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import from_nibbles
 
-# the max free dimensions you can tolerate 
+# the max free dimensions you can tolerate
 threshold = 12
 
+# seeds are compared tile by tile, BLOCK_ROWS x BLOCK_ROWS pairs at once
+BLOCK_ROWS = 1024
 
-def seed_distance(a, b):
-    return len(np.argwhere(a != b))
-
+NIBBLE_LOW = np.uint64(0x1111111111111111)
+BYTE_LOW = np.uint64(0x0f0f0f0f0f0f0f0f)
+BYTE_SUM = np.uint64(0x0101010101010101)
 
 
+def seed_distance(a, b):
+    return len(np.argwhere(a != b))
 
 
+def nibble_count(x):
+    # number of non-zero nibbles of every uint64 (popcount of the nibbles)
+    x = (x | (x >> np.uint64(1)) | (x >> np.uint64(2)) | (x >> np.uint64(3))) & NIBBLE_LOW
+    x = (x + (x >> np.uint64(4))) & BYTE_LOW
+    return ((x * BYTE_SUM) >> np.uint64(56)).astype(np.int64)
+
+
+def candidate_edges(arrs):
+    # all pairs i < j with a distance of at most threshold, in the order of
+    # the former sorted edge list: by distance, then by i and j
+    # the distance of two seeds is the number of non-zero nibbles of the XOR
+    # of their packed 128 bit values
+    addrs = from_nibbles(arrs)
+    I, J, W = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for s in range(0, len(addrs), BLOCK_ROWS):
+        a = addrs[s:s + BLOCK_ROWS]
+        for t in range(s, len(addrs), BLOCK_ROWS):
+            b = addrs[t:t + BLOCK_ROWS]
+            w = nibble_count(a["hi"][:, None] ^ b["hi"][None, :]) + nibble_count(a["lo"][:, None] ^ b["lo"][None, :])
+            keep = w <= threshold
+            if s == t:
+                keep &= np.triu(np.ones(keep.shape, dtype=bool), 1)
+            i, j = np.nonzero(keep)
+            I.append(i + s)
+            J.append(j + t)
+            W.append(w[i, j])
+    I, J, W = np.concatenate(I), np.concatenate(J), np.concatenate(W)
+    order = np.lexsort((J, I, W))
+    return I[order], J[order], W[order]
 
 
 def OutlierDetect(arrs):
     if len(arrs) <= 1:
         return [], [arrs]
 
-    # init the egde weight
-    dis = []
-    for i in range(len(arrs)):
-        for j in range(i + 1, len(arrs)):
-            w = seed_distance(arrs[i], arrs[j])
-            if w > threshold:
-                continue
-            dis.append((i, j, w))
-
-    dis = sorted(dis, key=lambda x: x[2])
-
-    # Kruskal alg build the mst
-
-    G = nx.Graph()
-    G.add_nodes_from(range(len(arrs)))
-    for i, j, w in dis:
-        # 返回 i j 所有可达节点
-        idescendants = nx.algorithms.descendants(G, i)
-        jdescendants = nx.algorithms.descendants(G, j)
-        idescendants.add(i)
-        jdescendants.add(j)
-        if (i in jdescendants):
+    # Kruskal alg build the mst with a union-find of the connected components
+    # every component keeps a bitmask of the nibbles seen in each dimension,
+    # its density only depends on its size and the number of free dimensions
+    parent = list(range(len(arrs)))
+    size = [1] * len(arrs)
+    masks = (np.uint16(1) << arrs.astype(np.uint16)).astype(np.uint16)
+    free = [0] * len(arrs)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j, w in zip(*candidate_edges(arrs)):
+        ri, rj = find(i), find(j)
+        if ri == rj:
             # 同一个联通分量 不加
             continue
-        if density(arrs[list(idescendants | jdescendants)]) > density(
-                arrs[list(idescendants)]) and density(
-                    arrs[list(idescendants | jdescendants)]) > density(
-                        arrs[list(jdescendants)]):
-            # 计算两个联通分量的密度
-
-            G.add_edge(i, j, len=w)
+        mask = masks[ri] | masks[rj]
+        xi = np.count_nonzero(mask & (mask - np.uint16(1)))
+        # 计算两个联通分量的密度
+        merged = component_density(size[ri] + size[rj], xi)
+        if merged > component_density(size[ri], free[ri]) and merged > component_density(size[rj], free[rj]):
+            if size[ri] < size[rj]:
+                ri, rj = rj, ri
+            parent[rj] = ri
+            size[ri] += size[rj]
+            masks[ri] = mask
+            free[ri] = xi
+
+    # components in the order of their first seed
+    components = {}
+    for i in range(len(arrs)):
+        components.setdefault(find(i), []).append(i)
     patterns = []
     outliers = []
-    for l in list(nx.connected_components(G)):
-        l = list(l)
+    for l in components.values():
         if len(l) > 1:
             patterns.append(arrs[l])
         else:
@@ -64,6 +103,16 @@ def OutlierDetect(arrs):
     return patterns, outliers
 
 
+def component_density(n, xi):
+    # density of a component of n seeds with xi free dimensions, identical
+    # seeds have no free dimension and an infinite density
+    if n == 1:
+        return 0
+    if xi == 0:
+        return np.inf
+    return n / xi
+
+
 def density(arrs):
     if len(arrs) == 1:
         return 0
@@ -75,7 +124,7 @@ def density(arrs):
         for i in range(32)
     ])
 
-    return len(arrs) / xi
+    return component_density(len(arrs), xi)
 
 
 
@@ -103,4 +152,3 @@ def showPatternAndOutliers(patterns, outliers):
     for o in outliers:
         print("".join([format(x, "x") for x in o]))
     print()
-
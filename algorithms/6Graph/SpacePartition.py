@@ -1,22 +1,21 @@
+import os
+import sys
 import numpy as np
-import queue
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from partition_utils import dhc_regions, dhc_ranges, map_regions, leftmost_dims
 
 
 def DHC(arrs):
-    q = queue.Queue()
-    q.put(arrs)
-    regions_arrs = []
-    while not q.empty():
-        arrs = q.get()
-        if len(arrs) <= 16:
-            regions_arrs.append(arrs)
-            continue
-        # len(arrs)<=16: not isolated seed's arrs
-        splits = leftmost(arrs)
-
-        for s in splits:
-            q.put(arrs[s])
-    return regions_arrs
+    # regions are split level by level (like a FIFO queue of regions), the
+    # split dimensions of all regions of a tree level are chosen in one batch
+    # len(arrs)<=16: not isolated seed's arrs
+    return dhc_regions(arrs, leftmost_dims, min_split=17, lifo=False)
+
+
+def DHCRanges(arrs):
+    # the regions of DHC as (lo, hi) row ranges of the reordered seeds
+    return dhc_ranges(arrs, leftmost_dims, min_split=17, lifo=False)
 
 
 def leftmost(arrs):
@@ -1,15 +1,23 @@
 # convert IPv6 str to numpy seeds.npy
 
 import numpy as np
-from IPy import IP
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import V6BIN_EXT, load_addrs, parse_bulk, to_nibbles
 
-with open("./seeds") as f:
-    arrs = []
-    for ip in f.read().splitlines():
-        arrs.append([int(x, 16)
-                    for x in IP(ip).strFullsize().replace(":", "")])
+fn_seeds = sys.argv[1] if len(sys.argv) > 1 else "./seeds"
 
-    np.save("seeds.npy", np.array(arrs, dtype=np.uint8))
-    print(np.array(arrs, dtype=np.uint8)[:3])
\ No newline at end of file
+# .v6bin seed files are mapped without parsing text, text seed files are
+# parsed in bulk and lines without a valid address are skipped
+if fn_seeds.endswith(V6BIN_EXT):
+    addrs = load_addrs(fn_seeds)
+else:
+    with open(fn_seeds) as f:
+        addrs, valid = parse_bulk(f.read().splitlines())
+        addrs = addrs[valid]
+
+seeds = to_nibbles(addrs)
+np.save("seeds.npy", seeds)
+print(seeds[:3])
@@ -1,3 +1,5 @@
+import os
+import argparse
 
 from SpacePartition import *
 from PatternMining import *
@@ -5,22 +7,23 @@ from PatternMining import *
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args()
+
     data = np.load("./seeds.npy")
     patterns = []
     outliers = []
-    results = DHC(data)
-
-    for r in results:
-        p, o = OutlierDetect(r)
+    # the regions are processed in parallel, the results keep the region order
+    for p, o in map_regions(OutlierDetect, *DHCRanges(data), workers=args.workers):
         patterns += p
         outliers += o
 
     # your can seed the number of iter, usually < 5
     for _ in range(3):
-        results = DHC(np.vstack(outliers))
+        results = map_regions(OutlierDetect, *DHCRanges(np.vstack(outliers)), workers=args.workers)
         outliers = []
-        for r in results:
-            p, o = OutlierDetect(r)
+        for p, o in results:
             patterns += p
             outliers += o
 
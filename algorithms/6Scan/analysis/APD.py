@@ -2,103 +2,15 @@
 import random
 from multiping import multi_ping
 import math
-import pyasn
 import pandas as pd
+import os
+import sys
 
-asndb = pyasn.pyasn('./analysis/data/ipasn_20221106.dat')
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "..", "scripts"))
+from addr_utils import parse_bulk, parse_hex_bulk, format_hex, text_to_hex, hex_to_text
+from asn_utils import NO_ASN, load_asn_index
 
-def bu0(dizhi):
-    dizhi1 = dizhi.split(':')
-    for i in range(0, len(dizhi1)):
-        # 小段地址补0 如 :AB: 补成:00AB:
-        if ((len(dizhi1[i]) < 4) and (len(dizhi1[i]) > 0)):
-            temp = dizhi1[i]
-            # 需补0数 que0
-            que0 = 4 - len(dizhi1[i])
-            temp2 = "".join('0' for i in range(0, que0))
-            dizhi1[i] = temp2 + temp
-
-    # 补 ::中的0
-    # count 为补完:中0后长度
-    count = 0
-    for i in range(0, len(dizhi1)):
-        count = count + len(dizhi1[i])
-    count = 32 - count
-    aa = []
-    aa = ''.join('0' for i in range(0, count))
-    for i in range(1, len(dizhi1) - 1):
-        if len(dizhi1[i]) == 0:
-            dizhi1[i] = aa
-    for i in range(len(dizhi1)):
-        bb = ''.join(sttt for sttt in dizhi1)
-    return bb
-
-
-def legal(dizhi):
-    dizhi1 = dizhi.split('::')
-    label = 1
-
-    # 使用::不能大于2次
-    if len(dizhi1) >= 3:
-        label = 0
-        print(":: times >2")
-    else:
-        # 字符范围应为 0~9 A~F
-        for i, char in enumerate(dizhi):
-            if char not in ':0123456789abcdef':
-                print("char value not legal:", char)
-                label = 0
-    # :不能出现在末位 同时允许::在最后
-    # :不能出现在首位 同时允许::在最前
-    if (dizhi[len(dizhi) - 1] == ':') and (dizhi[len(dizhi) - 2] != ':'):
-        label = 0
-    if (dizhi[0] == ':') and (dizhi[1] != ':'):
-        label = 0
-        print(": position not legal")
-
-    # 不能出现 :::
-    temp3 = dizhi.split(":::")
-    if len(temp3) > 1:
-        print("::: not legal")
-        label = 0
-
-    # 每小节位数应不大于4
-    dizhi2 = dizhi.split(':')
-    for i in range(0, len(dizhi2)):
-        if len(dizhi2[i]) >= 5:
-            print("每小节位数应不大于4")
-            label = 0
-
-    if label == 0:
-        print("Error IP:", dizhi)
-    return label
-
-def iptrans(line):
-    line = line.strip()
-    if legal(line):
-        out = bu0(line)
-        return out
-    else:
-        return ''
-
-def iplisttrans(ipl):
-    addrs = []
-    for line in ipl:
-        line = line.strip()
-        if legal(line):
-            out = bu0(line)
-            addrs.append(out)
-    return addrs
-
-def retrans(lines):
-    colons=[]
-    for line in lines:
-        lout=list(line)
-        for i in range(4,35,5):
-            lout.insert(i,":")
-        lout="".join(lout)
-        colons.append(lout)
-    return colons
+asndb = load_asn_index('./analysis/data/ipasn_20221106.dat')
 
 def num_to_string(num):
     numbers = {
@@ -132,7 +44,7 @@ def genaddr(lenth):
 
 def APD(filename): # Discover missed alias-prefix from results
     lines = open(filename).readlines()
-    lines = [iptrans(line[:-1]) for line in lines if line[0] != '#' and legal(line[:-1])]
+    lines = text_to_hex([line for line in lines if line[0] != '#'])
     
     prefixes = list()
     ips=list()
@@ -168,14 +80,14 @@ def APD(filename): # Discover missed alias-prefix from results
 
     prefixlist=[]
     for ips16 in ips:
-        responses, no_responses = multi_ping(retrans(ips16), timeout=1, retry=2)
+        responses, no_responses = multi_ping(hex_to_text(ips16), timeout=1, retry=2)
         print('# IPs:', len(ips16), '# responses:', len(responses))
         if len(responses) > 12: #16
             res=[]
             for addr, rtt in responses.items():
                 # print "%s responded in %f seconds" % (addr, rtt)
                 res.append(addr)
-            nor = iplisttrans(res)
+            nor = text_to_hex(res)
             for lent in range(25,7,-1):
                 prefix_set = set([line[:lent] for line in nor])
                 if len(prefix_set)==1:
@@ -211,12 +123,13 @@ def alias_unfile(filename):
         for lent in range(7, 31):
             prefix_dict[lent] = set()    
             
-        for line in lines_part:
-            if line[0]!='#':
-                index = line.find('/')
-                prefix_len = int(line[index+1:-1])//4
-                prefix = iptrans(line[:index])[:prefix_len]
-                prefix_dict[prefix_len].add(prefix)
+        lines_part = [line for line in lines_part if line[0]!='#']
+        indexes = [line.find('/') for line in lines_part]
+        addrs, valid = parse_bulk([line[:index] for line, index in zip(lines_part, indexes)])
+        for line, index, addr, legal in zip(lines_part, indexes, format_hex(addrs), valid):
+            prefix_len = int(line[index+1:-1])//4
+            prefix = (addr if legal else '')[:prefix_len]
+            prefix_dict[prefix_len].add(prefix)
 
         prefix2remove = list()
         for lent1 in range(30, 7, -1):
@@ -282,7 +195,7 @@ def re_APD(filename):
             ip = pre + addr
             ips16.append(ip)
 
-        responses, no_responses = multi_ping(retrans(ips16), timeout=1, retry=2)
+        responses, no_responses = multi_ping(hex_to_text(ips16), timeout=1, retry=2)
         print(prefix, 'has', len(responses), 'responses')
 
         if len(responses) not in res_dict.keys():
@@ -307,13 +220,18 @@ def Prefix2AS(alias_list):
     for _, line in data.iterrows():
         ASname_dict[line["autonomous_system_number"]] = line["autonomous_system_organization"]
     
-    asn_prefix = dict()
+    # one random address per prefix, all of them are looked up at once
+    ips = list()
     for prefix in alias_list:
-        temp = prefix
         prefix = prefix[:prefix.index('/')].replace(':','')     
         addr = genaddr(32-len(prefix))
-        ip = prefix + addr              
-        asn, ripe_prefix = asndb.lookup(ip)            
+        ips.append(prefix + addr)
+    arr, valid = parse_hex_bulk(ips)
+    asns, _ = asndb.lookup(arr)
+
+    asn_prefix = dict()
+    for temp, asn, ok in zip(alias_list, asns.tolist(), valid.tolist()):
+        asn = None if asn == NO_ASN or not ok else asn
         if str(asn) not in asn_prefix.keys():
             asn_prefix[str(asn)] = list()
         asn_prefix[str(asn)].append(temp) 
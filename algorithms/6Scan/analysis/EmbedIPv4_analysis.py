@@ -2,100 +2,13 @@
 import pyasn
 import pandas as pd
 from multiping import multi_ping
+import os
+import sys
 
-asndb = pyasn.pyasn('./analysis/data/ipasn_20221106.dat')
-
-def bu0(dizhi):
-    dizhi1 = dizhi.split(':')
-    for i in range(0, len(dizhi1)):
-        # 小段地址补0 如 :AB: 补成:00AB:
-        if ((len(dizhi1[i]) < 4) and (len(dizhi1[i]) > 0)):
-            temp = dizhi1[i]
-            # 需补0数 que0
-            que0 = 4 - len(dizhi1[i])
-            temp2 = "".join('0' for i in range(0, que0))
-            dizhi1[i] = temp2 + temp
-
-    # 补 ::中的0
-    # count 为补完:中0后长度
-    count = 0
-    for i in range(0, len(dizhi1)):
-        count = count + len(dizhi1[i])
-    count = 32 - count
-    aa = []
-    aa = ''.join('0' for i in range(0, count))
-    for i in range(1, len(dizhi1) - 1):
-        if len(dizhi1[i]) == 0:
-            dizhi1[i] = aa
-    for i in range(len(dizhi1)):
-        bb = ''.join(sttt for sttt in dizhi1)
-    return bb
-
-
-def legal(dizhi):
-    dizhi1 = dizhi.split('::')
-    label = 1
-
-    # 使用::不能大于2次
-    if len(dizhi1) >= 3:
-        label = 0
-        print(":: times >2")
-    else:
-        # 字符范围应为 0~9 A~F
-        for i, char in enumerate(dizhi):
-            if char not in ':0123456789abcdef':
-                print("char value not legal:", char)
-                label = 0
-    # :不能出现在末位 同时允许::在最后
-    # :不能出现在首位 同时允许::在最前
-    if (dizhi[len(dizhi) - 1] == ':') and (dizhi[len(dizhi) - 2] != ':'):
-        label = 0
-    if (dizhi[0] == ':') and (dizhi[1] != ':'):
-        label = 0
-        print(": position not legal")
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "..", "scripts"))
+from addr_utils import parse_bulk, format_hex
 
-    # 不能出现 :::
-    temp3 = dizhi.split(":::")
-    if len(temp3) > 1:
-        print("::: not legal")
-        label = 0
-
-    # 每小节位数应不大于4
-    dizhi2 = dizhi.split(':')
-    for i in range(0, len(dizhi2)):
-        if len(dizhi2[i]) >= 5:
-            print("每小节位数应不大于4")
-            label = 0
-
-    if label == 0:
-        print("Error")
-    return label
-
-def iptrans(line):
-    line = line.strip()
-    if legal(line):
-        out = bu0(line)
-    return out
-
-def iplisttrans(ipl):
-    addrs = []
-    for line in ipl:
-        line = line.strip()
-        if legal(line):
-            out = bu0(line)
-            addrs.append(out)
-    return addrs
-
-def retrans(lines):
-    colons=[]
-    for line in lines:
-        lout=list(line)
-        for i in range(4,35,5):
-            lout.insert(i,":")
-        lout="".join(lout)
-        lout+='\n'
-        colons.append(lout)
-    return colons
+asndb = pyasn.pyasn('./analysis/data/ipasn_20221106.dat')
 
 def ip32(line):
     a = int('0x' + line[24:26], 16)
@@ -116,17 +29,12 @@ def extract(filename):
     dict64 = dict()
     with open(filename) as f:
         lines = f.read().splitlines()
-        for line in lines:
-            index32 = line.find("embedded-ipv4-32")
-            index64 = line.find("embedded-ipv4-64")
-            if index32 > 0:
-                key = line[:line.index(',')]
-                value = ip32(iptrans(line[:line.index(',')]))
-                dict32.update({key : value})
-            if index64 > 0:
-                key = line[:line.index(',')]
-                value = ip64(iptrans(line[:line.index(',')]))
-                dict64.update({key : value})
+        keys32 = [line[:line.index(',')] for line in lines if line.find("embedded-ipv4-32") > 0]
+        keys64 = [line[:line.index(',')] for line in lines if line.find("embedded-ipv4-64") > 0]
+        addrs32, legal32 = parse_bulk(keys32)
+        addrs64, legal64 = parse_bulk(keys64)
+        dict32 = {key: ip32(addr) for key, addr, legal in zip(keys32, format_hex(addrs32), legal32) if legal}
+        dict64 = {key: ip64(addr) for key, addr, legal in zip(keys64, format_hex(addrs64), legal64) if legal}
         info = lines[-7:-1]
     f.close()
     return dict32, dict64, info 
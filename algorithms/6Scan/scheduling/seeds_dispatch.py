@@ -1,99 +1,13 @@
 import math
 import os
+import sys
 import paramiko
 import threading
 import time
 from scp import SCPClient
 
-def bu0(dizhi):
-    dizhi1 = dizhi.split(':')
-    for i in range(0, len(dizhi1)):
-        # 小段地址补0 如 :AB: 补成:00AB:
-        if ((len(dizhi1[i]) < 4) and (len(dizhi1[i]) > 0)):
-            temp = dizhi1[i]
-            # 需补0数 que0
-            que0 = 4 - len(dizhi1[i])
-            temp2 = "".join('0' for i in range(0, que0))
-            dizhi1[i] = temp2 + temp
-
-    # 补 ::中的0
-    # count 为补完:中0后长度
-    count = 0
-    for i in range(0, len(dizhi1)):
-        count = count + len(dizhi1[i])
-    count = 32 - count
-    aa = []
-    aa = ''.join('0' for i in range(0, count))
-    for i in range(1, len(dizhi1) - 1):
-        if len(dizhi1[i]) == 0:
-            dizhi1[i] = aa
-    for i in range(len(dizhi1)):
-        bb = ''.join(sttt for sttt in dizhi1)
-    return bb
-
-def legal(dizhi):
-    dizhi1 = dizhi.split('::')
-    label = 1
-
-    # 使用::不能大于2次
-    if len(dizhi1) >= 3:
-        label = 0
-        print(":: times >2")
-    else:
-        # 字符范围应为 0~9 A~F
-        for i, char in enumerate(dizhi):
-            if char not in ':0123456789abcdef':
-                print("char value not legal:", char)
-                label = 0
-    # :不能出现在末位 同时允许::在最后
-    # :不能出现在首位 同时允许::在最前
-    if (dizhi[len(dizhi) - 1] == ':') and (dizhi[len(dizhi) - 2] != ':'):
-        label = 0
-    if (dizhi[0] == ':') and (dizhi[1] != ':'):
-        label = 0
-        print(": position not legal")
-
-    # 不能出现 :::
-    temp3 = dizhi.split(":::")
-    if len(temp3) > 1:
-        print("::: not legal")
-        label = 0
-
-    # 每小节位数应不大于4
-    dizhi2 = dizhi.split(':')
-    for i in range(0, len(dizhi2)):
-        if len(dizhi2[i]) >= 5:
-            print("每小节位数应不大于4")
-            label = 0
-
-    if label == 0:
-        print("Error")
-    return label
-
-def iptrans(line):
-    line = line.strip()
-    if legal(line):
-        out = bu0(line)
-    return out
-
-def iplisttrans(ipl):
-    addrs = []
-    for line in ipl:
-        line = line.strip()
-        if legal(line):
-            out = bu0(line)
-            addrs.append(out)
-    return addrs
-
-def retrans(lines):
-    colons=[]
-    for line in lines:
-        lout=list(line)
-        for i in range(4,35,5):
-            lout.insert(i,":")
-        lout="".join(lout)
-        colons.append(lout)
-    return colons
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "..", "scripts"))
+from addr_utils import text_to_hex, hex_to_text
 
 def file_local_to_remote(host, username, password, port = 22, local_path = './output/seeds/', remote_path = '~/dabing/HDMap6/download/'):    
         # 实例化SSHClient
@@ -149,7 +63,7 @@ def longest_match_split(iplist, seedfile):
     part = math.ceil(len(seeds)/part_len)
     if part > 1:
         for i in range(0,part):
-            seeds_part = iplisttrans(seeds[i*part_len:(i+1)*part_len])
+            seeds_part = text_to_hex(seeds[i*part_len:(i+1)*part_len])
             
             segment_len = math.ceil(len(seeds_part)/len(iplist))
 
@@ -174,8 +88,8 @@ def longest_match_split(iplist, seedfile):
                 os.makedirs(path)
 
             for host, ips in ipdict.items():
-                file_name = './output/seeds/' + retrans([host])[0]
-                ips = [seed + '\n' for seed in retrans(ips)]
+                file_name = './output/seeds/' + hex_to_text([host])[0]
+                ips = [seed + '\n' for seed in hex_to_text(ips)]
                 f = open(file_name, "a")
                 f.writelines(ips)
                 f.close() 
@@ -195,15 +109,14 @@ def get80prefix(seedfile):
     if part > 1:
         for i in range(0,part):
             prefix_dict = dict()
-            seeds_part = iplisttrans(seeds[i*part_len:(i+1)*part_len])
+            seeds_part = text_to_hex(seeds[i*part_len:(i+1)*part_len])
             
             for seed in seeds_part:
                 prefix = seed[0:20]                
                 prefix_dict[prefix] = seed
             
-            for ip in prefix_dict.values():
-                ip = retrans([ip])[0] + '\n'               
-                f.write(ip)
+            for ip in hex_to_text(list(prefix_dict.values())):
+                f.write(ip + '\n')
     f.close() 
 
 
@@ -218,16 +131,16 @@ if __name__ == "__main__":
 
     # get80prefix(seedfile)
     
-    iplist = iplisttrans(iplist)
+    iplist = text_to_hex(iplist)
     iplist.sort() 
 
     longest_match_split(iplist, seedfile) 
-    # shortest_match_split(retrans(iplist)) # rename
+    # shortest_match_split(hex_to_text(iplist)) # rename
 
-    remote_host_list = [(retrans([ip])[0], 'root', 'pwd') for ip in iplist if ip != iptrans(local_host)]
+    remote_host_list = [(hex_to_text([ip])[0], 'root', 'pwd') for ip in iplist if ip != text_to_hex([local_host])[0]]
     multithread(remote_host_list)
 
-    local_file = './output/seeds/' + retrans([iptrans(local_host)])[0]
+    local_file = './output/seeds/' + hex_to_text(text_to_hex([local_host]))[0]
     target_file = './download/hitlist_%s'%time.strftime("%Y%m%d", time.localtime())
     cmd = 'cp %s %s'%(local_file, target_file)
     os.system(cmd)
\ No newline at end of file
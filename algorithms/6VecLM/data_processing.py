@@ -1,5 +1,10 @@
-import ipaddress
+import os
+import sys
 import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import iter_parse_file, to_nibbles, HEX_CHARS, NibbleWriter
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--input", type=str, default="data/public_dataset/sample_addresses.txt")
@@ -8,56 +13,39 @@ args = parser.parse_args()
 dataset_path = args.input
 word_split_path = "data/processed_data/word_data.txt"
 colon_removed_path = "data/processed_data/nocolon_data.txt"
+nibbles_path = "data/processed_data/nibbles.npy"
 
+location_alpha = '0123456789abcdefghijklmnopqrstuv'
 
-def read_data():
-    f = open(dataset_path, "r")
-    raw_data = f.readlines()
-    f.close()
-
-    return raw_data
-
-
-def word2vec_processing(nybbles):
-    null = ""
-    address = null.join(nybbles) + "\n"
-
-    word2vec_data = []
-    location_alpha = '0123456789abcdefghijklmnopqrstuv'
-    for nybble, location in zip(address, location_alpha):
-        word2vec_data.append(nybble + location)
-    return word2vec_data
-
-
-def data_processing(raw_data):
-    word_split_list = []
-    colon_removed_list = []
 
-    space = " "
-    null = ""
-    for address in raw_data:
-        address = ipaddress.ip_address(address[:-1]).exploded
-        nybbles = address.split(":")
-        word2vec_data = word2vec_processing(nybbles)
-        word_split_list.append(space.join(word2vec_data) + "\n")
-        # word_split_list.append(space.join(nybbles) + "\n")
-        colon_removed_list.append(null.join(nybbles) + "\n")
+def word_lines(nibbles):
+    "Word lines (nibble + location) of a nibble matrix as bytes, built as one byte matrix."
+    chars = np.full((len(nibbles), 32, 3), ord(" "), dtype=np.uint8)
+    chars[:, :, 0] = HEX_CHARS[nibbles]
+    chars[:, :, 1] = np.frombuffer(location_alpha.encode(), dtype=np.uint8)
+    chars[:, -1, 2] = ord("\n")
+    return chars.tobytes()
 
-    return word_split_list, colon_removed_list
 
+def nocolon_lines(nibbles):
+    "Lines of 32 hex digits of a nibble matrix as bytes."
+    chars = np.full((len(nibbles), 33), ord("\n"), dtype=np.uint8)
+    chars[:, :32] = HEX_CHARS[nibbles]
+    return chars.tobytes()
 
-def data_save(word_split_list, colon_removed_list):
-    f = open(word_split_path, "w")
-    f.writelines(word_split_list)
-    f.close()
 
-    f = open(colon_removed_path, "w")
-    f.writelines(colon_removed_list)
-    f.close()
+def stream_processing():
+    "Parse the data set chunk by chunk and append every chunk to all outputs."
+    writer = NibbleWriter(nibbles_path)
+    with open(word_split_path, "wb") as f_word, open(colon_removed_path, "wb") as f_nocolon:
+        for arr in iter_parse_file(dataset_path):
+            nibbles = to_nibbles(arr)
+            f_word.write(word_lines(nibbles))
+            f_nocolon.write(nocolon_lines(nibbles))
+            writer.write(arr)
+    writer.close()
 
 
 if __name__ == "__main__":
 
-    raw_data = read_data()
-    word_split_list, colon_removed_list = data_processing(raw_data)
-    data_save(word_split_list, colon_removed_list)
+    stream_processing()
@@ -1,17 +1,23 @@
+import os
+import sys
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torchsummary import summary
-import math, copy, time
+import math, copy, time, functools
 from torch.autograd import Variable
 from gensim.models import word2vec
 import matplotlib.pyplot as plt
 import seaborn
 seaborn.set_context(context="talk")
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import load_nibbles, index_batches
+
 word2vec_model_path = 'models/ipv62vec.model'
 data_path = "data/processed_data/word_data.txt"
+nibbles_path = "data/processed_data/nibbles.npy"
 model_path = "models/ipv6_transformer.model"
 generation_path = "data/generation_data/candidates.txt"
 
@@ -21,10 +27,9 @@ temperature = 0.015
 
 train_data_size = 100000
 train_batch_size = 100
-train_nbatch = int(train_data_size / train_batch_size)
 eval_data_size = 1000
 eval_batch_size = 100
-eval_nbatch = int(eval_data_size / eval_batch_size)
+decode_batch_size = 256
 
 stack_layers = 6
 
@@ -55,6 +60,15 @@ class EncoderDecoder(nn.Module):
     def decode(self, memory, src_mask, tgt, tgt_mask):
         return self.decoder(self.tgt_embed(tgt), memory, src_mask, tgt_mask)
 
+    def decode_step(self, memory, src_mask, tgt, cache):
+        """
+        decode() for the last position of tgt only. The keys and values of
+        the earlier positions and of the encoder memory are kept in cache
+        (see Decoder.init_cache) between the steps.
+        """
+        x = self.tgt_embed[1](self.tgt_embed[0](tgt[:, -1:]), offset=tgt.size(1) - 1)
+        return self.decoder.forward_step(x, memory, src_mask, cache)
+
 
 class Generator(nn.Module):
     "Define standard linear + softmax generation step."
@@ -145,6 +159,16 @@ class Decoder(nn.Module):
             x = layer(x, memory, src_mask, tgt_mask)
         return self.norm(x)
 
+    def init_cache(self):
+        "Empty self-attn and src-attn key/value caches of every layer."
+        return [({}, {}) for _ in self.layers]
+
+    def forward_step(self, x, memory, src_mask, cache):
+        "forward() for one new position x, using and extending cache."
+        for layer, layer_cache in zip(self.layers, cache):
+            x = layer.forward_step(x, memory, src_mask, layer_cache)
+        return self.norm(x)
+
 
 class DecoderLayer(nn.Module):
     "Decoder is made of self-attn, src-attn, and feed forward (defined below)"
@@ -164,6 +188,14 @@ class DecoderLayer(nn.Module):
         x = self.sublayer[1](x, lambda x: self.src_attn(x, m, m, src_mask))
         return self.sublayer[2](x, self.feed_forward)
 
+    def forward_step(self, x, memory, src_mask, cache):
+        "forward() for one new position, the earlier positions are only seen through the cache."
+        m = memory
+        self_cache, src_cache = cache
+        x = self.sublayer[0](x, lambda x: self.self_attn.forward_step(x, x, x, None, self_cache))
+        x = self.sublayer[1](x, lambda x: self.src_attn.forward_step(x, m, m, src_mask, src_cache, static=True))
+        return self.sublayer[2](x, self.feed_forward)
+
 
 def subsequent_mask(size):
     "Mask out subsequent positions."
@@ -218,6 +250,32 @@ class MultiHeadedAttention(nn.Module):
             .view(nbatches, -1, self.h * self.d_k)
         return self.linears[-1](x)
 
+    def forward_step(self, query, key, value, mask, cache, static=False):
+        """
+        forward() for new positions only. The projected keys and values are
+        kept in cache: new ones are appended, static ones (encoder memory)
+        are projected on the first step only.
+        """
+        if mask is not None:
+            mask = mask.unsqueeze(1)
+        nbatches = query.size(0)
+
+        query = self.linears[0](query).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
+        if not (static and "key" in cache):
+            key, value = \
+                [l(x).view(nbatches, -1, self.h, self.d_k).transpose(1, 2)
+                 for l, x in zip(self.linears[1:3], (key, value))]
+            if "key" in cache:
+                key = torch.cat([cache["key"], key], dim=2)
+                value = torch.cat([cache["value"], value], dim=2)
+            cache["key"], cache["value"] = key, value
+
+        x, self.attn = attention(query, cache["key"], cache["value"], mask=mask,
+                                 dropout=self.dropout)
+        x = x.transpose(1, 2).contiguous() \
+            .view(nbatches, -1, self.h * self.d_k)
+        return self.linears[-1](x)
+
 
 class PositionwiseFeedForward(nn.Module):
     "Implements FFN equation."
@@ -260,8 +318,8 @@ class PositionalEncoding(nn.Module):
         pe = pe.unsqueeze(0)
         self.register_buffer('pe', pe)
 
-    def forward(self, x):
-        x = x + Variable(self.pe[:, :x.size(1)],
+    def forward(self, x, offset=0):
+        x = x + Variable(self.pe[:, offset:offset + x.size(1)],
                          requires_grad=False)
         return self.dropout(x)
 
@@ -434,27 +492,43 @@ class LabelSmoothing(nn.Module):
     #     return self.criterion(x, Variable(true_dist, requires_grad=False))
 
 
-def word2id(word, word2vec_model):
+@functools.lru_cache(maxsize=None)
+def vocab_dicts(word2vec_model):
+    "Word to id and id to word dictionaries, built once per word2vec models."
     vocab = list(word2vec_model.wv.vocab.keys())
     word2id_dict = {word: i+1 for i, word in enumerate(vocab)}
-    return word2id_dict[word]
+    id2word_dict = {i+1: word for i, word in enumerate(vocab)}
+    return word2id_dict, id2word_dict
+
+
+def word2id(word, word2vec_model):
+    return vocab_dicts(word2vec_model)[0][word]
 
 
 def id2word(id, word2vec_model):
-    vocab = list(word2vec_model.wv.vocab.keys())
-    id2word_dict = {i+1: word for i, word in enumerate(vocab)}
-    return id2word_dict[id]
-
-
-def data_gen(data, batch, nbatches):
-    "Generate random data for a src-tgt copy task."
-    for i in range(nbatches):
-        # data = torch.from_numpy(np.random.randint(1, V, size=(batch, 10)))
-        # data[:, 0] = 1
-        # src = Variable(data, requires_grad=False)
-        # tgt = Variable(data, requires_grad=False)
-        src = torch.from_numpy(data[i * batch: (i + 1) * batch, :encoder_input_length])
-        tgt = torch.from_numpy(data[i * batch: (i + 1) * batch, encoder_input_length:])
+    return vocab_dicts(word2vec_model)[1][id]
+
+
+@functools.lru_cache(maxsize=None)
+def position_word_ids(word2vec_model):
+    "Word id of every nibble at every position (32 x 16), 0 (padding) for words not in the vocabulary."
+    word2id_dict = vocab_dicts(word2vec_model)[0]
+    location_alpha = '0123456789abcdefghijklmnopqrstuv'
+    return np.array([[word2id_dict.get(format(nibble, "x") + location, 0) for nibble in range(16)]
+                     for location in location_alpha], dtype=np.int64)
+
+
+def nibble_ids(nibbles, word2vec_model):
+    "Word ids of the rows of a nibble matrix."
+    return position_word_ids(word2vec_model)[np.arange(32), nibbles]
+
+
+def data_gen(nibbles, batches, word2vec_model):
+    "Generate batches of the given row indices of a (memory mapped) nibble matrix."
+    for index in batches:
+        data = nibble_ids(nibbles[index], word2vec_model)
+        src = torch.from_numpy(data[:, :encoder_input_length])
+        tgt = torch.from_numpy(data[:, encoder_input_length:])
         yield Batch(src, tgt, 0)
 
 
@@ -500,17 +574,21 @@ def next_generation(word2vec_model, vector, temperature, index):
     return word2id(index_words[sample(preds, temperature)], word2vec_model)
 
 
-def greedy_decode(model, word2vec_model, src, src_mask, max_len, start_symbol):
+def greedy_decode(model, word2vec_model, src, src_mask, max_len, start_symbol, use_cache=True):
     model, src, src_mask = model.to(device), src.to(device), src_mask.to(device)
     memory = model.encode(src, src_mask)
     ys = torch.ones(1, 1).fill_(start_symbol).type_as(src.data)
     ys = ys.to(device)
+    cache = model.decoder.init_cache()
 
     for i in range(max_len-1):
-        out = model.decode(memory, src_mask,
-                           Variable(ys),
-                           Variable(subsequent_mask(ys.size(1))
-                                    .type_as(src.data)))
+        if use_cache:
+            out = model.decode_step(memory, src_mask, Variable(ys), cache)
+        else:
+            out = model.decode(memory, src_mask,
+                               Variable(ys),
+                               Variable(subsequent_mask(ys.size(1))
+                                        .type_as(src.data)))
         # prob = models.generator(out[:, -1])
         # _, next_word = torch.max(prob, dim=1)
         vector = model.generator(out[:, -1])
@@ -521,6 +599,88 @@ def greedy_decode(model, word2vec_model, src, src_mask, max_len, start_symbol):
     return ys
 
 
+class PositionVectors:
+    "Ids and normalized word vectors of the nibble words of every position, built once per position."
+
+    def __init__(self, word2vec_model):
+        self.word2vec_model = word2vec_model
+        self.cache = {}
+
+    def __call__(self, index):
+        if index not in self.cache:
+            vocab = self.word2vec_model.wv.vocab
+            attribute_index = str(chr(index + 87))
+            attribute_values = [str(hex(i))[-1] for i in range(16)]
+            index_words = [attribute_value + attribute_index for attribute_value in attribute_values
+                           if attribute_value + attribute_index in vocab]
+            ids = torch.LongTensor([word2id(index_word, self.word2vec_model) for index_word in index_words])
+            vectors = torch.Tensor(np.array([self.word2vec_model.wv[index_word] for index_word in index_words]))
+            self.cache[index] = ids.to(device), F.normalize(vectors, dim=1).to(device)
+        return self.cache[index]
+
+
+def sample_batch(preds, temperatures):
+    "sample() for a batch of rows: one uniform draw per row, inverse transform of the tempered distribution."
+    preds = F.softmax(torch.log(preds) / temperatures.unsqueeze(1), dim=1).cpu().numpy()
+    u = np.random.random_sample(len(preds))
+    choice = (np.cumsum(preds, axis=1) < u[:, None]).sum(axis=1)
+    return np.minimum(choice, preds.shape[1] - 1)
+
+
+def next_generation_batch(position_vectors, vectors, temperatures, index):
+    "next_generation() for a batch of generator outputs, the similarities are a single matmul."
+    ids, index_word_vectors = position_vectors(index)
+    similarity = torch.matmul(F.normalize(vectors, dim=1), index_word_vectors.t())
+    preds = F.softmax(similarity.double(), dim=1)
+    return ids[torch.from_numpy(sample_batch(preds, temperatures)).to(device)]
+
+
+def batch_decode(model, position_vectors, src, start_symbols, max_len, temperatures, use_cache=True):
+    """
+    Decode a batch of prefixes at all temperatures in one pass. The encoder
+    runs once per prefix, row i * len(temperatures) + j of the result is the
+    continuation of src[i] at temperatures[j]. With use_cache, every step
+    only computes the newest position (see EncoderDecoder.decode_step).
+    """
+    with torch.no_grad():
+        src = src.to(device)
+        src_mask = torch.ones(src.size(0), 1, src.size(1)).to(device)
+        memory = model.encode(src, src_mask)
+        memory = memory.repeat_interleave(len(temperatures), dim=0)
+        src_mask = src_mask.repeat_interleave(len(temperatures), dim=0)
+        ys = start_symbols.to(device).repeat_interleave(len(temperatures)).view(-1, 1)
+        temperatures = torch.DoubleTensor(temperatures).repeat(src.size(0)).to(device)
+        cache = model.decoder.init_cache()
+
+        for i in range(max_len-1):
+            if use_cache:
+                out = model.decode_step(memory, src_mask, ys, cache)
+            else:
+                out = model.decode(memory, src_mask, ys,
+                                   subsequent_mask(ys.size(1)).type_as(src.data))
+            vectors = model.generator(out[:, -1])
+            next_words = next_generation_batch(position_vectors, vectors, temperatures, i + src.size(1) + 1)
+            ys = torch.cat([ys, next_words.view(-1, 1)], dim=1)
+    return ys
+
+
+@functools.lru_cache(maxsize=None)
+def id_nibbles(word2vec_model):
+    "Nibble character (as byte) of every word id, id 0 is padding."
+    id2word_dict = vocab_dicts(word2vec_model)[1]
+    nibbles = np.full(len(id2word_dict) + 1, ord("0"), dtype=np.uint8)
+    for id, word in id2word_dict.items():
+        nibbles[id] = ord(word[0])
+    return nibbles
+
+
+def ids_to_addresses(ids, word2vec_model):
+    "Format rows of 32 word ids as exploded IPv6 addresses."
+    chars = np.full((len(ids), 39), ord(":"), dtype=np.uint8)
+    chars[:, [i + i // 4 for i in range(32)]] = id_nibbles(word2vec_model)[ids]
+    return chars.view("S39").ravel().astype(str)
+
+
 def write_data(target_generation):
     f = open(generation_path, "a+")
     for address in target_generation:
@@ -535,16 +695,10 @@ if __name__ == "__main__":
     # criterion = LabelSmoothing(size=475, padding_idx=0, smoothing=0.0)
     word2vec_model = word2vec.Word2Vec.load(word2vec_model_path)
 
-    f = open(data_path, "r")
-    train_data = [[word2id(nybble, word2vec_model) for nybble in address[:-1].split()]
-                  for address in f.readlines()[:train_data_size]]
-    train_data = np.array(train_data)
-    f.close()
-    f = open(data_path, "r")
-    eval_data = [[word2id(nybble, word2vec_model) for nybble in address[:-1].split()]
-                 for address in f.readlines()[-eval_data_size:]]
-    eval_data = np.array(eval_data)
-    f.close()
+    nibbles = load_nibbles(nibbles_path)
+    train_size = min(train_data_size, len(nibbles))
+    eval_start = max(len(nibbles) - eval_data_size, 0)
+    rng = np.random.RandomState(0)
 
     criterion = LabelSmoothing(size=100, padding_idx=0, word2vec_model=word2vec_model, smoothing=0.0)
     model = make_model(word2vec_model, N=stack_layers)
@@ -558,11 +712,12 @@ if __name__ == "__main__":
     for epoch in range(total_epoch):
         print("Total Epoch: ", epoch + 1)
         model.train()
-        run_epoch(data_gen(train_data, train_batch_size, train_nbatch), model,
+        run_epoch(data_gen(nibbles, index_batches(train_size, train_batch_size, rng, drop_last=True), word2vec_model), model,
                   SimpleLossCompute(model.generator, criterion, model_opt))
         model.eval()
         print("Eval:")
-        print(run_epoch(data_gen(eval_data, eval_batch_size, eval_nbatch), model,
+        eval_batches = (index + eval_start for index in index_batches(len(nibbles) - eval_start, eval_batch_size, drop_last=True))
+        print(run_epoch(data_gen(nibbles, eval_batches, word2vec_model), model,
                         SimpleLossCompute(model.generator, criterion, None)))
     torch.save(model, model_path)
 
@@ -571,33 +726,20 @@ if __name__ == "__main__":
     # src_mask = Variable(torch.ones(1, 1, 10))
     # print(greedy_decode(models, src, src_mask, max_len=10, start_symbol=1))
 
-    f = open(data_path, "r")
-    data = np.array([[word2id(nybble, word2vec_model) for nybble in address[:-1].split()]
-                     for address in f.readlines()[:train_data_size]])
-    test_data = np.array(data[:, :encoder_input_length])
-    start_symbols = np.array(data[:, encoder_input_length])
-    f.close()
-
-    target_generation = []
-    for i in range(len(test_data)):
-        src = Variable(torch.LongTensor([test_data[i]]))
-        src_mask = Variable(torch.ones(1, 1, encoder_input_length))
-        predict = greedy_decode(model, word2vec_model, src, src_mask,
-                                max_len=32-encoder_input_length, start_symbol=start_symbols[i])
-        predict = np.append(np.array(test_data[i]), predict.cpu().numpy())
-        predict_words = [id2word(i, word2vec_model) for i in predict]
-        # predict_words_str = " ".join(predict_words)
-        # print(predict_words_str)
-        predict_address = [word[0] for word in predict_words]
-        count = 0
-        predict_address_str = ""
-        for i in predict_address:
-            predict_address_str += i
-            count += 1
-            if count % 4 == 0 and count != 32:
-                predict_address_str += ":"
-        print(predict_address_str)
-        target_generation.append(predict_address_str)
-    target_generation = list(set(target_generation))
-    write_data(target_generation)
-
+    # decode in batches, new addresses are appended to the candidate set right away
+    position_vectors = PositionVectors(word2vec_model)
+    target_generation = set()
+    for i in range(0, train_size, decode_batch_size):
+        data = nibble_ids(nibbles[i:i + decode_batch_size], word2vec_model)
+        test_data = data[:, :encoder_input_length]
+        src = torch.LongTensor(test_data)
+        predict = batch_decode(model, position_vectors, src, torch.LongTensor(data[:, encoder_input_length]),
+                               max_len=32-encoder_input_length, temperatures=[temperature])
+        predict = np.hstack([test_data, predict.cpu().numpy()])
+        new_generation = []
+        for predict_address_str in ids_to_addresses(predict, word2vec_model):
+            print(predict_address_str)
+            if predict_address_str not in target_generation:
+                target_generation.add(predict_address_str)
+                new_generation.append(predict_address_str)
+        write_data(new_generation)
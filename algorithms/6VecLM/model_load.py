@@ -6,24 +6,23 @@ import numpy as np
 from ipv6_transformer import *
 
 word2vec_model_path = 'models/ipv62vec.model'
-data_path = "data/processed_data/word_data.txt"
+nibbles_path = "data/processed_data/nibbles.npy"
 
 encoder_input_length = 16
 total_epoch = 1
 
 train_data_size = 100000
+decode_batch_size = 256
 
 def greedy_decode(model, word2vec_model, src, src_mask, max_len, start_symbol, temperature):
     model, src, src_mask = model.to(device), src.to(device), src_mask.to(device)
     memory = model.encode(src, src_mask)
     ys = torch.ones(1, 1).fill_(start_symbol).type_as(src.data)
     ys = ys.to(device)
+    cache = model.decoder.init_cache()
 
     for i in range(max_len-1):
-        out = model.decode(memory, src_mask,
-                           Variable(ys),
-                           Variable(subsequent_mask(ys.size(1))
-                                    .type_as(src.data)))
+        out = model.decode_step(memory, src_mask, Variable(ys), cache)
         # prob = models.generator(out[:, -1])
         # _, next_word = torch.max(prob, dim=1)
         vector = model.generator(out[:, -1])
@@ -46,35 +45,31 @@ if __name__ == "__main__":
 
     model = torch.load("models/ipv6_transformer.model")
     model.eval()
-    f = open(data_path, "r")
-    data = np.array([[word2id(nybble, word2vec_model) for nybble in address[:-1].split()]
-                         for address in f.readlines()[:train_data_size]])
-    test_data = np.array(data[:, :encoder_input_length])
-    start_symbles = np.array(data[:, encoder_input_length])
-    f.close()
+    nibbles = load_nibbles(nibbles_path)
+    train_size = min(train_data_size, len(nibbles))
 
-    for temperature in [0.020, 0.030, 0.040, 0.050,
-                        0.060, 0.070, 0.080, 0.090, 0.100, 0.200, 0.500]:
-        print(temperature)
-        target_generation = []
-        for i in range(len(test_data)):
-            src = Variable(torch.LongTensor([test_data[i]]))
-            src_mask = Variable(torch.ones(1, 1, encoder_input_length))
-            predict = greedy_decode(model, word2vec_model, src, src_mask, max_len=32-encoder_input_length,
-                                    start_symbol=start_symbles[i], temperature=temperature)
-            predict = np.append(np.array(test_data[i]), predict.cpu().numpy())
-            predict_words = [id2word(i, word2vec_model) for i in predict]
-            # predict_words_str = " ".join(predict_words)
-            # print(predict_words_str)
-            predict_address = [word[0] for word in predict_words]
-            count = 0
-            predict_address_str = ""
-            for i in predict_address:
-                predict_address_str += i
-                count += 1
-                if count % 4 == 0 and count != 32:
-                    predict_address_str += ":"
-            target_generation.append(predict_address_str)
-        generation_path = "data/generation_data/candidate_s6_e1_t" + str(temperature) + ".txt"
-        target_generation = list(set(target_generation))
-        write_data(target_generation, generation_path)
+    # all temperatures are sampled from one decode pass over each batch of
+    # prefixes, new addresses are appended to the candidate set of their
+    # temperature right away
+    temperatures = [0.020, 0.030, 0.040, 0.050,
+                    0.060, 0.070, 0.080, 0.090, 0.100, 0.200, 0.500]
+    position_vectors = PositionVectors(word2vec_model)
+    target_generation = {temperature: set() for temperature in temperatures}
+    generation_files = {temperature: open("data/generation_data/candidate_s6_e1_t" + str(temperature) + ".txt", "w")
+                        for temperature in temperatures}
+    for i in range(0, train_size, decode_batch_size):
+        print("{} / {} prefixes".format(i, train_size))
+        data = nibble_ids(nibbles[i:i + decode_batch_size], word2vec_model)
+        test_data = data[:, :encoder_input_length]
+        src = torch.LongTensor(test_data)
+        predict = batch_decode(model, position_vectors, src, torch.LongTensor(data[:, encoder_input_length]),
+                               max_len=32-encoder_input_length, temperatures=temperatures)
+        predict = np.hstack([np.repeat(test_data, len(temperatures), axis=0),
+                             predict.cpu().numpy()])
+        for j, predict_address_str in enumerate(ids_to_addresses(predict, word2vec_model)):
+            temperature = temperatures[j % len(temperatures)]
+            if predict_address_str not in target_generation[temperature]:
+                target_generation[temperature].add(predict_address_str)
+                generation_files[temperature].write(predict_address_str + "\n")
+    for f in generation_files.values():
+        f.close()
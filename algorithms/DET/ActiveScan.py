@@ -1,67 +1,101 @@
 #!/usr/bin/python3.6
 # encoding:utf-8
-import subprocess, os,json, time
-from AddrsToSeq import get_rawIP
+import os, sys, json, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import ADDR_DTYPE, parse_bulk, format_compressed
+from prefix_utils import build_index, load_prefix_index, covered_index
+from probe_utils import ZmapProber, iter_chunks
+import numpy as np
 from datetime import datetime
 
-wc = lambda x: subprocess.check_output(["wc", "-l", x]).decode().split(" ")[0]
 scan_counter = 0
 now = int(datetime.now().timestamp())
+filter_index = None
+filter_files = ['zmap/ipv6-bl-merged.txt', 'aliased-prefixes.txt']
+prober = None
 
-def Scan(addr_set, source_ip, output_file, tid):
+
+def SetProber(p, filters=None):
+    """
+    设置扫描使用的探测后端（默认为zmap，见probe_utils）
+
+    Args：
+        p：Prober对象，例如用于离线模拟扫描的SimulatedProber
+        filters：过滤目标地址的前缀文件列表（黑名单、别名前缀），
+                 默认为zmap黑名单和aliased-prefixes.txt，不存在的文件被跳过
+    """
+    global prober, filter_files
+    prober = p
+    if filters is not None:
+        filter_files = list(filters)
+
+
+def LoadFilter(fns):
+    """
+    建立前缀文件的过滤索引（并缓存到磁盘），没有前缀文件时为空索引
+
+    Args：
+        fns：前缀文件列表
+
+    Return：
+        filter_index：前缀索引
+    """
+    if not fns:
+        return build_index(np.zeros(0, dtype=ADDR_DTYPE), np.zeros(0, dtype=np.int64))
+    return load_prefix_index(fns)
+
+
+def Scan(addrs, source_ip, output_file, tid):
     """
-    运用扫描工具检测addr_set地址集中的活跃地址
+    运用扫描工具检测addrs地址数组中的活跃地址
 
     Args：
-        addr_set：待扫描的地址集合
+        addrs：待扫描的IPv6地址数组，或地址数组的可迭代对象（逐块生成的目标地址）
         source_ip
         output_file
         tid:扫描的线程id
 
     Return：
-        active_addrs：活跃地址集合
+        active_addrs：活跃地址数组（有序）
     """
-    global scan_counter
+    global scan_counter, filter_index, prober
 
     scan_input = output_file + f'/scan_input_{tid}_{now}_{scan_counter}.txt'
-    scan_input_bl = output_file + f'/scan_input_{tid}_{now}_{scan_counter}.txt.bl'
-    scan_input_apd = output_file + f'/scan_input_{tid}_{now}_{scan_counter}.txt.bl.apd'
-    bl_file = 'zmap/ipv6-bl-merged.txt'
-    apd_file = 'aliased-prefixes.txt'
     zmap_config = 'zmap/zmap.conf'
     scan_output = output_file + f'/scan_output_{tid}_{now}_{scan_counter}.txt'
 
-    with open(scan_input, 'w', encoding = 'utf-8') as f:
-        for addr in addr_set:
-            f.write(addr + '\n')
+    # 黑名单和别名前缀只在首次扫描时建立索引（并缓存到磁盘），之后在进程内过滤。
+    # zmap扫描需要全部过滤文件，离线模拟扫描跳过不存在的文件
+    if prober is None:
+        prober = ZmapProber(zmap_config)
+    if filter_index is None:
+        fns = filter_files
+        if not isinstance(prober, ZmapProber):
+            fns = [fn for fn in filter_files if os.path.isfile(fn)]
+            for fn in sorted(set(filter_files) - set(fns)):
+                print('[!] Filter file {} not found, skipped'.format(fn))
+        filter_index = LoadFilter(fns)
 
-    command_filter = ['grepcidr', '-v', '-f', f'{bl_file}', f'{scan_input}']
-    with open(scan_input_bl, "w") as f:
-        subprocess.run(command_filter, stdout=f)
+    # 目标地址和扫描结果仍写入文件留作记录，扫描工具直接通过管道读写。
+    # 目标地址逐块记录、过滤并交给扫描工具，不在内存中保存完整的目标列表
+    def Targets(f):
+        for chunk in iter_chunks(addrs):
+            for addr in format_compressed(chunk):
+                f.write(addr + '\n')
+            yield chunk[~covered_index(filter_index, chunk)]
 
-    command_filter = ['grepcidr', '-v', '-f', f'{apd_file}', f'{scan_input_bl}']
-    with open(scan_input_apd, "w") as f:
-        subprocess.run(command_filter, stdout=f)
-
-    active_addrs = set()
-    command = 'zmap --config {} --ipv6-target-file={} -q -o {}'\
-        .format(zmap_config, scan_input_apd, scan_output)
-    print(command)
-    
-    print('[+] Scanning {} addresses...'.format(wc(scan_input_apd)))
+    print('[+] Scanning addresses...')
     t_start = time.time()
-    p = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    
-    while p.poll() == None:
-        pass
-
-    if p.poll() == 0:
-        for line in open(scan_output):
-            if line != '':
-                active_addrs.add(line[0:len(line) - 1])
-    else:
-        raise Exception(f"command\n\n{command}\n\nreturned code {p.poll()}")
-            
+    sent = prober.sent
+    with open(scan_input, 'w', encoding = 'utf-8') as f:
+        active_addrs = prober.probe(Targets(f))
+    print('[+] {} addresses scanned'.format(prober.sent - sent))
+
+    with open(scan_output, 'w', encoding = 'utf-8') as f:
+        for addr in format_compressed(active_addrs):
+            f.write(addr + '\n')
+    scan_counter += 1
+
     print('[+] Over! Scanning duration:{} s'.format(time.time() - t_start))
     print('[+] {} active addresses detected!'
         .format(len(active_addrs)))
@@ -76,4 +110,5 @@ if __name__ == '__main__':
     addr_set.add('2404:0:8e04:9::201e')
     addr_set.add('2001:4ca0:2001:13:250:56ff:feba:37ac')
     addr_set.add('2a10:3781:20::2')
-    print(Scan(addr_set, "2001:4ca0:108:42::28", ".", 2))
+    addrs, valid = parse_bulk(list(addr_set))
+    print(Scan(addrs[valid], "2001:4ca0:108:42::28", ".", 2))
@@ -1,7 +1,9 @@
 #!/usr/bin/python3.6
 # encoding:utf-8
-import math, ipaddress
-from copy import deepcopy
+import math, ipaddress, os, sys
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import ADDR_DTYPE, V6BIN_EXT, load_addrs, parse_bulk, parse_hex_bulk, unique_sorted, from_nibbles, to_nibbles
 # import pdb
 # import ptvsd
 # ptvsd.enable_attach(('219.243.212.103',3000))
@@ -44,32 +46,83 @@ def InputAddrs(input='data.csv', beta=16):
     从输入文件中读取IPv6地址列表，并转换为有序的地址向量序列
 
     Args：
-        input：存储了所有种子地址的文件（.hex:不带冒号；.txt：带冒号，可压缩）
+        input：存储了所有种子地址的文件（.hex:不带冒号；.txt：带冒号，可压缩；.v6bin：二进制地址文件）
         beta:地址向量每一维度的基数
 
     Return:
-        V：有序的地址向量序列
+        V：有序的地址向量矩阵（N x 128/log2(beta)）
     """
 
-    IPv6 = []
-    count = 0
-    for line in open(input):
-        if line != '':
-            IPv6.append(line)
-            count += 1
-    IPv6 = [addr.strip('\n') for addr in IPv6]
-    
-    if input[-3:] == 'txt':
-    # 将所有IPv6地址全部转换为未压缩形式
-        for i in range(len(IPv6)):
-            IPv6[i] = ipaddress.IPv6Address(IPv6[i])
-            IPv6[i] = IPv6[i].exploded
-            IPv6[i] = IPv6[i].replace(':','')
-
-    V = AddrsToSeq(IPv6, math.log(beta, 2))
+    if input.endswith(V6BIN_EXT):
+        # 二进制地址文件直接映射到内存，无需逐行解析文本
+        addrs = load_addrs(input)
+    else:
+        # 批量解析所有地址，非法地址通过掩码剔除
+        lines = [line.strip('\n') for line in open(input)]
+        if input[-3:] == 'txt':
+            addrs, valid = parse_bulk(lines)
+        else:
+            addrs, valid = parse_hex_bulk(lines)
+        if not valid.all():
+            print('[!] Skipped {} invalid addresses'.format(int((~valid).sum())))
+        addrs = addrs[valid]
+
+    # 按地址大小排序即为地址向量的字典序
+    order = np.lexsort((addrs['lo'], addrs['hi']))
+    V = AddrsToVecs(addrs[order], int(round(math.log(beta, 2))))
     return V
 
 
+def AddrsToVecs(addrs, m=4):
+    """
+    将IPv6地址数组转换为地址向量矩阵
+
+    Args：
+        addrs：IPv6地址数组
+        m：地址向量的每一维度代表的二进制数长度
+
+    Return：
+        V：地址向量矩阵（N x 128/m），每一行为一个地址向量
+    """
+
+    if m == 4:
+        return to_nibbles(addrs)
+    if 64 % m != 0:
+        print('!!EXCEPTION: 64 % m != 0')
+        exit()
+    dims = 64 // m
+    V = np.zeros((len(addrs), 2 * dims), dtype=np.uint8 if m <= 8 else np.uint64)
+    mask = np.uint64(2 ** m - 1)
+    for i in range(dims):
+        shift = np.uint64(64 - m * (i + 1))
+        V[:, i] = (addrs['hi'] >> shift) & mask
+        V[:, i + dims] = (addrs['lo'] >> shift) & mask
+    return V
+
+
+def VecsToAddrs(V, m=4):
+    """
+    将地址向量矩阵转换为IPv6地址数组（AddrsToVecs的逆操作）
+
+    Args：
+        V：地址向量矩阵（N x 128/m）
+        m：地址向量的每一维度代表的二进制数长度
+
+    Return：
+        addrs：IPv6地址数组
+    """
+
+    if m == 4:
+        return from_nibbles(V)
+    dims = V.shape[1] // 2
+    addrs = np.zeros(len(V), dtype=ADDR_DTYPE)
+    for i in range(dims):
+        shift = np.uint64(64 - m * (i + 1))
+        addrs['hi'] |= V[:, i].astype(np.uint64) << shift
+        addrs['lo'] |= V[:, i + dims].astype(np.uint64) << shift
+    return addrs
+
+
 def AddrsToSeq(addr=[], m=4, lamda=128):
     """
     将标准IPv6地址列表转换为有序的向量列表
@@ -106,43 +159,127 @@ def AddrsToSeq(addr=[], m=4, lamda=128):
     return V
 
 
-def SeqToAddrs(seq):
+def SeqToAddrs(TS):
     """
-    将地址向量列表转换为IPv6地址（字符串）集合
+    将结点的TS展开为IPv6地址数组
 
     Args：
-        seq：代表扫描空间的地址向量列表（可能有被Expand的维度）
+        TS：(mask, values)，mask标记地址向量的每一维度是否固定（未被Expand），
+            values为去重后的地址向量矩阵（被Expand的维度上值为0）
 
     Return：
-        addr_list：（压缩形式的）IPv6地址列表
+        addrs：有序且去重的IPv6地址数组
+    """
+
+    if TS is None:
+        return np.zeros(0, dtype=ADDR_DTYPE)
+    return unique_sorted(np.concatenate([np.zeros(0, dtype=ADDR_DTYPE)] + list(IterPatterns(TS))))
+
+
+def ExpandDims(values, dims, m=4, start=0, stop=None):
+    """
+    将地址向量矩阵中的指定维度展开为所有可能的取值组合
+
+    Args：
+        values：地址向量矩阵（指定维度上的值被忽略）
+        dims：待展开的维度（从0开始）
+        m：地址向量的每一维度代表的二进制数长度
+        start, stop：只生成编号在[start, stop)区间内的取值组合（默认为全部）
+
+    Return:
+        new_values：展开后的地址向量矩阵，每个向量的所有组合连续排列，
+                    前面的维度变化较慢
     """
 
-    if seq == []:
-        return set()
+    count = 2 ** (m * len(dims))
+    stop = count if stop == None else stop
+    idx = np.tile(np.arange(start, stop), len(values))
+    new_values = np.repeat(values, stop - start, axis=0)
+    for j, dim in enumerate(dims):
+        new_values[:, dim] = (idx >> (m * (len(dims) - 1 - j))) & (2 ** m - 1)
+    return new_values
 
-    m = int(128/len(seq[0])) #地址向量的每一维度代表的二进制数长度
-    seq = deepcopy(seq)
-    value = 0   # 地址对应的整数值   
-    # addr_set = set()
-    addr_list = []
-    a_vec = seq[0]  # 一个地址向量，用于判断哪个维度被Expand过
-                    # (列表中所有向量被Expand的维度都是相同的)
-    vec_dim = len(a_vec)   # 地址向量的维数
 
-    for i in range(vec_dim):
-        if a_vec[i] == -1: # i维度被Expand，需要在列表中增加地址
-            seq = SeqExpand(seq, i, m)
+def IterPatterns(TS, chunk=1 << 16):
+    """
+    逐块展开TS，每块最多chunk个地址（单个向量的展开结果超过chunk时按组合编号分块），
+    内存占用与TS的展开规模无关
 
-    for vector in seq:
-        for v_i in vector:
-            value = value * (2 ** m) + v_i
-        addr = ipaddress.IPv6Address(value)
-        # addr_set.add(str(addr))
-        addr_list.append(str(addr))
-        value = 0
+    Args：
+        TS：(mask, values)
+        chunk：每块的地址数上限
+
+    Return:
+        生成器，依次产生IPv6地址数组
+    """
+
+    mask, values = TS
+    m = int(128 / len(mask)) #地址向量的每一维度代表的二进制数长度
+    free = np.flatnonzero(~mask)   # 被Expand的维度（所有向量被Expand的维度都是相同的）
+    count = 2 ** (m * len(free))
+    zero = np.zeros((1, len(mask)), dtype=values.dtype)
+
+    # 被Expand的维度在values中为0，与组合的偏移按位或即可得到展开后的地址
+    base = VecsToAddrs(values, m)
+    if count >= chunk:
+        for b in base:
+            for start in range(0, count, chunk):
+                offset = VecsToAddrs(ExpandDims(zero, free, m, start, min(start + chunk, count)), m)
+                offset['hi'] |= b['hi']
+                offset['lo'] |= b['lo']
+                yield offset
+        return
+    offset = VecsToAddrs(ExpandDims(zero, free, m), m)
+    rows = chunk // count
+    for i in range(0, len(base), rows):
+        addrs = np.zeros(len(base[i:i + rows]) * count, dtype=ADDR_DTYPE)
+        addrs['hi'] = (base['hi'][i:i + rows, None] | offset['hi'][None, :]).ravel()
+        addrs['lo'] = (base['lo'][i:i + rows, None] | offset['lo'][None, :]).ravel()
+        yield addrs
+
+
+def PatternSize(TS):
+    """
+    TS（或以同样形式表示的SS）展开后的地址个数
+    """
 
-    # return addr_set
-    return addr_list
+    if TS is None:
+        return 0
+    mask, values = TS
+    m = int(128 / len(mask))
+    return len(values) * 2 ** (m * int((~mask).sum()))
+
+
+def UnionPatterns(TS_list):
+    """
+    计算多个模式集合的并集：将各集合中其余集合固定的维度展开，
+    使所有向量的被Expand的维度相同，再去重
+
+    Args：
+        TS_list：(mask, values)列表，可以包含None（空集合）
+
+    Return：
+        并集(mask, values)，所有集合均为空时为None
+    """
+
+    TS_list = [TS for TS in TS_list if TS is not None]
+    if TS_list == []:
+        return None
+    mask = np.logical_or.reduce([TS[0] for TS in TS_list])
+    m = int(128 / len(mask))
+    values = []
+    for TS_mask, TS_values in TS_list:
+        values.append(ExpandDims(TS_values, np.flatnonzero(mask & ~TS_mask), m))
+    return (mask, UniqueRows(np.concatenate(values)))
+
+
+def UniqueRows(values):
+    """
+    删除地址向量矩阵中重复的向量，结果按字典序排列
+    """
+
+    rows = np.ascontiguousarray(values).view(np.dtype((np.void, values.dtype.itemsize * values.shape[1])))
+    return np.unique(rows).view(values.dtype).reshape(-1, values.shape[1])
 
 
 def get_rawIP(IP):
@@ -167,28 +304,6 @@ def get_rawIP(IP):
     return rawIP
 
     
-def SeqExpand(seq, idx, m=4):
-    """
-    将列表seq中所有向量的idx维度上的-1还原为1-2^m区间内的所有数
-
-    Args：
-        seq：待还原的地址向量列表
-        idx：待还原的维度（从0开始）
-        m:地址向量的每一维度代表的二进制数长度
-
-    Return:
-        new_seq：更新后的地址向量列表
-    """
-    
-    new_seq = []
-    for vector in seq:
-        for v in range(2 ** m):
-            vector[idx] = v
-            new_seq.append(deepcopy(vector))
-    
-    return new_seq
-
-
 # def SortVecList(V):
 #     """
 #     对地址向量列表进行快速排序
@@ -0,0 +1,147 @@
+#!/usr/bin/python3.6
+# encoding:utf-8
+import argparse
+import random
+import time
+import numpy as np
+from Definitions import TreeNode, NodeQueue, Intersection
+from AddrsToSeq import PatternSize
+from DynamicScan import InitializeNodeQueue, TakeOutFrontSegment, ReplaceDescendants, MergeSort
+
+"""
+结点调度（优先队列）的性能测试，不进行实际扫描：
+python3 BenchQueue.py --nodes 100000 1000000 --rounds 10 [--baseline]
+"""
+
+
+def BuildTree(leaf_num, fanout=16, seed=0):
+    """
+    生成一棵两层的模拟空间树，叶结点的DS在弹出若干维度后与父结点相同，
+    从而在调度过程中触发ReplaceDescendants
+
+    Args：
+        leaf_num：叶结点个数
+        fanout：每个中间结点的孩子个数
+
+    Return：
+        root：模拟空间树的根结点
+    """
+
+    rnd = random.Random(seed)
+    vecs = np.zeros((0, 32), dtype=np.uint8)
+    root = TreeNode(vecs, 0, 0)
+    root.DS.stack = list(range(1, 33))
+    for i in range(0, leaf_num, fanout):
+        parent = TreeNode(vecs, 0, 0, _partent=root)
+        parent.DS.stack = rnd.sample(range(1, 33), 24)
+        root.childs.append(parent)
+        for j in range(min(fanout, leaf_num - i)):
+            leaf = TreeNode(vecs, 0, 0, _partent=parent)
+            extra = [d for d in range(1, 33) if d not in parent.DS.stack]
+            leaf.DS.stack = parent.DS.stack + rnd.sample(extra, rnd.randint(1, 8))
+            values = np.zeros((1, 32), dtype=np.uint8)
+            values[0, -8:] = [(i + j) >> (4 * k) & 0xf for k in range(7, -1, -1)]
+            leaf.SS = (np.ones(32, dtype=bool), values)
+            parent.childs.append(leaf)
+    return root
+
+
+def Feedback(xi_h, rnd):
+    """
+    模拟一次扫描反馈：更新结点的NDA、AAD并弹出DS，返回按AAD排序的结点队列
+    """
+
+    for node in xi_h:
+        node.NDA += rnd.randint(0, 3)
+        node.AAD = float(node.NDA) / max(PatternSize(node.SS), 1)
+        if node.DS.stack:
+            node.DS.pop()
+    return sorted(xi_h, key=lambda node: node.AAD, reverse=True)
+
+
+def LegacyReplaceDescendants(xi, xi_h):
+    # 基于列表的旧实现（Intersection + list.remove），仅用于对比
+    new_nodes = set()
+    for node in xi_h:
+        if node.parent.DS.stack == node.DS.stack:
+            new_nodes.add(node.parent)
+    complete_queue = set(xi_h + xi)
+    for node in sorted(new_nodes, key=lambda node: node.node_id):
+        retired = complete_queue.intersection(set(node.childs))
+        for retired_node in retired:
+            node.NDA += retired_node.NDA
+        for v in Intersection(retired, xi_h):
+            xi_h.remove(v)
+        for v in Intersection(retired, xi):
+            xi.remove(v)
+        for v in Intersection(retired, new_nodes):
+            new_nodes.remove(v)
+    for new_node in sorted(new_nodes, key=lambda node: node.node_id):
+        xi_h.append(new_node)
+
+
+def LegacyMergeSort(xi_h, xi):
+    # 基于列表的旧实现：逐个比较归并两个有序列表，仅用于对比
+    queue = []
+    i1 = i2 = 0
+    while i1 < len(xi_h) and i2 < len(xi):
+        if xi_h[i1].AAD >= xi[i2].AAD:
+            queue.append(xi_h[i1])
+            i1 += 1
+        else:
+            queue.append(xi[i2])
+            i2 += 1
+    return queue + xi_h[i1:] + xi[i2:]
+
+
+def Bench(leaf_num, rounds, baseline=False):
+    """
+    对leaf_num个叶结点的模拟空间树执行rounds次调度迭代，返回每次迭代的耗时（秒）
+    """
+
+    rnd = random.Random(1)
+    root = BuildTree(leaf_num)
+    times = []
+    if baseline:
+        xi = []
+        q = [root]
+        while q:
+            node = q.pop()
+            if node.childs:
+                q += node.childs
+            else:
+                xi.append(node)
+        xi = Feedback(xi, rnd)
+        for _ in range(rounds):
+            t_start = time.time()
+            m = int(0.1 * len(xi)) + 1
+            xi_h, xi = xi[:m], xi[m:]
+            LegacyReplaceDescendants(xi, xi_h)
+            xi = LegacyMergeSort(Feedback(xi_h, rnd), xi)
+            times.append(time.time() - t_start)
+    else:
+        xi = NodeQueue()
+        InitializeNodeQueue(root, xi)
+        xi = MergeSort(Feedback(TakeOutFrontSegment(xi, len(xi)), rnd), xi)
+        for _ in range(rounds):
+            t_start = time.time()
+            xi_h = TakeOutFrontSegment(xi, int(0.1 * len(xi)) + 1)
+            ReplaceDescendants(xi, xi_h)
+            xi = MergeSort(Feedback(xi_h, rnd), xi)
+            times.append(time.time() - t_start)
+    return times
+
+
+if __name__ == '__main__':
+    parse = argparse.ArgumentParser()
+    parse.add_argument('--nodes', type=int, nargs='+', default=[100000, 1000000], help='number of leaf nodes')
+    parse.add_argument('--rounds', type=int, default=10, help='number of scheduling iterations')
+    parse.add_argument('--baseline', action='store_true', help='also run the list-based scheduler')
+    args = parse.parse_args()
+
+    for leaf_num in args.nodes:
+        variants = [('heap', False)] + ([('list', True)] if args.baseline else [])
+        for name, baseline in variants:
+            times = Bench(leaf_num, args.rounds, baseline)
+            print('[+]{} nodes ({}): {:.3f} s per iteration (min {:.3f} s, max {:.3f} s)'
+                .format(leaf_num, name, sum(times) / len(times), min(times), max(times)))
@@ -1,7 +1,7 @@
 from Definitions import Stack,TreeNode
 from AddrsToSeq import AddrVecList,InputAddrs
 import math
-from copy import deepcopy
+import numpy as np
 
 '''
 使用DHC 算法成成一颗空间树
@@ -20,7 +20,7 @@ def SpaceTreeGen(IPS, delta=16,beta=16):
     Return：
         root：空间树的根结点
     '''
-    root=TreeNode(IPS)
+    root=TreeNode(np.array(IPS))
     DHC(root,beta,delta)
 
     return root
@@ -43,9 +43,9 @@ def DHC(node,beta,delta):
         return
 
     node.diff_delta=best_position
-    dic_key_ips=SplitVecSeq(node,best_position)
-    for key in dic_key_ips:
-        new_node=TreeNode(dic_key_ips[key],_partent=node)
+    bounds=SplitVecSeq(node,best_position)
+    for start,end in zip(bounds[:-1],bounds[1:]):
+        new_node=TreeNode(node.vecs,start,end,_partent=node)
         node.childs.append(new_node)
     for child in node.childs:
         DHC(child,beta,delta)
@@ -54,16 +54,16 @@ def DHC(node,beta,delta):
 
 def SplitVecSeq(node,best_position):
     '''
-    将node.iplist分割成不同的list
-    返回字典形式 {"1","{ip1,ip2}}"}
+    按best_position维度上的取值对node的向量区间做稳定划分（原地重排），
+    使每个子结点的向量在矩阵中连续，子结点按取值首次出现的顺序排列
+    返回子结点区间的边界 [start, ..., end]
     '''
-    dic_key_ips={}
-    for ip in node.iplist:
-        if ip[best_position-1] in dic_key_ips:
-            dic_key_ips[ip[best_position-1]].append(ip)
-        else:
-            dic_key_ips[ip[best_position-1]]=[ip]
-    return dic_key_ips
+    column=node.iplist[:,best_position-1]
+    _,first,inverse=np.unique(column,return_index=True,return_inverse=True)
+    rank=np.argsort(np.argsort(first))[inverse]
+    node.vecs[node.start:node.end]=node.iplist[np.argsort(rank,kind='stable')]
+    counts=np.bincount(rank)
+    return [node.start]+(node.start+np.cumsum(counts)).tolist()
 
 
 def OutputSpaceTree(root):
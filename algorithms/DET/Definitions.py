@@ -1,7 +1,10 @@
 #!/usr/bin/python3.6
 # encoding:utf-8
-from copy import deepcopy
-import math
+import math, os, sys, heapq
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from addr_utils import ADDR_DTYPE, addr_keys
+from AddrsToSeq import VecsToAddrs, UniqueRows
 
 
 class Stack(object):
@@ -33,35 +36,125 @@ class Stack(object):
     def find(self, v):
         return v in self.stack
 
+    def copy(self):
+        stack = Stack()
+        stack.stack = list(self.stack)
+        return stack
+
+
+class NodeQueue(object):
+    """
+    结点优先队列ξ(以node_id为索引的二叉堆)
+
+    结点按AAD降序出队；AAD相同时，后入队批次的结点在前，同一批次内保持入队顺序，
+    与对整个队列做稳定排序再归并的出队顺序相同。
+    更新结点的优先级或删除结点时只修改索引，堆中过期的条目在出队时跳过（惰性删除）
+    """
+
+    def __init__(self):
+        self.heap = []      # (优先级, node_id)
+        self.entries = {}   # node_id -> (优先级, 结点)
+        self.batch = 0      # 入队批次计数
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, node):
+        return node.node_id in self.entries
+
+    def push(self, node, key):
+        """
+        结点入队，若结点已在队列中则更新其优先级
+        """
+        self.entries[node.node_id] = (key, node)
+        heapq.heappush(self.heap, (key, node.node_id))
+        if len(self.heap) > 2 * len(self.entries) + 1024:
+            self.compact()
+
+    def extend(self, nodes):
+        """
+        将一批结点作为一个批次入队
+
+        Args：
+            nodes：按AAD降序排列的结点列表
+        """
+        self.batch += 1
+        for i, node in enumerate(nodes):
+            self.push(node, (-node.AAD, -self.batch, i))
+
+    def remove(self, node):
+        self.entries.pop(node.node_id, None)
+
+    def pop(self):
+        while self.heap:
+            key, node_id = heapq.heappop(self.heap)
+            entry = self.entries.get(node_id)
+            if entry is not None and entry[0] == key:
+                del self.entries[node_id]
+                return entry[1]
+        raise LookupError('Queue is empty!')
+
+    def pop_front(self, m):
+        """
+        取出队列中优先级最高的m个结点
+        """
+        return [self.pop() for _ in range(min(m, len(self.entries)))]
+
+    def compact(self):
+        """
+        重建堆，清除过期的条目
+        """
+        self.heap = [(key, node_id) for node_id, (key, _) in self.entries.items()]
+        heapq.heapify(self.heap)
+
 class TreeNode:
     '''
     空间树的节点
     '''
     global_node_id=0
-    def __init__(self,iplist,_partent=None):
+    def __init__(self,vecs,start=0,end=None,_partent=None):
         if _partent==None:
             self.level=1
         else:
             self.level=_partent.level+1
-        self.iplist=iplist    # 存放ipv6种子地址向量
+        self.vecs=vecs    # 所有种子地址向量组成的矩阵（所有结点共享）
+        self.start=start  # 结点的种子地址向量为vecs[start:end]
+        self.end=len(vecs) if end==None else end
         self.parent=_partent
         self.childs=[]
         TreeNode.global_node_id+=1
         self.node_id=TreeNode.global_node_id #节点编号
         self.diff_delta = 0    #分裂点的维度
         self.DS=Stack()
-        self.TS=[]    # 地址向量列表，每个成员代表一个被Expand的地址向量，
-                      # 被Expand的维度上值为-1
-        self.SS=set() # 扫描过的IPv6地址字符串集合
+        self.TS=None  # (mask, values)：mask标记各维度是否固定（未被Expand），
+                      # values为去重后的地址向量矩阵，被Expand的维度上值为0
+        self.SS=None  # 扫描过的IPv6地址，与TS的形式相同（扫描时TS的副本）
         self.NDA=0    # 命中个数
         self.AAD=0.0  # 命中比例
         self.last_pop=0 #记录DS上次弹出的维度（从1开始）
         self.last_pop_value=0 # 记录DS上一次弹出的值
 
+    @property
+    def iplist(self):
+        # 存放ipv6种子地址向量（共享矩阵的视图，不复制）
+        return self.vecs[self.start:self.end]
 
     def isLeaf(self):
         return self.childs==[]
     
+    def SteadyDims(self):
+        """
+        判断结点中的所有向量序列在每一维度上是否有相同值
+
+        Return：
+            same：布尔数组，第delta-1个元素为True时结点中向量序列在delta维度上熵为0
+        """
+        iplist=self.iplist
+        if len(iplist)==0:
+            print("the node {}  iplist has no seeds".format(self.node_id))
+            exit()
+        return (iplist==iplist[0]).all(axis=0)
+
     def Steady(self,delta):
         """
         判断结点中的所有向量序列是否在维度delta上有相同值
@@ -72,51 +165,44 @@ class TreeNode:
         Return：
             same：结点中向量序列在delta维度上熵为0时为True
         """
-        same=True
-        l=len(self.iplist)
-        if l==0:
-            print("the node {}  iplist has no seeds".format(self.global_node_id))
-            exit()
-        else:
-            v1=self.iplist[0]
-            for v2 in self.iplist:
-                if v1[delta-1]!=v2[delta-1]:
-                    same=False
-                    break
-        return same
+        return bool(self.SteadyDims()[delta-1])
     
 
-    # 计算每一个维度上的熵值
-    def get_entropy(self,i):
-        info_d={} # 统计每个维度频率，保存在字典中。eg:('1'.2)
-        for ip in self.iplist:
-            if ip[i] in info_d:
-                info_d[ip[i]]=info_d[ip[i]]+1
-            else:
-                info_d[ip[i]]=1
-        entropy=0.0
-        p=0.0
-        size=len(self.iplist)
+    # 计算所有维度上的熵值
+    def get_entropies(self):
+        iplist=self.iplist
+        size,dims=iplist.shape
         if size==0:
             exit()
-        for key in info_d:
-            p=float(info_d[key])/size
-            entropy=entropy+(-p*math.log(p))
-        return entropy
+        # 每个(维度,取值)对编码为一个键，按行优先展开时首次出现的位置即逐行统计时的插入顺序
+        base=int(iplist.max())+1
+        key_dtype=np.uint16 if dims*base<=1<<16 else np.int64
+        keys=(iplist.astype(key_dtype)+np.arange(dims,dtype=key_dtype)*key_dtype(base)).ravel()
+        uniq,first,counts=np.unique(keys,return_index=True,return_counts=True)
+        dim=uniq//base
+        order=np.lexsort((first,dim))
+        dim,counts=dim[order],counts[order]
+        rank=np.arange(len(dim))-np.searchsorted(dim,dim)
+        # 各频数对应的熵项与逐项计算时完全相同，按首次出现的顺序依次累加，
+        # 保证熵值（及分裂点的选择）与逐个字典统计的结果一致
+        count_values,inverse=np.unique(counts,return_inverse=True)
+        terms=np.array([-(float(c)/size)*math.log(float(c)/size) for c in count_values])
+        table=np.zeros((dims,rank.max()+1))
+        table[dim,rank]=terms[inverse]
+        return np.cumsum(table,axis=1)[:,-1]
+
+    # 计算每一个维度上的熵值
+    def get_entropy(self,i):
+        return self.get_entropies()[i]
 
 
     # 找出合适的分裂点(返回值为维度值，纬度值减一取相应的值))：熵值不为零，并且上至最小
     def get_splitP(self,delta):
-        best_entropy,best_postion=float("Inf"),-2  
-        for i in range(int(128/math.log(delta,2))):
-            entropy=self.get_entropy(i)
-            if entropy==0:
-                continue
-            else:
-                if best_entropy>entropy:
-                        best_entropy=entropy
-                        best_postion=i
-        return best_postion+1
+        entropies=self.get_entropies()[:int(128/math.log(delta,2))]
+        entropies[entropies==0]=float("Inf")
+        if np.isinf(entropies).all():
+            return -1
+        return int(np.argmin(entropies))+1
 
 
     def ExpandTS(self, delta):
@@ -126,17 +212,20 @@ class TreeNode:
         Args：
             delta：当前需要Expand的维度
         """
-        if self.TS==[]: # 叶结点的TS初始为对应的地址向量子序列
-            for ip in self.iplist:
-                self.TS.append(deepcopy(ip))
+        if self.TS==None: # 叶结点的TS初始为对应的地址向量子序列
+            mask=np.ones(self.iplist.shape[1],dtype=bool)
+            values=self.iplist
+        else:
+            mask,values=self.TS
         self.last_pop=delta
 
-        for v in self.TS:
-            v[delta-1]=-1
+        mask=mask.copy()
+        mask[delta-1]=False
+        values=values.copy()
+        values[:,delta-1]=0
 
         # 删除TS中重复的成员
-        self.TS = list(set([tuple(v) for v in self.TS]))
-        self.TS = [list(v) for v in self.TS]
+        self.TS=(mask,UniqueRows(values))
 
 
     def  OutputNode(self):
@@ -153,7 +242,7 @@ class TreeNode:
         print('Node ID: ',self.node_id)
         print('[+]{} Address(es):'.format(len(self.iplist)))
         for i in self.iplist:
-            print(i)
+            print(i.tolist())
         if self.diff_delta != 0:
             print('[+]Lowest variable dim:%d' % self.diff_delta) 
         print('[+]Parent:', end = ' ')
@@ -170,21 +259,91 @@ class TreeNode:
             print()
         print('[+]DS:')
         print(self.DS.stack)
-        print('[+]TS:')
-        if self.TS == []:
-            print('None')
-        else:
-            for v in self.TS:
-                print(v)
-        print('[+]SS:')
-        if self.SS == []:
-            print('None')
-        else:
-            for v in self.SS:
-                print(v)
+        for name, patterns in (('TS', self.TS), ('SS', self.SS)):
+            print('[+]{}:'.format(name))
+            if patterns == None:
+                print('None')
+            else:
+                mask, values = patterns
+                for v in np.where(mask, values.astype(np.int64), -1):
+                    print(v.tolist())
         print('[+]NDA:', self.NDA)
         print('\n')
 
+class PatternIndex(object):
+    """
+    模式集合(TS/SS)的索引，用于判断地址是否被其中某个模式覆盖
+
+    模式按掩码（被Expand的维度）分组，每组保存被Expand维度置0后的地址（有序），
+    地址只需按组的掩码置0后二分查找。每组内的有序数组按大小成倍合并，
+    因此可以边添加边查询。内存占用与模式个数成正比，与展开后的地址个数无关
+    """
+
+    def __init__(self):
+        self.groups = {}   # 掩码 -> (掩码对应的地址, [(有序的键, 对应的编号)])
+
+    def add(self, TS, owner=0):
+        """
+        添加一个模式集合
+
+        Args：
+            TS：(mask, values)
+            owner：该集合的编号（例如结点在队列中的位置），用于count
+        """
+        if TS == None:
+            return
+        mask, values = TS
+        m = int(128 / len(mask))
+        if mask.tobytes() not in self.groups:
+            mask_vec = np.where(mask, 2 ** m - 1, 0).astype(values.dtype)
+            self.groups[mask.tobytes()] = (VecsToAddrs(mask_vec[None, :], m)[0], [])
+        runs = self.groups[mask.tobytes()][1]
+        keys = np.sort(addr_keys(VecsToAddrs(values, m)))
+        runs.append((keys, np.full(len(keys), owner, dtype=np.int64)))
+        while len(runs) > 1 and len(runs[-2][0]) <= 2 * len(runs[-1][0]):
+            keys, owners = runs.pop()
+            keys = np.concatenate([runs[-1][0], keys])
+            owners = np.concatenate([runs[-1][1], owners])
+            order = np.argsort(keys, kind='stable')
+            runs[-1] = (keys[order], owners[order])
+
+    def matches(self, addrs):
+        """
+        依次返回每组中与addrs匹配的模式区间
+
+        Return：
+            生成器，产生(编号数组, 区间起点, 区间终点)，
+            地址addrs[i]与编号owners[lo[i]:hi[i]]的模式匹配
+        """
+        for mask_addr, runs in self.groups.values():
+            masked = np.zeros(len(addrs), dtype=ADDR_DTYPE)
+            masked['hi'] = addrs['hi'] & mask_addr['hi']
+            masked['lo'] = addrs['lo'] & mask_addr['lo']
+            masked = addr_keys(masked)
+            for keys, owners in runs:
+                yield owners, np.searchsorted(keys, masked, 'left'), np.searchsorted(keys, masked, 'right')
+
+    def contains(self, addrs):
+        """
+        判断每个地址是否被索引中的某个模式覆盖
+        """
+        hit = np.zeros(len(addrs), dtype=bool)
+        for _, lo, hi in self.matches(addrs):
+            hit |= hi > lo
+        return hit
+
+    def count(self, addrs, n):
+        """
+        统计编号为0..n-1的每个模式集合覆盖了addrs中的多少个地址
+        """
+        counts = np.zeros(n, dtype=np.int64)
+        for owners, lo, hi in self.matches(addrs):
+            num = hi - lo
+            idx = np.repeat(lo - np.cumsum(num) + num, num) + np.arange(num.sum())
+            counts += np.bincount(owners[idx], minlength=n)
+        return counts
+
+
 def Intersection(l1,l2):
     '''
     计算两个列表的重复元素
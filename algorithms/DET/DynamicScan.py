@@ -1,13 +1,17 @@
 #!/usr/bin/python3.6
 # encoding:utf-8
-from Definitions import Intersection
-from AddrsToSeq import InputAddrs, SeqToAddrs
+from Definitions import NodeQueue, PatternIndex
+from AddrsToSeq import InputAddrs, IterPatterns, PatternSize, UnionPatterns
 from DHC import SpaceTreeGen, OutputSpaceTree
 from ScanPre import ScanPre
-from ActiveScan import Scan
+from ActiveScan import Scan, SetProber
 from copy import deepcopy
+from collections import deque
 import argparse
 import time
+import numpy as np
+from probe_utils import load_simulated_prober
+from addr_utils import ADDR_DTYPE, V6BIN_EXT, CHUNK_SIZE, V6binWriter, load_v6bin, unique_sorted, format_compressed
 
 """
 sudo python3 DynamicScan.py --input=/home/liguo/ipv6_project/6density/data1.csv --output=/home/liguo/ipv6_project/6density --budget=500  --IPv6=2001:da8:ff:212::10:3 --delta=16 --beta=16
@@ -25,20 +29,22 @@ def DynamicScan(root, budget, source_ip, output_dir):
         output_dir：输出文件目录
 
     Return：
-        R：经扫描发现的活跃地址集合（每个成员为真实的IPv6地址字符串）【序列？】
+        R：经扫描发现的活跃地址数组（有序）
         P：检测到的别名前缀集合
         budget：剩余扫描次数
     """
     # OutputSpaceTree(root,V)
     # R = set()
-    R = set()
-    T = set()
+    R = np.zeros(0, dtype=ADDR_DTYPE)
     init_budget = deepcopy(budget)
     active_file = output_dir + '/6density.result'+str(budget)
     target_file = output_dir + '/6density.target'+str(budget)
-    xi = [] # 待扫描结点队列ξ
+    T = TargetLog(target_file + V6BIN_EXT)  # 所有迭代扫描过的目标地址（写入二进制地址文件）
+    xi = NodeQueue() # 待扫描结点队列ξ
     InitializeNodeQueue(root, xi)
-    xi, budget, R, T = Scan_Feedback(xi, init_budget, budget, R, T, source_ip, output_dir, target_file)
+    xi_h = TakeOutFrontSegment(xi, len(xi))
+    xi_h, budget, R, T = Scan_Feedback(xi_h, init_budget, budget, R, T, source_ip, output_dir, target_file)
+    xi = MergeSort(xi_h, xi)
     
     while budget > 0:
         xi_h = TakeOutFrontSegment(xi, int(0.1 * len(xi))+1)  # 每次迭代需要扫描的结点
@@ -49,11 +55,15 @@ def DynamicScan(root, budget, source_ip, output_dir):
     
     print("begin to store the ip address in {} and {}".format(active_file,target_file))
     with open(active_file, 'w', encoding='utf-8') as f:
-        for addr in R:
+        for addr in format_compressed(R):
             f.write(addr + '\n')
+    # 目标地址在扫描过程中已逐块写入二进制地址文件，文本文件由其逐块转换
+    T.close()
+    T = load_v6bin(target_file + V6BIN_EXT)
     with open(target_file, 'w', encoding='utf-8') as f:
-        for target in T:
-            f.write(target + '\n')
+        for i in range(0, len(T), CHUNK_SIZE):
+            for target in format_compressed(T[i:i + CHUNK_SIZE]):
+                f.write(target + '\n')
     hit_rate = float(len(R))/(init_budget - budget)
     return R, init_budget - budget, len(R), hit_rate
 
@@ -67,14 +77,15 @@ def InitializeNodeQueue(root, xi):
         xi：结点队列ξ
     """
     # pdb.set_trace()
-    q = []
-    q.append(root)
-    while q != []:
-        node = q.pop(0)
+    leaves = []
+    q = deque([root])
+    while q:
+        node = q.popleft()
         if node.childs != []:
-            q += node.childs
+            q.extend(node.childs)
         else:
-            xi.append(node)
+            leaves.append(node)
+    xi.extend(leaves)
 
 
 def Scan_Feedback(xi, init_budget, budget, R, T, source_ip, output_dir, target_file):
@@ -86,8 +97,8 @@ def Scan_Feedback(xi, init_budget, budget, R, T, source_ip, output_dir, target_f
         xi：结点队列ξ
         init_budget：扫描次数上限
         budget：剩余的扫描次数
-        R：经扫描发现的活跃地址集合
-        T
+        R：经扫描发现的活跃地址数组
+        T：所有迭代扫描过的目标地址（TargetLog）
         V:种子地址向量集合
         source_ip
         output_dir
@@ -96,46 +107,33 @@ def Scan_Feedback(xi, init_budget, budget, R, T, source_ip, output_dir, target_f
     Return:
         xi:重新排序后的结点队列ξ
         budget:经过一次迭代扫描之后剩余的扫描次数
-        R：更新后的活跃地址集合
+        R：更新后的活跃地址数组
         T：预测地址集合
     """
 
     # pdb.set_trace()
 
-    TS_addr_union = list()
-    SS_addr_union = list()
-    for i in range(len(xi)):
-        # if i % 100 == 0:
-        #     print(i)
-        node = xi[i]
-        TS_addr_union += SeqToAddrs(node.TS)
-        # print(node.TS)
-        SS_addr_union += list(node.SS)
-
-    C = set(TS_addr_union).difference(set(SS_addr_union)) #本次需要扫描的地址集合
-    budget -= len(C)
-    if budget <= 0:
-        C = LimitBudget(budget, C)
-        budget = 0
-
-    T.update(C)
-    # with open(target_file, 'a', encoding='utf-8') as f:
-    #     for target in C:
-    #         f.write(target + '\n')
-    active_addrs = set(Scan(C, source_ip, output_dir, 0))   #扫描并得到活跃的地址集合
-
-    R.update(active_addrs)
+    C = TargetStream(xi, budget, T) #本次需要扫描的地址（逐块生成）
+    active_addrs = Scan(C, source_ip, output_dir, 0)   #扫描并得到活跃的地址数组
+    budget -= C.count
+
+    R = UnionAddrs([R, active_addrs])
     print('[+]Hit rate:{}   Remaining scan times:{}\n'
        .format(float(len(R)/(init_budget - budget)), budget))
 
+    # 统计每个结点的TS覆盖的活跃地址数
+    TS_index = PatternIndex()
+    for i in range(len(xi)):
+        TS_index.add(xi[i].TS, i)
+    new_active_addrs = TS_index.count(active_addrs, len(xi))
+
     for i in range(len(xi)):
         # if(i % 100 == 0):
         #     print(i)
         node = xi[i]
-        node.SS = set(SeqToAddrs(node.TS))
-        new_active_addrs = active_addrs.intersection(node.SS)
-        node.NDA += len(new_active_addrs)
-        node.AAD = float(node.NDA)/len(node.SS)
+        node.SS = node.TS
+        node.NDA += int(new_active_addrs[i])
+        node.AAD = float(node.NDA)/PatternSize(node.SS)
         delta = node.DS.pop()
         node.ExpandTS(delta)
 
@@ -149,24 +147,17 @@ def TakeOutFrontSegment(xi, m):
     提取结点队列xi中的前m个结点，作为下次扫描的目标结点队列
 
     Args：
-        xi:待分割的队列
+        xi:待分割的优先队列
         m：新目标队列的结点数
 
     Return：
-        xi_h：新的目标队列
+        xi_h：新的目标队列（按优先级排列的结点列表）
     """
 
     # xi_h = deepcopy(xi[:m])
     # pdb.set_trace()
 
-    if m <= len(xi):
-        xi_h = xi[:m]
-        del xi[:m]
-    else:
-        xi_h = xi[:]
-        del xi[:]
-
-    return xi_h
+    return xi.pop_front(m)
 
 
 def ReplaceDescendants(xi, xi_h):
@@ -175,7 +166,7 @@ def ReplaceDescendants(xi, xi_h):
     需要将该结点及其所有的兄弟结点删除，并插入它们的父结点【证  明见Theorom3】
 
     Args：
-        xi：未被扫描的，但在下次扫描中不会被扫描的结点队列
+        xi：未被扫描的，但在下次扫描中不会被扫描的结点（优先队列）
         xi_h：下次将会被扫描的结点队列
     """
 
@@ -189,89 +180,122 @@ def ReplaceDescendants(xi, xi_h):
             node.parent.TS = node.TS
             new_nodes.add(node.parent)
 
-    complete_queue = set(xi_h + xi)
-    # xi_h_set = set(xi_h)
-    # xi_set = set(xi)    #将优先队列先转换为结点集合，方便后续并、交等运算的进行
+    xi_h_set = set(xi_h)
+    xi_h_remove = set()
     count = 0
     # 防止遍历时修改new_nodes，报错RuntimeError: Set changed size during iteration
-    xiugai_nodes = new_nodes.copy()
+    # 按结点编号遍历，使结点的处理和入队顺序与内存地址无关，扫描结果可复现
+    xiugai_nodes = sorted(new_nodes, key=lambda node: node.node_id)
     for node in xiugai_nodes:
         # childs = set(node.cohilds)
         count += 1
         #if count % 100 == 0:
         #    print("new node {}".format(count))
-        childs = set(node.childs)
-        retired = complete_queue.intersection(childs)
-        # retired = Intersection(childs, complete_queue)
+        retired = [child for child in node.childs if child in xi_h_set or child in xi]
+        node.SS = UnionPatterns([node.SS] + [retired_node.SS for retired_node in retired])
         for retired_node in retired:
-            node.SS = node.SS.union(retired_node.SS) 
-            # node.SS  = list(node.SS) + list(retired_node.SS)
             node.NDA += retired_node.NDA
-        # node.SS = set(node.SS)
-        node.AAD = float(node.NDA)/len(node.SS)
-
-        #分别需要从两个队列和new_nodes集合中删除的结点
-        xi_h_remove = Intersection(retired, xi_h)
-        xi_remove = Intersection(retired, xi)
-        new_nodes_remove = Intersection(retired, new_nodes)
-        for v in xi_h_remove:
-            xi_h.remove(v)
-        for v in xi_remove:
+        node.AAD = float(node.NDA)/PatternSize(node.SS)
+
+        #分别从两个队列和new_nodes集合中删除的结点
+        for v in retired:
+            if v in xi_h_set:
+                xi_h_set.remove(v)
+                xi_h_remove.add(v)
             xi.remove(v)
-        for v in new_nodes_remove:
-            new_nodes.remove(v)
+            new_nodes.discard(v)
 
-    for new_node in new_nodes:
-        xi_h.append(new_node)
+    xi_h[:] = [v for v in xi_h if v not in xi_h_remove]
+    # 父结点已在队列中时只保留一份，从xi中取出放入本次扫描
+    for new_node in sorted(new_nodes, key=lambda node: node.node_id):
+        xi.remove(new_node)
+        if new_node not in xi_h_set:
+            xi_h.append(new_node)
 
 
 def MergeSort(xi_h, xi):
     """
-    将两个有序的结点队列合并为一个
+    将扫描后的有序结点队列并入优先队列
 
     Args：
-        xi_h：队列1
-        xi：队列2
+        xi_h：按AAD降序排列的结点队列
+        xi：优先队列
 
     Return：
-        queue：合并后的有序队列
+        xi：合并后的优先队列
     """
 
-    queue = []
-    i1 = 0
-    i2 = 0
-    while i1 < len(xi_h) or i2 < len(xi):
-        if i1 >= len(xi_h):
-            queue += xi[i2:]
-            break
-        elif i2 >= len(xi):
-            queue += xi_h[i1:]
-            break
-        elif xi_h[i1].AAD >= xi[i2].AAD:
-            queue.append(xi_h[i1])
-            i1 += 1
-        else:
-            queue.append(xi[i2])
-            i2 += 1
+    xi.extend(xi_h)
+    return xi
+
+
+class TargetStream(object):
+    """
+    按队列顺序逐个展开结点的TS，逐块生成本次需要扫描的目标地址：
+    跳过本批结点SS中的地址和已生成的地址，生成的地址数达到预算时停止。
+    只保存模式索引，内存占用与结点数成正比，与预算无关
+    """
+
+    def __init__(self, xi, budget, T):
+        """
+        Args：
+            xi：按优先级排列的结点队列
+            budget：剩余的扫描次数
+            T：所有迭代扫描过的目标地址（TargetLog），生成的地址同时写入T
+        """
+        self.xi = xi
+        self.budget = budget
+        self.T = T
+        self.count = 0  # 已生成的地址数
+
+    def __iter__(self):
+        seen = PatternIndex()   # 本批结点的SS以及已展开结点的TS
+        for node in self.xi:
+            seen.add(node.SS)
+        for node in self.xi:
+            for addrs in IterPatterns(node.TS):
+                if self.count >= self.budget:
+                    return
+                addrs = addrs[~seen.contains(addrs)][:self.budget - self.count]
+                self.count += len(addrs)
+                self.T.write(addrs)
+                yield addrs
+            seen.add(node.TS)
+            self.T.add(node.TS)
+
+
+class TargetLog(object):
+    """
+    所有迭代扫描过的目标地址：用模式索引跨迭代去重，
+    首次出现的地址依次追加到二进制地址文件
+    """
+
+    def __init__(self, fn):
+        self.index = PatternIndex()
+        self.writer = V6binWriter(fn)
+
+    def write(self, addrs):
+        self.writer.write(addrs[~self.index.contains(addrs)])
+
+    def add(self, TS):
+        self.index.add(TS)
 
-    return queue
+    def close(self):
+        self.writer.close()
 
 
-def LimitBudget(budget, C):
+def UnionAddrs(addrs_list):
     """
-    将C中超出预算部分的地址删除
+    计算多个IPv6地址数组的并集
 
     Args:
-        budget: 超过预算的地址数的相反数
-        C：下次将要扫描的目标地址集合
+        addrs_list：IPv6地址数组列表
 
     Return:
-        C：经过处理后的目标地址集合
+        有序且去重的IPv6地址数组
     """
 
-    C = list(C)
-    del C[:-budget]
-    return set(C)
+    return unique_sorted(np.concatenate([np.zeros(0, dtype=ADDR_DTYPE)] + list(addrs_list)))
 
 
 def Start():
@@ -282,6 +306,9 @@ def Start():
     parse.add_argument('--IPv6',type=str,help='local IPv6 address')
     parse.add_argument('--delta', type=int, default =16, help='the base of address')
     parse.add_argument('--beta',type=int,default=16,help='the max of node ')
+    parse.add_argument('--simulate', type=str, default=None, help='scan offline against a file of responsive addresses')
+    parse.add_argument('--response-rate', type=float, default=1.0, help='response probability of the simulated addresses')
+    parse.add_argument('--filter', type=str, nargs='*', default=None, help='prefix files excluded from simulated scans (default: zmap blocklist and aliased-prefixes.txt if present)')
     args = parse.parse_args()
     # args.input = '/home/sgl/6density_no_APD/files/source_copy.hex'
     # args.output = '/home/sgl/6density_no_APD/files2'
@@ -293,6 +320,9 @@ def Start():
     # OutputSpaceTree(root)
     print("ipv6 addres to sec begining")
     print(args.input)
+    if args.simulate:
+        # 离线模拟扫描：由真实活跃地址集合应答，不发送探测包
+        SetProber(load_simulated_prober(args.simulate, args.response_rate), args.filter)
     V = InputAddrs(input=args.input, beta=args.delta)
     print("ipv6 addres to sec over")
     print("SpaceTreeGen beginning")
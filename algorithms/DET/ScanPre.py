@@ -3,7 +3,6 @@
 from AddrsToSeq import InputAddrs
 from Definitions import Stack
 from DHC import SpaceTreeGen, OutputSpaceTree
-from copy import deepcopy
 import math
 import pdb
 
@@ -31,14 +30,15 @@ def InitializeDS(node, parent_stack = Stack(), beta=16):
     
     # pdb.set_trace()
     parent=node.parent
-    stack = deepcopy(parent_stack) #注意要将父结点的DS做拷贝
+    stack = parent_stack.copy() #注意要将父结点的DS做拷贝
     if parent !=None:
         stack.push(parent.diff_delta)
 
     vecDim = int(128 / math.log(beta, 2))
+    steady = node.SteadyDims()
 
     for delta in range(1, vecDim + 1):        
-        if node.Steady(delta) and stack.find(delta) == False:
+        if steady[delta - 1] and stack.find(delta) == False:
             stack.push(delta)
 
     if not node.isLeaf():
@@ -101,7 +101,7 @@ install_dependencies_pip() {
     #Utils
     conda create -n utils python=3.9 -y
     conda activate utils
-    pip install pyasn
+    pip install pyasn numpy
     conda deactivate
 
     #6GAN
@@ -452,6 +452,16 @@ download_data() {
     tail -n +2 "$SEEDDIR"/responsive-addresses-backup.txt | shuf --random-source "$ROOTDIR"/rand.txt > "$SEEDDIR"/responsive-addresses.txt
 }
 
+convert_v6bin() {
+    # convert seeds and result address files of the run to the binary .v6bin format
+    conda activate utils
+    find "$SEEDDIR" "$RESDIR" -type f -name "*.txt" | while read -r fn
+    do
+        python3 "$ROOTDIR/scripts/addr_utils.py" "$fn"
+    done
+    conda deactivate
+}
+
 run_all() {
     run_6forest & run_6gan & run_6gcvae & run_6graph & run_6veclm & run_entropy
     wait
@@ -497,6 +507,9 @@ case $1 in
     "CATEGORIZE")
         categorize_data
         ;;
+    "V6BIN")
+        convert_v6bin
+        ;;
     "ALL")
         run_all
         ;;
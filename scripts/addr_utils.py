@@ -0,0 +1,632 @@
+import os
+import sys
+import hashlib
+import argparse
+import ipaddress
+from itertools import islice
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# IPv6 addresses are kept as pairs of unsigned 64 bit integers (upper and
+# lower half), which sort in the same order as the 128 bit address
+ADDR_DTYPE = np.dtype([("hi", "<u8"), ("lo", "<u8")])
+
+# Binary address store (.v6bin)
+# 64 byte header: magic, address count, flags, hash of the source file
+# followed by count addresses in ADDR_DTYPE layout
+V6BIN_EXT = ".v6bin"
+V6BIN_MAGIC = b"V6BIN\x00\x00\x01"
+V6BIN_HEADER = np.dtype([("magic", "S8"), ("count", "<u8"), ("flags", "<u8"), ("source_hash", "u1", 32), ("reserved", "S8")])
+V6BIN_SORTED = 1
+
+MASK64 = (1 << 64) - 1
+
+# Bulk parsing and formatting works on chunks of lines as uint8 byte matrices
+CHUNK_SIZE = 1 << 20
+MAX_ADDR_LEN = 39
+MAX_UINT_LEN = 19
+HEX_CHARS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+COLON = ord(":")
+
+# Lookup table from bytes to nibble values, 16 marks ":", 17 marks the null
+# padding of numpy byte strings and 255 any character not allowed in an address
+HEX_LUT = np.full(256, 255, dtype=np.uint8)
+HEX_LUT[np.frombuffer(b"0123456789abcdef", dtype=np.uint8)] = np.arange(16)
+HEX_LUT[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+HEX_LUT[COLON] = 16
+HEX_LUT[0] = 17
+
+
+# Creates an address array from a list of python integers
+def from_ints(ints):
+    arr = np.zeros(len(ints), dtype=ADDR_DTYPE)
+    arr["hi"] = np.fromiter((v >> 64 for v in ints), dtype=np.uint64, count=len(ints))
+    arr["lo"] = np.fromiter((v & MASK64 for v in ints), dtype=np.uint64, count=len(ints))
+    return arr
+
+
+# Turns a list of str or bytes into a uint8 matrix with one row per stripped
+# token, padded with null bytes to at least width columns
+def _byte_matrix(tokens, width=0):
+    tokens = [t.strip().encode("ascii", "replace") if isinstance(t, str) else t.strip() for t in tokens]
+    chars = np.array(tokens, dtype=bytes)
+    if chars.itemsize < width:
+        chars = chars.astype(f"S{width}")
+    return chars.view(np.uint8).reshape(len(tokens), chars.itemsize)
+
+
+# Builds an address array from a nibble matrix (uint8, N x 32)
+def from_nibbles(nibbles):
+    arr = np.zeros(len(nibbles), dtype=ADDR_DTYPE)
+    nibbles = nibbles.astype(np.uint64)
+    for i in range(16):
+        shift = np.uint64(60 - 4 * i)
+        arr["hi"] |= nibbles[:, i] << shift
+        arr["lo"] |= nibbles[:, i + 16] << shift
+    return arr
+
+
+# Builds an address array from a matrix of the eight 16 bit groups (N x 8)
+def from_hextets(hextets):
+    arr = np.zeros(len(hextets), dtype=ADDR_DTYPE)
+    hextets = hextets.astype(np.uint64)
+    for i in range(4):
+        shift = np.uint64(48 - 16 * i)
+        arr["hi"] |= hextets[:, i] << shift
+        arr["lo"] |= hextets[:, i + 4] << shift
+    return arr
+
+
+# Marks the rows of a flat index array in a mask of n rows
+def _rows_mask(flat_idx, width, n):
+    mask = np.zeros(n, dtype=bool)
+    mask[flat_idx // width] = True
+    return mask
+
+
+# Parses a null padded uint8 matrix with one address per row
+# All work is done on the flattened matrix, an extra null column keeps the
+# rows apart, so neighbouring characters never cross row boundaries
+def _parse_matrix(mat, too_long):
+    n = len(mat)
+    w = min(mat.shape[1], MAX_ADDR_LEN) + 1
+    chars = np.zeros((n, w), dtype=np.uint8)
+    chars[:, :w - 1] = mat[:, :w - 1]
+    too_long = too_long | (mat[:, w - 1:] != 0).any(axis=1)
+    vals = HEX_LUT[chars.ravel()]
+    is_hex = vals < 16
+    is_colon = vals == 16
+    is_end = vals == 17
+    length = w - is_end.reshape(n, w).sum(axis=1)
+
+    invalid = too_long | (length == 0) | _rows_mask(np.flatnonzero(vals == 255), w, n)
+    # null bytes only as padding at the end of a row
+    inner_null = np.flatnonzero(is_end[:-1] & ~is_end[1:])
+    invalid |= _rows_mask(inner_null[inner_null % w != w - 1], w, n)
+    # at most one "::", which also rules out ":::"
+    double = np.flatnonzero(is_colon[:-1] & is_colon[1:])
+    n_double = np.bincount(double // w, minlength=n)
+    invalid |= n_double > 1
+    double_at = np.full(n, len(vals), dtype=np.int64)
+    double_at[double // w] = double
+    # no single colon at the start or the end
+    rows = np.arange(n)
+    last = np.maximum(length - 1, 0)
+    colons = is_colon.reshape(n, w)
+    invalid |= colons[:, 0] & ~colons[:, 1]
+    invalid |= colons[rows, last] & ~colons[rows, np.maximum(last - 1, 0)]
+
+    # groups are runs of hex digits, eight of them or less than eight with "::"
+    starts = np.flatnonzero(is_hex[1:] & ~is_hex[:-1]) + 1
+    if is_hex[0]:
+        starts = np.concatenate([[0], starts])
+    ends = np.flatnonzero(is_hex[:-1] & ~is_hex[1:])
+    group_len = ends - starts + 1
+    group_row = starts // w
+    n_groups = np.bincount(group_row, minlength=n)
+    invalid |= np.where(n_double == 1, n_groups > 7, n_groups != 8)
+    invalid |= _rows_mask(starts[group_len > 4], w, n)
+
+    # value of each group, groups behind "::" are moved to the end
+    group_val = np.zeros(len(starts), dtype=np.uint16)
+    for k in range(3, -1, -1):
+        digit_pos = ends - k
+        digit = vals[np.maximum(digit_pos, 0)].astype(np.uint16)
+        group_val = (group_val << np.uint16(4)) | np.where(digit_pos >= starts, digit, 0).astype(np.uint16)
+    first_group = np.cumsum(n_groups) - n_groups
+    group_idx = np.arange(len(starts)) - first_group[group_row]
+    group_idx += np.where(starts > double_at[group_row], 8 - n_groups[group_row], 0)
+
+    valid = ~invalid
+    sel = valid[group_row]
+    hextets = np.zeros((n, 8), dtype=np.uint16)
+    hextets[group_row[sel], group_idx[sel]] = group_val[sel]
+    arr = from_hextets(hextets)
+
+    # Rare notations (e.g. embedded IPv4) are left to the ipaddress module
+    dotted = np.zeros(n, dtype=bool)
+    dotted[np.flatnonzero(chars.ravel() == ord(".")) // w] = True
+    for i in np.flatnonzero(dotted & ~too_long):
+        try:
+            v = int(ipaddress.IPv6Address(bytes(chars[i]).rstrip(b"\x00").decode()))
+        except ValueError:
+            continue
+        arr[i] = (v >> 64, v & MASK64)
+        valid[i] = True
+    return arr, valid
+
+
+# Parses a list of IPv6 addresses in compressed or exploded notation
+# Returns the address array and a mask of the valid rows, invalid rows are
+# left as :: in the address array
+def parse_bulk(tokens):
+    if len(tokens) == 0:
+        return np.zeros(0, dtype=ADDR_DTYPE), np.zeros(0, dtype=bool)
+    mat = _byte_matrix(tokens)
+    return _parse_matrix(mat, np.zeros(len(mat), dtype=bool))
+
+
+# Splits a text buffer (bytes) into lines and cuts out the given
+# comma-separated field of every line, returns the buffer as uint8 array
+# (terminated by a newline) and the start and end offsets of the fields
+# Lines with less fields get an empty token, surrounding whitespace is stripped
+def _cut_field(buf, field):
+    buf = np.frombuffer(buf, dtype=np.uint8)
+    if buf[-1] != ord("\n"):
+        buf = np.append(buf, np.uint8(ord("\n")))
+    line_end = np.flatnonzero(buf == ord("\n"))
+    line_start = np.concatenate([[0], line_end[:-1] + 1])
+
+    commas = np.append(np.flatnonzero(buf == ord(",")), len(buf))
+    first = np.searchsorted(commas, line_start)
+    if field == 0:
+        start = line_start
+    else:
+        idx = np.minimum(first + field - 1, len(commas) - 1)
+        start = np.minimum(commas[idx] + 1, line_end)
+    end = np.minimum(commas[np.minimum(first + field, len(commas) - 1)], line_end)
+    end = np.maximum(end, start)
+
+    for _ in range(2):
+        space = (end > start) & np.isin(buf[np.maximum(end - 1, 0)], (9, 13, 32))
+        end[space] -= 1
+        space = (end > start) & np.isin(buf[start], (9, 13, 32))
+        start[space] += 1
+    return buf, start, end
+
+
+# Returns one row of width bytes per field, taken from a sliding window view
+# over the buffer, bytes behind the end of the field are set to zero
+def _field_matrix(buf, start, end, width):
+    padded = np.concatenate([buf, np.zeros(width, dtype=np.uint8)])
+    windows = as_strided(padded, shape=(len(buf), width), strides=(1, 1), writeable=False)
+    mat = windows[start]
+    mat[np.arange(width) >= (end - start)[:, None]] = 0
+    return mat
+
+
+# Parses the given comma-separated field of every line of a text buffer
+# (bytes), returns the address array and a mask of the valid lines
+def parse_buffer(buf, field=0):
+    if len(buf) == 0:
+        return np.zeros(0, dtype=ADDR_DTYPE), np.zeros(0, dtype=bool)
+    buf, start, end = _cut_field(buf, field)
+    mat = _field_matrix(buf, start, end, MAX_ADDR_LEN)
+    return _parse_matrix(mat, end - start > MAX_ADDR_LEN)
+
+
+# Parses the given comma-separated field of every line of a text buffer
+# (bytes) as unsigned decimal number (e.g. an ASN), returns the values and a
+# mask of the valid lines, invalid fields (e.g. "None") are left as 0
+def parse_uint_buffer(buf, field=0):
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    buf, start, end = _cut_field(buf, field)
+    length = end - start
+    mat = _field_matrix(buf, start, end, MAX_UINT_LEN).astype(np.int64) - ord("0")
+    in_field = np.arange(MAX_UINT_LEN) < length[:, None]
+    valid = (length > 0) & (length <= MAX_UINT_LEN) & ((mat >= 0) & (mat <= 9) | ~in_field).all(axis=1)
+    vals = np.zeros(len(mat), dtype=np.uint64)
+    for i in range(MAX_UINT_LEN):
+        vals = np.where(in_field[:, i], vals * np.uint64(10) + np.maximum(mat[:, i], 0).astype(np.uint64), vals)
+    vals[~valid] = 0
+    return vals, valid
+
+
+# Parses a list of addresses written as 32 hex digits without colons
+def parse_hex_bulk(tokens):
+    n = len(tokens)
+    if n == 0:
+        return np.zeros(0, dtype=ADDR_DTYPE), np.zeros(0, dtype=bool)
+    mat = _byte_matrix(tokens, 32)
+    vals = HEX_LUT[mat[:, :32]]
+    valid = (vals < 16).all(axis=1) & (mat[:, 32:] == 0).all(axis=1)
+    arr = from_nibbles(np.where(valid[:, None], vals, 0))
+    return arr, valid
+
+
+# Parses an iterable of text lines into an address array, taking the address
+# from the given comma-separated field. Lines which do not hold a valid IPv6
+# address (e.g. headers) are skipped. Works on chunks of lines at a time
+def parse_addrs(lines, field=0):
+    lines = iter(lines)
+    chunks = [np.zeros(0, dtype=ADDR_DTYPE)]
+    while True:
+        chunk = list(islice(lines, CHUNK_SIZE))
+        if not chunk:
+            break
+        buf = b"\n".join(l.encode("ascii", "replace") if isinstance(l, str) else l for l in chunk)
+        arr, valid = parse_buffer(buf, field)
+        chunks.append(arr[valid])
+    return np.concatenate(chunks)
+
+
+# Reads a text file in blocks of whole lines and yields the address array of
+# every block, parsed from the given field of every line. Lines without a
+# valid address are skipped
+def iter_parse_file(fn, field=0, block_size=1 << 26):
+    rest = b""
+    with open(fn, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            buf = rest + block
+            if block:
+                cut = buf.rfind(b"\n") + 1
+                buf, rest = buf[:cut], buf[cut:]
+            if buf:
+                arr, valid = parse_buffer(buf, field)
+                yield arr[valid]
+            if not block:
+                break
+
+
+# Reads a text file in blocks of whole lines and parses the given field of
+# every line, skipping lines without a valid address
+def parse_file(fn, field=0, block_size=1 << 26):
+    return np.concatenate([np.zeros(0, dtype=ADDR_DTYPE)] + list(iter_parse_file(fn, field, block_size)))
+
+
+# Sorts an address array and removes duplicates
+def unique_sorted(arr):
+    if len(arr) == 0:
+        return np.zeros(0, dtype=ADDR_DTYPE)
+    arr = arr[np.lexsort((arr["lo"], arr["hi"]))]
+    keep = np.ones(len(arr), dtype=bool)
+    keep[1:] = (arr["hi"][1:] != arr["hi"][:-1]) | (arr["lo"][1:] != arr["lo"][:-1])
+    return arr[keep]
+
+
+# Hashes a file in chunks, used to detect stale .v6bin files
+def file_hash(fn):
+    h = hashlib.blake2b(digest_size=32)
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 24), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+# Writes an address array to a .v6bin file (file name or binary file object)
+def save_v6bin(arr, fn, is_sorted=True, source_hash=b""):
+    header = np.zeros(1, dtype=V6BIN_HEADER)
+    header["magic"] = V6BIN_MAGIC
+    header["count"] = len(arr)
+    header["flags"] = V6BIN_SORTED if is_sorted else 0
+    header["source_hash"] = np.frombuffer(source_hash.ljust(32, b"\x00"), dtype=np.uint8)
+    if not isinstance(fn, str):
+        fn.write(header.tobytes())
+        fn.write(np.ascontiguousarray(arr, dtype=ADDR_DTYPE).tobytes())
+        return
+    with open(fn, "wb") as fw:
+        save_v6bin(arr, fw, is_sorted, source_hash)
+
+
+# Writes a .v6bin file incrementally, e.g. while addresses are generated.
+# The address count in the header is filled in by close()
+class V6binWriter:
+    def __init__(self, fn, is_sorted=False, source_hash=b""):
+        self.fn = fn
+        self.count = 0
+        self.fw = open(fn, "wb")
+        save_v6bin(np.zeros(0, dtype=ADDR_DTYPE), self.fw, is_sorted, source_hash)
+
+    def write(self, arr):
+        self.fw.write(np.ascontiguousarray(arr, dtype=ADDR_DTYPE).tobytes())
+        self.count += len(arr)
+
+    def close(self):
+        self.fw.seek(V6BIN_HEADER.fields["count"][1])
+        self.fw.write(np.uint64(self.count).tobytes())
+        self.fw.close()
+
+
+# Reads the header of a .v6bin file, returns count, sortedness and source hash
+def read_v6bin_header(fn):
+    header = np.fromfile(fn, dtype=V6BIN_HEADER, count=1)
+    if len(header) == 0 or header["magic"][0] != V6BIN_MAGIC:
+        raise ValueError(f"{fn} is not a v6bin file")
+    return int(header["count"][0]), bool(header["flags"][0] & V6BIN_SORTED), header["source_hash"][0].tobytes()
+
+
+# Maps the addresses of a .v6bin file read-only into memory without copying
+def load_v6bin(fn):
+    count, _, _ = read_v6bin_header(fn)
+    if count == 0:
+        return np.zeros(0, dtype=ADDR_DTYPE)
+    return np.memmap(fn, dtype=ADDR_DTYPE, mode="r", offset=V6BIN_HEADER.itemsize, shape=(count,))
+
+
+# Loads a file of addresses into a sorted and deduplicated address array
+# Accepts .v6bin files as well as text files (one address per line, optionally CSV)
+def load_addrs(fn, field=0):
+    if fn.endswith(V6BIN_EXT):
+        _, is_sorted, _ = read_v6bin_header(fn)
+        arr = load_v6bin(fn)
+        return arr if is_sorted else unique_sorted(arr)
+    return unique_sorted(parse_file(fn, field))
+
+
+# Returns the path of the .v6bin file kept for a text file, either right next
+# to it or, if a cache directory is given, inside that directory
+def v6bin_path(fn, cachedir=None):
+    if not cachedir:
+        return fn + V6BIN_EXT
+    return os.path.join(cachedir, os.path.abspath(fn).strip("/").replace("/", "_") + V6BIN_EXT)
+
+
+# Like load_addrs, but keeps a .v6bin copy of parsed text files and maps it
+# on later calls as long as the hash of the text file did not change
+def load_addrs_cached(fn, field=0, cachedir=None):
+    if fn.endswith(V6BIN_EXT):
+        return load_addrs(fn)
+    fn_bin = v6bin_path(fn, cachedir)
+    source_hash = file_hash(fn)
+    if os.path.isfile(fn_bin):
+        _, is_sorted, cached_hash = read_v6bin_header(fn_bin)
+        if is_sorted and cached_hash == source_hash:
+            return load_v6bin(fn_bin)
+    arr = load_addrs(fn, field)
+    save_v6bin(arr, fn_bin, source_hash=source_hash)
+    return arr
+
+
+# Writes a nibble matrix (see to_nibbles) to a .npy file incrementally, e.g.
+# while a seed file is parsed chunk by chunk. The row count in the header is
+# filled in by close(), the header keeps its size for any row count
+class NibbleWriter:
+    def __init__(self, fn):
+        self.fn = fn
+        self.count = 0
+        self.fw = open(fn, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        np.lib.format.write_array_header_1_0(self.fw, {"descr": "|u1", "fortran_order": False, "shape": (self.count, 32)})
+
+    def write(self, arr):
+        self.fw.write(np.ascontiguousarray(to_nibbles(arr)).tobytes())
+        self.count += len(arr)
+
+    def close(self):
+        size = self.fw.tell()
+        self.fw.seek(0)
+        self._write_header()
+        self.fw.seek(size)
+        self.fw.close()
+
+
+# Maps the nibble matrix of a .npy file written by NibbleWriter read-only
+def load_nibbles(fn):
+    return np.load(fn, mmap_mode="r")
+
+
+# Yields batches of row indices of n rows, shuffled for every pass if a random
+# state is given. The indices of a batch are sorted, so batches gathered from a
+# memory mapped matrix read the file front to back
+def index_batches(n, batch_size, rng=None, drop_last=False):
+    index = rng.permutation(n) if rng is not None else np.arange(n)
+    stop = n - n % batch_size if drop_last else n
+    for i in range(0, stop, batch_size):
+        yield np.sort(index[i:i + batch_size])
+
+
+# Returns big-endian 16 byte keys of an address array. They sort like the
+# addresses, but binary searches on them are much faster than on the
+# structured array
+def addr_keys(arr):
+    keys = np.empty((len(arr), 2), dtype=">u8")
+    keys[:, 0] = arr["hi"]
+    keys[:, 1] = arr["lo"]
+    return keys.view("S16").ravel()
+
+
+# Binary search of addresses in a sorted address array, see np.searchsorted
+def searchsorted_addrs(ref, arr, side="left"):
+    return np.searchsorted(addr_keys(ref), addr_keys(arr), side=side)
+
+
+# Returns a mask of all elements of arr which are contained in the
+# sorted and deduplicated address array ref
+def isin_sorted(arr, ref):
+    if len(ref) == 0 or len(arr) == 0:
+        return np.zeros(len(arr), dtype=bool)
+    idx = searchsorted_addrs(ref, arr)
+    idx[idx == len(ref)] = 0
+    return ref[idx] == arr
+
+
+# Set operations on sorted and deduplicated address arrays, results stay sorted
+def intersect_sorted(arr1, arr2):
+    return arr1[isin_sorted(arr1, arr2)]
+
+
+def difference_sorted(arr1, arr2):
+    return arr1[~isin_sorted(arr1, arr2)]
+
+
+# Set of addresses which grows while it is queried, e.g. to drop seeds and
+# duplicates from generated candidates on the fly. The addresses are kept as
+# sorted runs of addr_keys, a new run is merged into the previous one as long
+# as that one is at most twice as large, so only O(log n) runs are searched
+class AddrSet:
+    def __init__(self, arr=None):
+        self.runs = []
+        if arr is not None:
+            self.add(arr)
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    # Membership of a sorted key array, sorted queries keep the binary
+    # searches cache friendly
+    def _contains_sorted(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            idx = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            found |= run[idx] == keys
+        return found
+
+    def contains(self, arr):
+        keys = addr_keys(arr)
+        order = np.argsort(keys, kind="stable")
+        found = np.zeros(len(arr), dtype=bool)
+        found[order] = self._contains_sorted(keys[order])
+        return found
+
+    # Adds the addresses of arr, returns the mask of the addresses which were
+    # not in the set before (only the first one of repeated addresses)
+    def add(self, arr):
+        keys = addr_keys(arr)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        first &= ~self._contains_sorted(keys)
+        new = np.zeros(len(arr), dtype=bool)
+        new[order] = first
+        if first.any():
+            self.runs.append(keys[first])
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            run = self.runs.pop()
+            self.runs[-1] = np.sort(np.concatenate([self.runs[-1], run]), kind="stable")
+        return new
+
+
+# Splits an address array into a nibble matrix (uint8, N x 32)
+def to_nibbles(arr):
+    nibbles = np.zeros((len(arr), 32), dtype=np.uint8)
+    for i in range(16):
+        shift = np.uint64(60 - 4 * i)
+        nibbles[:, i] = (arr["hi"] >> shift) & np.uint64(0xf)
+        nibbles[:, i + 16] = (arr["lo"] >> shift) & np.uint64(0xf)
+    return nibbles
+
+
+# Turns a uint8 matrix of characters into a list of strings
+def _to_strings(chars):
+    chars = np.ascontiguousarray(chars)
+    return chars.view(f"S{chars.shape[1]}").ravel().astype(str).tolist()
+
+
+# Formats an address array as 32 hex digits without colons
+def format_hex(arr):
+    if len(arr) == 0:
+        return []
+    return _to_strings(HEX_CHARS[to_nibbles(arr)])
+
+
+# Formats an address array as exploded IPv6 address strings
+def format_exploded(arr):
+    if len(arr) == 0:
+        return []
+    chars = np.full((len(arr), MAX_ADDR_LEN), COLON, dtype=np.uint8)
+    digits = HEX_CHARS[to_nibbles(arr)].reshape(len(arr), 8, 4)
+    for g in range(8):
+        chars[:, g * 5:g * 5 + 4] = digits[:, g]
+    return _to_strings(chars)
+
+
+# Formats an address array as compressed IPv6 address strings (RFC 5952,
+# same output as the ipaddress module): leading zeros of each group are
+# dropped and the leftmost longest run of at least two zero groups becomes "::"
+def format_compressed(arr):
+    n = len(arr)
+    if n == 0:
+        return []
+    nibbles = to_nibbles(arr).reshape(n, 8, 4)
+    zero = (nibbles == 0).all(axis=2)
+
+    # longest run of zero groups, leftmost on ties
+    run = np.zeros((n, 8), dtype=np.int64)
+    run[:, 0] = zero[:, 0]
+    for g in range(1, 8):
+        run[:, g] = np.where(zero[:, g], run[:, g - 1] + 1, 0)
+    run_len = run.max(axis=1)
+    run_end = np.argmax(run == run_len[:, None], axis=1)
+    compress = run_len > 1
+    run_start = run_end - run_len + 1
+    groups = np.arange(8)
+    in_run = compress[:, None] & (groups >= run_start[:, None]) & (groups <= run_end[:, None])
+
+    # slots: leading colon, then per group four digits and a colon, trailing colon
+    chars = np.full((n, 1 + 8 * 5), COLON, dtype=np.uint8)
+    keep = np.zeros((n, 1 + 8 * 5), dtype=bool)
+    keep[:, 0] = compress & (run_start == 0)
+    first_digit = np.argmax(np.concatenate([nibbles[:, :, :3] != 0, np.ones((n, 8, 1), dtype=bool)], axis=2), axis=2)
+    for g in range(8):
+        base = 1 + g * 5
+        chars[:, base:base + 4] = HEX_CHARS[nibbles[:, g]]
+        keep[:, base:base + 4] = ~in_run[:, g, None] & (np.arange(4) >= first_digit[:, g, None])
+        # the colon behind a group, only the last group of the run keeps it
+        keep[:, base + 4] = ~in_run[:, g] | (g == run_end)
+    keep[:, 1 + 7 * 5 + 4] = compress & (run_end == 7)
+
+    out = np.zeros((n, MAX_ADDR_LEN), dtype=np.uint8)
+    out_pos = np.cumsum(keep, axis=1) - 1
+    out_rows, _ = np.nonzero(keep)
+    out[out_rows, out_pos[keep]] = chars[keep]
+    return _to_strings(out)
+
+
+# Converts addresses in any notation to 32 digit hex strings, invalid
+# addresses are dropped
+def text_to_hex(tokens):
+    arr, valid = parse_bulk(tokens)
+    return format_hex(arr[valid])
+
+
+# Converts 32 digit hex strings to exploded addresses, invalid strings are dropped
+def hex_to_text(tokens):
+    arr, valid = parse_hex_bulk(tokens)
+    return format_exploded(arr[valid])
+
+
+# Writes an address array as .v6bin file or as text file with one exploded
+# address per line, depending on the file extension
+def save_addrs(arr, fn, is_sorted=True):
+    if fn.endswith(V6BIN_EXT):
+        save_v6bin(arr, fn, is_sorted=is_sorted)
+        return
+    with open(fn, "w") as fw:
+        for i in range(0, len(arr), CHUNK_SIZE):
+            ips = format_exploded(arr[i:i + CHUNK_SIZE])
+            fw.write("".join(f"{ip}\n" for ip in ips))
+
+
+# Converts address files between text and .v6bin format, e.g.
+# python3 addr_utils.py results.txt results.txt.v6bin
+# python3 addr_utils.py results.txt.v6bin results.txt
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input")
+    parser.add_argument("output", nargs="?", default="")
+    parser.add_argument("--field", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.output:
+        args.output = args.input[:-len(V6BIN_EXT)] if args.input.endswith(V6BIN_EXT) else args.input + V6BIN_EXT
+    arr = load_addrs(args.input, args.field)
+    if args.output.endswith(V6BIN_EXT) and not args.input.endswith(V6BIN_EXT):
+        save_v6bin(arr, args.output, source_hash=file_hash(args.input))
+    else:
+        save_addrs(arr, args.output)
+    print(f"Converted {len(arr)} addresses from {args.input} to {args.output}", file=sys.stderr)
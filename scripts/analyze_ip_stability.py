@@ -1,19 +1,38 @@
+import os
 import argparse
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from timeline_utils import find_files
-from sortedcontainers import SortedSet
+from stability_utils import StabilityTracker, STABILITY_BIN_EXT, load_snapshot, unpack_keys, save_transitions_text
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--base-dir", dest="base_dir", default="hitlist", type=str)
 parser.add_argument("--extension", type=str, default="total")
 parser.add_argument("--limit", type=int, default="0")
 parser.add_argument("--end", type=str, default="")
+parser.add_argument("--append", action="store_true", help="continue from the state file and only apply new dates")
+parser.add_argument("--checkpoint", type=int, default=30, help="write the state file every n dates (0 to disable)")
 parser.add_argument("start", type=str)
 args = parser.parse_args()
 
+outfile = args.start + "." + args.extension + ".ipstability"
+statefile = outfile + STABILITY_BIN_EXT
+
+# In append mode the binary transition log is loaded as state and only the
+# dates after its last date are applied, otherwise everything is recomputed
+# The state is written every few dates, so an interrupted run can be
+# continued with --append
+start = args.start
+if args.append and os.path.isfile(statefile):
+    tracker = StabilityTracker.load(statefile)
+    if tracker.dates:
+        start = (datetime.strptime(tracker.dates[-1], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    print(f"Loaded state with {len(tracker.dates)} dates and {len(tracker.index)} IPs from {statefile}")
+else:
+    tracker = StabilityTracker()
+
 end = None if not args.end else datetime.strptime(args.end, "%Y-%m-%d")
-dates, fps = find_files(args.base_dir, args.extension, args.start, args.limit)
+dates, fps = find_files(args.base_dir, args.extension, start, args.limit, end)
 print(f"Going through {len(dates)} dates")
 
 # Enumerates all files in the directory
@@ -26,44 +45,14 @@ print(f"Going through {len(dates)} dates")
 # and a list of all dates where it has entered/left the hitlist
 # The first is always the date when it was added to the hitlist, every other
 # timestamp marks a change (i.e. online/offline).
+# Each scan is kept as sorted array of dense ids of the (IP, AS) pairs and the
+# changes as binary transition log next to the csv, see stability_utils
 
-ips_total = SortedSet([])
-ips_previous = SortedSet([])
-data = dict()
-for date_ts, fp in zip(dates, fps):
-    with open(fp) as f:
-        try:
-            next(f) # skip header
-            ips = SortedSet([])
-
-            for line in f:
-                ipa, asn = line.strip().split(",")
-                ipkey = f"{ipa},{asn}"
-                ips.add(ipkey)
-        except StopIteration:
-            ips = SortedSet([])
-
-    stayed = ips.intersection(ips_previous)
-    new = ips.difference(ips_previous)
-    gone = ips_previous.difference(ips)
-    readded = new.intersection(ips_total)
-    totally_new = new.difference(ips_total)
-
-    for ip in totally_new:
-        data[ip] = [date_ts]
-
-    for ip in gone:
-        data[ip].append(date_ts)
-
-    for ip in readded:
-        data[ip].append(date_ts)
-
-    ips_previous = ips
-    ips_total = ips_total.union(SortedSet(ips_previous))
-
-    data_output = (len(ips_total), len(ips), len(stayed), len(readded), len(totally_new), len(gone))
+for i, (date_ts, fp) in enumerate(zip(dates, fps), 1):
+    data_output = tracker.update(date_ts, load_snapshot(fp))
     print(f"{date_ts}: {data_output}")
+    if args.checkpoint and i % args.checkpoint == 0 and i < len(dates):
+        tracker.save(statefile)
 
-with open(args.start + "." + args.extension + ".ipstability", "w") as f:
-    for key, val in data.items():
-        f.write(f"{key},{';'.join(val)}\n")
+tracker.save(statefile)
+save_transitions_text(outfile, unpack_keys(tracker.index.keys_by_id()), tracker.dates, *tracker.transitions())
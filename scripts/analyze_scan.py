@@ -1,8 +1,10 @@
 import argparse
-import subprocess
 import os, glob, csv
 import multiprocessing
-import pyasn
+import numpy as np
+from addr_utils import ADDR_DTYPE, V6BIN_EXT, parse_file, load_addrs_cached, unique_sorted, intersect_sorted, difference_sorted, save_addrs
+from prefix_utils import load_prefix_index, filter_index
+from asn_utils import NO_ASN, load_asn_index, count_asns
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--scanresults", nargs="+")
@@ -14,12 +16,13 @@ parser.add_argument("--apdfile", type=str, default="/data/steger-work/aliased-pr
 parser.add_argument("--num-workers", type=int, default=6, dest="num_workers")
 args = parser.parse_args()
 
-asndb = pyasn.pyasn(args.asndb)
-
 # Static values
 WORKERS=args.num_workers
 TMPDIR=args.tmpdir
 
+# Routed prefixes of the pyasn database, indexed once and cached in the tmp directory
+asndb = load_asn_index(args.asndb, cachedir=TMPDIR)
+
 # Paths for candidate sets of algorithms
 genpaths = {
     "6Hit": "6Hit/candidates*",
@@ -40,67 +43,59 @@ genpaths = {
 ###
 
 
-# Takes tuple of input, pattern and output file and filters the input
-# file for the patterns in the pattern file, saving the output to the output file
-def work_grepcidr(files):
-    fn_input, fn_patterns, fn_output = files
-    if not os.path.isfile(fn_output):
-        print("Filtering", fn_input, fn_output)
-        subprocess.run(f"grepcidr -v -f {fn_patterns} {fn_input} > {fn_output}", shell=True, check=True)
-
-
-# Takes tuple of input and output file and takes only the first column of a
-# comma-separated CSV file, writing to the output file
-def work_strip(files):
-    fn_input, fn_output = files
-    if not os.path.isfile(fn_output):
-        print("Stripping", fn_input, fn_output)
-        subprocess.run(f"cat {fn_input} | cut -d , -f 1 > {fn_output}", shell=True, check=True)
-
-# Takes tuple of input and output file and converts all IPv6 addresses in
-# the input file and converts them to long form, writing to output file
-def work_explode_sort(files):
+# Takes tuple of input and output file, loads the addresses of the input file
+# (first column of CSV files), removes all addresses in aliased prefixes and
+# writes the result sorted and in long form to the output file
+def work_filter(files):
     fn_input, fn_output = files
+    addrs = filter_index(apd_index, load_addrs_cached(fn_input, cachedir=TMPDIR))
     if not os.path.isfile(fn_output):
-        print("Exploding", fn_input, fn_output)
-        subprocess.run(f"ipv6exploder {fn_input} | sort -u > {fn_output}", shell=True, check=True)
-
-
-# Takes tuple of input and output file, sorts input file to output file
-def work_sort(files):
+        print("Filtering", fn_input, fn_output)
+        save_addrs(addrs, fn_output)
+    return addrs
+
+
+# Takes tuple of algorithm, category and list of candidate files and computes
+# the sorted candidate set, the candidate set without seeds, its overlap with
+# the static APD filtered scan input and the responsive subset per protocol
+# Everything is computed in memory on the address arrays loaded in the main
+# process, only the resulting sets are written to the tmp directory
+def work_candidates(job):
+    algo, cat, fns_candidate = job
+    fn_output = files_candidates[algo][cat]
+    fns_responsive = [files_candidates_responsive[proto][algo][cat] for proto in protos]
+    fns_all = [fn_output, files_candidates_noseed[algo][cat], files_candidates_noseed_apd[algo][cat]] + fns_responsive
+    if all(os.path.isfile(fn) for fn in fns_all):
+        return
+
+    print("Processing candidates", algo, cat, fns_candidate)
+    candidates = np.concatenate([np.zeros(0, dtype=ADDR_DTYPE)] + [load_addrs_cached(fn, cachedir=TMPDIR) for fn in fns_candidate])
+    candidates = unique_sorted(candidates)
+    candidates_noseed = difference_sorted(candidates, addrs_seeds[cat])
+    candidates_noseed_apd = intersect_sorted(candidates_noseed, addrs_scanfile)
+
+    save_addrs(candidates, fn_output)
+    save_addrs(candidates_noseed, files_candidates_noseed[algo][cat])
+    save_addrs(candidates_noseed_apd, files_candidates_noseed_apd[algo][cat])
+    for proto, fn_responsive in zip(protos, fns_responsive):
+        save_addrs(intersect_sorted(candidates_noseed_apd, addrs_results[proto]), fn_responsive)
+
+
+# Takes tuple of input and output file, loads the addresses of the input file
+# and writes them sorted and in long form to the output file
+def work_load_sort(files):
     fn_input, fn_output = files
+    addrs = load_addrs_cached(fn_input, cachedir=TMPDIR)
     if not os.path.isfile(fn_output):
         print("Sorting", fn_input, fn_output)
-        subprocess.run(f"sort -u {fn_input} > {fn_output}", shell=True, check=True)
+        save_addrs(addrs, fn_output)
+    return addrs
 
 
-# Takes tuple of two input files and output file, writes all lines found in
-# both input files to output file, i.e. computs the intersection
-def work_comm(files):
-    fn_input1, fn_input2, fn_output = files
-    if not os.path.isfile(fn_output):
-        cmd = f"comm -12 {fn_input1} {fn_input2} > {fn_output}"
-        print("Executing", cmd)
-        return subprocess.check_output(cmd, shell=True)
-
-# Takes tuple of two input files and output file, writes all lines found only
-# in input file to output file
-def work_comm_23(files):
-    fn_input1, fn_input2, fn_output = files
-    if not os.path.isfile(fn_output):
-        cmd = f"comm -23 {fn_input1} {fn_input2} > {fn_output}"
-        print("Executing", cmd)
-        return subprocess.check_output(cmd, shell=True)
-
 # Result files processing
-# [result file] -> strip -> [result file].iponly
-# [result file].iponly > static APD filter -> [result file].iponly.apd
-# [result file].iponly.apd -> sort -> [result file].iponly.apd.sortu
+# [result file] -> load first column -> static APD filter -> [result file].iponly.apd.sortu
 protos = []
-scan_res_files = dict()
-cmds_res_strip = []
-cmds_res_sort = []
-cmds_res_apd = []
+cmds_res_filter = []
 for fn_res in args.scanresults:
     # Extract protocol
     proto = fn_res.split(".")[-1]
@@ -108,48 +103,43 @@ for fn_res in args.scanresults:
 
     # File names
     fn_res_target = os.path.join(TMPDIR, os.path.basename(fn_res))
-    fn_res_iponly = f"{fn_res_target}.iponly"
-    fn_res_apd = f"{fn_res_iponly}.apd"
-    fn_res_sorted = f"{fn_res_apd}.sortu"
-    scan_res_files[proto] = fn_res_sorted
-
-    # Commands
-    cmds_res_strip.append((fn_res, fn_res_iponly))
-    cmds_res_apd.append((fn_res_iponly, args.apdfile, fn_res_apd))
-    cmds_res_sort.append((fn_res_apd, fn_res_sorted))
+    cmds_res_filter.append((fn_res, f"{fn_res_target}.iponly.apd.sortu"))
 
 # Scanfile processing
+# [scan file] -> static APD filter -> [scan file].apd.sortu
 scanfile_nonaliased = f"{args.scanfile}"
-scanfile_nonaliased_nonaliased = os.path.join(TMPDIR, f"{os.path.basename(scanfile_nonaliased)}.apd")
-scanfile_nonaliased_sorted = f"{scanfile_nonaliased_nonaliased}.sortu"
+scanfile_nonaliased_nonaliased = os.path.join(TMPDIR, f"{os.path.basename(scanfile_nonaliased)}.apd.sortu")
 
-with multiprocessing.Pool(WORKERS) as p:
-    res = p.map(work_grepcidr, [(scanfile_nonaliased, args.apdfile, scanfile_nonaliased_nonaliased)])
-    res = p.map(work_sort, [(scanfile_nonaliased_nonaliased, scanfile_nonaliased_sorted)])
+# Aliased prefix index, built once and cached in the tmp directory
+apd_index = load_prefix_index([args.apdfile], cachedir=TMPDIR)
 
 
 # Candidate and seed files processing
-# [candidate file] -> sort -> [candidate file].sortu
-# [seed file] -> sort -> [seed file].sortu
-# [candidate file].sortu -> intersection with [seed file].sortu -> [candidate file].sortu.noseed
-# [candidate file].sortu.noseed -> intersection with [scan file].apd.sortu -> [candidate file].sortu.noseed.apd
-# In summary, sorts candidate sets and removes all addresses which were already found in the seed set
+# [seed file] -> load -> [seed file].sortu
+# [candidate file] -> load -> [candidate file].sortu
+# [candidate file].sortu -> without [seed file].sortu -> [candidate file].sortu.noseed
+# [candidate file].sortu.noseed -> intersection with [scan file].apd -> [candidate file].sortu.noseed.apd
+# [candidate file].sortu.noseed.apd -> intersection with [result file].iponly.apd.sortu -> results_[algo]_[cat]_[proto].txt
+# In summary, sorts candidate sets, removes all addresses which were already found in the seed set
+# and computes the responsive subsets of the candidate sets
 algos = list(genpaths.keys())
 cats = set()
 files_candidates = dict()
 files_candidates_noseed = dict()
 files_candidates_noseed_apd = dict()
+files_candidates_responsive = dict()
 files_seeds = dict()
+fns_candidates = dict()
+cats_seed_sort = []
 cmds_seed_sort = []
-cmds_candidate_sort = []
-cmds_candidate_seed_overlap = []
-cmds_candidate_apd_overlap = []
 for algo in genpaths:
-    files_candidates[algo] = dict()
-    files_candidates_noseed[algo] = dict()
-    files_candidates_noseed_apd[algo] = dict()
+    fns_candidates[algo] = dict()
     for gendir in args.gendirs:
         for fn_candidate in glob.glob(f"{gendir}/generation*/results/{genpaths[algo]}"):
+            # Skip .v6bin copies of text candidate files, they are used on load
+            if fn_candidate.endswith(V6BIN_EXT) and os.path.isfile(fn_candidate[:-len(V6BIN_EXT)]):
+                continue
+
             # Extract category
             cat_str = list(filter(lambda x: "generation_" in x, fn_candidate.split("/")))
             if len(cat_str) > 1:
@@ -157,66 +147,49 @@ for algo in genpaths:
             else:
                 cat = cat_str[0].split("_")[2] if len(cat_str[0].split("_")) > 2 else "Full"
             cats.add(cat)
-            
+
             # Process seed file
             seed_file = os.path.join(gendir, cat_str[0], "seeds/responsive-addresses.txt")
             seed_file_sorted = os.path.join(TMPDIR, f"responsive-addresses_{cat}.txt")
             if not cat in files_seeds:
                 files_seeds[cat] = seed_file_sorted
+                cats_seed_sort.append(cat)
                 cmds_seed_sort.append((seed_file, seed_file_sorted))
-            
+
             # Process candidate file
-            fn_candidate_sorted = os.path.join(TMPDIR, f"candidates_{algo}_{cat}.txt.sortu")
-            fn_candidate_sorted_noseed = f"{fn_candidate_sorted}.noseed"
-            fn_candidate_sorted_noseed_apd = f"{fn_candidate_sorted_noseed}.apd"
-            files_candidates[algo][cat] = fn_candidate_sorted
-            files_candidates_noseed[algo][cat] = fn_candidate_sorted_noseed
-            files_candidates_noseed_apd[algo][cat] = fn_candidate_sorted_noseed_apd
-            cmds_candidate_sort.append((fn_candidate, fn_candidate_sorted))
-            cmds_candidate_seed_overlap.append((fn_candidate_sorted, seed_file_sorted, fn_candidate_sorted_noseed))
-            cmds_candidate_apd_overlap.append((fn_candidate_sorted_noseed, scanfile_nonaliased_sorted, fn_candidate_sorted_noseed_apd))
+            fns_candidates[algo].setdefault(cat, []).append(fn_candidate)
+
+# Output file names, missing combinations result in empty files
+jobs_candidates = []
+for algo in algos:
+    files_candidates[algo] = dict()
+    files_candidates_noseed[algo] = dict()
+    files_candidates_noseed_apd[algo] = dict()
+    for cat in cats:
+        fn_candidate_sorted = os.path.join(TMPDIR, f"candidates_{algo}_{cat}.txt.sortu")
+        files_candidates[algo][cat] = fn_candidate_sorted
+        files_candidates_noseed[algo][cat] = f"{fn_candidate_sorted}.noseed"
+        files_candidates_noseed_apd[algo][cat] = f"{fn_candidate_sorted}.noseed.apd"
+        jobs_candidates.append((algo, cat, fns_candidates[algo].get(cat, [])))
 
-with multiprocessing.Pool(WORKERS) as p:
-    res = p.map(work_strip, cmds_res_strip)
-    res = p.map(work_grepcidr, cmds_res_apd)
-    res = p.map(work_explode_sort, cmds_res_sort)
-    res = p.map(work_explode_sort, cmds_seed_sort)
-    res = p.map(work_explode_sort, cmds_candidate_sort)
-    res = p.map(work_comm_23, cmds_candidate_seed_overlap)
-    res = p.map(work_comm, cmds_candidate_apd_overlap)
-
-
-# Candidate result overlap
-# Computs the responsive subsets of the candidate sets
-cmds_comm = []
-files_candidates_responsive = dict()
 for proto in protos:
     files_candidates_responsive[proto] = dict()
     for algo in algos:
         files_candidates_responsive[proto][algo] = dict()
         for cat in cats:
-            comm_out = os.path.join(TMPDIR, f"results_{algo}_{cat}_{proto}.txt")
-            try:
-                candidate_file = files_candidates_noseed_apd[algo][cat]
-            except KeyError:
-                # Create missing combination
-                candidate_file = os.path.join(TMPDIR, f"candidates_{algo}_{cat}.txt.sortu")
-                candidate_file_noseed = f"{candidate_file}.noseed"
-                candidate_file_noseed_apd = f"{candidate_file_noseed}.apd"
-                files_candidates[algo][cat] = candidate_file
-                files_candidates_noseed[algo][cat] = candidate_file_noseed
-                files_candidates_noseed_apd[algo][cat] = candidate_file_noseed_apd
-                open(candidate_file, "w").close()
-                open(candidate_file_noseed, "w").close()
-                open(candidate_file_noseed_apd, "w").close()
-                candidate_file = candidate_file_noseed_apd
-
-            scan_res_file = scan_res_files[proto]
-            files_candidates_responsive[proto][algo][cat] = comm_out
-            cmds_comm.append((scan_res_file, candidate_file, comm_out))
+            files_candidates_responsive[proto][algo][cat] = os.path.join(TMPDIR, f"results_{algo}_{cat}_{proto}.txt")
+
+# Load scan input, scan results and seeds once, the candidate workers share
+# them with the main process
+# Parsed text files are kept as .v6bin files in the tmp directory and only
+# mapped into memory on subsequent runs
+with multiprocessing.Pool(WORKERS) as p:
+    addrs_scanfile = work_filter((scanfile_nonaliased, scanfile_nonaliased_nonaliased))
+    addrs_results = dict(zip(protos, p.map(work_filter, cmds_res_filter)))
+    addrs_seeds = dict(zip(cats_seed_sort, p.map(work_load_sort, cmds_seed_sort)))
 
 with multiprocessing.Pool(WORKERS) as p:
-    res = p.map(work_comm, cmds_comm)
+    res = p.map(work_candidates, jobs_candidates)
 
 def append_as_info(fn):
     fn_target = f"{fn}.ases"
@@ -224,21 +197,12 @@ def append_as_info(fn):
         return 
     
     print("Analysing ASes for", fn)
-    asn_data = dict()
-    with open(fn) as f:
-        for line in f:
-            try:
-                ip = line.strip()
-                asn, _ = asndb.lookup(ip)
-            except:
-                continue
-            if not asn in asn_data:
-                asn_data[asn] = 0
-            asn_data[asn] += 1
+    asns, counts = count_asns(asndb, parse_file(fn))
     
     with open(fn_target, "w") as fw:
-        for asn, val in sorted(asn_data.items(), key=lambda x: x[1], reverse=True):
-            fw.write(f"{asn},{val}\n")
+        for i in np.argsort(-counts, kind="stable"):
+            asn = None if asns[i] == NO_ASN else asns[i]
+            fw.write(f"{asn},{counts[i]}\n")
 
 # Analyzes the ASes found in the different candidate sets and responsive subsets
 # Write the AS and frequency to a separate file
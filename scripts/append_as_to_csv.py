@@ -1,43 +1,128 @@
 import argparse
-import pyasn
 import os
 import re
 import glob
 import lzma
-from datetime import date, timedelta
+import time
+import bisect
+import multiprocessing
+from datetime import date
+import numpy as np
+from addr_utils import parse_buffer
+from asn_utils import NO_ASN, load_asn_index
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--input")
+inputs = parser.add_mutually_exclusive_group(required=True)
+inputs.add_argument("--input", help="single compressed hitlist file")
+inputs.add_argument("--input-dir", dest="input_dir", help="directory which is searched recursively for compressed hitlist files")
+parser.add_argument("--pattern", type=str, default="*.csv.xz", help="file name pattern in --input-dir")
 parser.add_argument("--ip-field", dest="ipfield", type=int, default=0)
 parser.add_argument("--asndb-directory", dest="asndb_root", type=str, default="pyasn")
+parser.add_argument("--cachedir", type=str, help="directory for the cached prefix indexes, defaults to --asndb-directory")
+parser.add_argument("--workers", type=int, default=os.cpu_count())
 parser.add_argument("-o", "--output")
 args = parser.parse_args()
 
-timestamp = re.search("\d{4}\-\d{2}\-\d{2}", args.input).group(0)
-asndb_root = args.asndb_root
-asndb_file = f"{asndb_root}/pyasn-{timestamp}.db"
-
-if not os.path.isfile(asndb_file):
-    ts_parsed = date.fromisoformat(timestamp)
-    ts_curr = ts_parsed
-    while not os.path.isfile(asndb_file):
-        if ts_curr.year < 2018:
-            print("No pyasn file found for date", timestamp)
-            exit()
-        ts_curr = ts_curr - timedelta(days=1)
-        asndb_file = f"{asndb_root}/pyasn-{ts_curr}.db"
-
-print(f"Processing file {args.input}, using db {asndb_file}")
-asndb = pyasn.pyasn(asndb_file)
-
-outfile = ".".join(os.path.basename(args.input).split(".")[:-1])
-
-if args.output:
-    outfile = os.path.join(args.output, outfile)
-
-with lzma.open(args.input) as f, open(outfile, "w") as fw:
-    next(f)
-    for line in f:
-        ip = line.decode().strip().split(",")[args.ipfield]
-        asn, _ = asndb.lookup(ip)
-        fw.write(f"{ip},{asn}\n")
+# Decompressed bytes handled (and written) at once
+BLOCK_SIZE = 1 << 24
+
+
+# Lists the dates of all pyasn databases in the directory once
+def asndb_dates(asndb_root):
+    dates = []
+    for fn in glob.glob(os.path.join(asndb_root, "pyasn-*.db")):
+        match = re.search(r"pyasn-(\d{4}-\d{2}-\d{2})\.db$", fn)
+        if match:
+            dates.append(date.fromisoformat(match.group(1)))
+    return sorted(dates)
+
+
+# Finds the pyasn database of the file's date or, if there is none, the latest
+# one before it (not older than 2018), returns None if there is no such database
+def resolve_asndb(fn, asndb_root, dates):
+    timestamp = date.fromisoformat(re.search(r"\d{4}\-\d{2}\-\d{2}", fn).group(0))
+    idx = bisect.bisect_right(dates, timestamp) - 1
+    if idx < 0 or dates[idx].year < 2018:
+        return None
+    return f"{asndb_root}/pyasn-{dates[idx]}.db"
+
+
+def output_path(fn, output):
+    outfile = ".".join(os.path.basename(fn).split(".")[:-1])
+    if output:
+        outfile = os.path.join(output, outfile)
+    return outfile
+
+
+# Appends the ASN to the address of every line, the xz file is decompressed in
+# blocks of whole lines, the addresses of a block are looked up at once and its
+# output is written at once
+def annotate(fn, asndb, ipfield, output):
+    lines = 0
+    rest = b""
+    header = True
+    with lzma.open(fn) as f, open(output_path(fn, output), "w") as fw:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            buf = rest + block
+            if block:
+                cut = buf.rfind(b"\n") + 1
+                buf, rest = buf[:cut], buf[cut:]
+            if header and buf:
+                nl = buf.find(b"\n")
+                buf = buf[nl + 1:] if nl >= 0 else b""
+                header = False
+            if buf:
+                addrs, valid = parse_buffer(buf, ipfield)
+                asns, _ = asndb.lookup(addrs)
+                asns = np.where(valid, asns, NO_ASN).tolist()
+                ips = [line.strip().split(",")[ipfield] for line in buf.decode().split("\n")[:len(asns)]]
+                fw.write("".join(f"{ip},{None if asn == NO_ASN else asn}\n" for ip, asn in zip(ips, asns)))
+                lines += len(asns)
+            if not block:
+                break
+    return lines
+
+
+# Worker: loads the pyasn database of a group once (the prefix index is cached
+# in --cachedir or next to the database) and annotates all of its files
+def work_group(job):
+    asndb_file, files = job
+    start = time.time()
+    asndb = load_asn_index(asndb_file, cachedir=args.cachedir)
+    lines = 0
+    for fn in files:
+        print(f"Processing file {fn}, using db {asndb_file}")
+        lines += annotate(fn, asndb, args.ipfield, args.output)
+    return os.getpid(), len(files), lines, time.time() - start
+
+
+if __name__ == "__main__":
+    inputs = [args.input] if args.input else sorted(glob.glob(os.path.join(args.input_dir, "**", args.pattern), recursive=True))
+    dates = asndb_dates(args.asndb_root)
+
+    # one job per pyasn database, so every database is loaded once
+    groups = dict()
+    for fn in inputs:
+        asndb_file = resolve_asndb(fn, args.asndb_root, dates)
+        if asndb_file is None:
+            print("No pyasn file found for", fn)
+            continue
+        groups.setdefault(asndb_file, []).append(fn)
+    jobs = sorted(groups.items())
+    print(f"Annotating {sum(len(files) for _, files in jobs)} files with {len(jobs)} pyasn databases")
+
+    # lines/s per worker, including the time needed to load the databases
+    if args.workers <= 1 or len(jobs) <= 1:
+        results = list(map(work_group, jobs))
+    else:
+        with multiprocessing.Pool(min(args.workers, len(jobs))) as p:
+            results = list(p.imap_unordered(work_group, jobs))
+    stats = dict()
+    for pid, num_files, lines, seconds in results:
+        worker = stats.setdefault(pid, [0, 0, 0.0])
+        worker[0] += num_files
+        worker[1] += lines
+        worker[2] += seconds
+    for pid, (num_files, lines, seconds) in sorted(stats.items()):
+        print(f"Worker {pid}: {num_files} files, {lines} lines, {lines / max(seconds, 1e-9):.0f} lines/s")
@@ -0,0 +1,142 @@
+import os
+import ipaddress
+from collections import OrderedDict
+import numpy as np
+from addr_utils import ADDR_DTYPE, MASK64, file_hash, addr_keys, from_ints, format_compressed
+from prefix_utils import NO_VALUE, build_index, lookup_index, parse_prefixes
+
+# ASN lookups
+# The routed IPv6 prefixes of a pyasn database (IPASN text file: "prefix\tasn"
+# per line, ";" starts a comment) are flattened into a prefix index whose
+# values are the positions of the prefixes, so a lookup gives both the ASN and
+# the matching prefix. Sorted address arrays are range-joined with the index,
+# single addresses go through an LRU cache of /48 blocks
+ASN_INDEX_EXT = ".asn.npz"
+NO_ASN = -1
+LRU_PREFIX_BITS = 48
+
+
+# Loads the IPv6 prefixes of a pyasn database, IPv4 prefixes are skipped
+# Returns prefix addresses, prefix lengths and ASNs
+def load_ipasn(fn):
+    tokens, asns = [], []
+    with open(fn) as f:
+        for line in f:
+            if line.startswith(";") or ":" not in line:
+                continue
+            parts = line.split()
+            if len(parts) < 2 or not parts[1].isdigit():
+                continue
+            tokens.append(parts[0])
+            asns.append(int(parts[1]))
+    addrs, lengths, valid = parse_prefixes(tokens)
+    return addrs[valid], lengths[valid], np.array(asns, dtype=np.int64)[valid]
+
+
+# Longest prefix matching of addresses to ASNs and routed prefixes
+class AsnIndex:
+    def __init__(self, addrs, lengths, asns, index=None, cache_size=1 << 16):
+        self.addrs = addrs
+        self.lengths = lengths
+        self.asns = asns
+        self.index = build_index(addrs, lengths) if index is None else index
+        self.start_keys = addr_keys(self.index[0])
+        self.end_keys = addr_keys(self.index[1])
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # Returns the position of the matching prefix of every address of a
+    # sorted address array (or NO_VALUE). Every range of the index gives the
+    # slice of addresses it covers through two binary searches, so the work
+    # is O(R log N + N) for R ranges and N addresses
+    def join_sorted(self, arr):
+        starts, ends, values = self.index
+        keys = addr_keys(arr)
+        first = np.searchsorted(keys, self.start_keys, side="left")
+        last = np.searchsorted(keys, self.end_keys, side="right")
+        counts = last - first
+        ids = np.full(len(arr), NO_VALUE, dtype=np.int64)
+        offsets = np.repeat(first - (np.cumsum(counts) - counts), counts)
+        ids[offsets + np.arange(counts.sum())] = np.repeat(values, counts)
+        return ids
+
+    # Returns the ASN (or NO_ASN) and the position of the matching prefix
+    # (or NO_VALUE) of every address. Sorted arrays which are at least as
+    # large as the index are range-joined, all others are binary searched
+    def lookup(self, arr):
+        if len(arr) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        keys = addr_keys(arr)
+        if len(arr) >= len(self.start_keys) and (keys[1:] >= keys[:-1]).all():
+            ids = self.join_sorted(arr)
+        else:
+            ids = lookup_index(self.index, arr)
+        asns = np.where(ids == NO_VALUE, NO_ASN, self.asns[np.maximum(ids, 0)])
+        return asns, ids
+
+    # Formats prefixes given by position as "prefix/length", None for NO_VALUE
+    def prefixes(self, ids):
+        ids = np.asarray(ids)
+        found = ids != NO_VALUE
+        names = format_compressed(self.addrs[ids[found]])
+        lengths = self.lengths[ids[found]].tolist()
+        out = [None] * len(ids)
+        for i, name, length in zip(np.flatnonzero(found).tolist(), names, lengths):
+            out[i] = f"{name}/{length}"
+        return out
+
+    # Drop-in for pyasn's lookup(ip): returns ASN and prefix of a single
+    # address (None if not routed). Results are cached per /48 block, but only
+    # for blocks which lie completely within one range of the index (or
+    # between two ranges), so more specific prefixes inside a /48 still match
+    def lookup_ip(self, ip):
+        arr = from_ints([int(ipaddress.IPv6Address(ip))])
+        shift = 64 - LRU_PREFIX_BITS
+        block = int(arr["hi"][0]) >> shift
+        if block in self.cache:
+            self.cache.move_to_end(block)
+            self.cache_hits += 1
+            return self.cache[block]
+        self.cache_misses += 1
+
+        asns, ids = self.lookup(arr)
+        result = (None if asns[0] == NO_ASN else int(asns[0]), self.prefixes(ids)[0])
+
+        bounds = np.zeros(2, dtype=ADDR_DTYPE)
+        bounds["hi"] = [block << shift, (block << shift) | ((1 << shift) - 1)]
+        bounds["lo"] = [0, MASK64]
+        bound_keys = addr_keys(bounds)
+        pos = np.searchsorted(self.start_keys, bound_keys, side="right") - 1
+        inside = (pos >= 0) & (bound_keys <= self.end_keys[np.maximum(pos, 0)])
+        if pos[0] == pos[1] and inside[0] == inside[1]:
+            self.cache[block] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+
+# Loads a pyasn database into an AsnIndex. The index is kept on disk and reused
+# as long as the hash of the database matches
+def load_asn_index(fn, cachedir=None):
+    fn_index = os.path.join(cachedir or os.path.dirname(os.path.abspath(fn)), os.path.basename(fn) + ASN_INDEX_EXT)
+    source_hash = np.frombuffer(file_hash(fn), dtype=np.uint8)
+    if os.path.isfile(fn_index):
+        with np.load(fn_index) as cached:
+            if np.array_equal(cached["source_hash"], source_hash):
+                index = (cached["starts"], cached["ends"], cached["values"])
+                return AsnIndex(cached["addrs"], cached["lengths"], cached["asns"], index)
+
+    asn_index = AsnIndex(*load_ipasn(fn))
+    starts, ends, values = asn_index.index
+    np.savez(fn_index, addrs=asn_index.addrs, lengths=asn_index.lengths, asns=asn_index.asns,
+             starts=starts, ends=ends, values=values, source_hash=source_hash)
+    return asn_index
+
+
+# Counts the addresses per ASN, returns the ASNs (NO_ASN for unrouted
+# addresses) and their counts
+def count_asns(asn_index, arr):
+    asns, _ = asn_index.lookup(arr)
+    return np.unique(asns, return_counts=True)
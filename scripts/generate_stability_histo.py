@@ -1,62 +1,65 @@
-import matplotlib.pyplot as plt
 import argparse
 from datetime import datetime
 import numpy as np
 import tqdm
+from stability_utils import STABILITY_BIN_EXT, load_transitions, iter_transitions_text, format_keys, day_numbers, stability_stats, format_stats
+from addr_utils import CHUNK_SIZE
 
 parser = argparse.ArgumentParser()
-parser.add_argument("input")
+parser.add_argument("input", help=".ipstability csv or binary transition log (.npz)")
 parser.add_argument("--lines", type=int, default=0)
 parser.add_argument("--outfile", type=str)
 parser.add_argument("--cutoff", type=str, help="Any IP address which was added after x will not be respected")
+parser.add_argument("--cats", type=str, help="peeringdb file, also writes the per category statistics for the plot")
 args = parser.parse_args()
 
-def datetime_diff(dt2, dt1):
-    ts1 = datetime.strptime(dt1, "%Y-%m-%d")
-    ts2 = datetime.strptime(dt2, "%Y-%m-%d")
-    return (ts2 - ts1).days
-
-def datetime_diff_cutoff(dt1):
-    ts1 = datetime.strptime(dt1, "%Y-%m-%d")
-    return (cutoff - ts1).days
-
-now_ts = datetime.now().strftime("%Y-%m-%d")
-cutoff = datetime.strptime(args.cutoff, "%Y-%m-%d") if args.cutoff else None
-
-data = dict()
-data_counts = dict()
-data_up_avgs = dict()
-data_down_avgs = dict()
-counter = 0
-with open(args.input) as f:
-    for line in tqdm.tqdm(f, total=args.lines):
-        ipa, asn, dates = line.strip().split(",")
-        ipkey = f"{ipa},{asn}"
-        dates = dates.split(";")
-        
-        if cutoff and datetime_diff_cutoff(dates[0]) < 0:
-            continue
-        
-        datelen = len(dates)
-        if not dates[-1] == now_ts:
-            dates.append(now_ts)
-        
-        down_avg, down_sum = 0, 0
-        up_avg, up_sum = 0, 0
-        if len(dates) > 1:
-            for i in range(1, len(dates)):
-                if i % 2 == 0:
-                    down_sum += datetime_diff(dates[i], dates[i - 1])
-                else:
-                    up_sum += datetime_diff(dates[i], dates[i - 1])
-
-            up_avg = up_sum / (len(dates) // 2)
-            if len(dates) > 2:
-                down_avg = down_sum / ((len(dates) - 1) // 2)
-
-        data[ipkey] = (datelen, up_avg, down_avg, up_sum, down_sum)
+now = day_numbers([datetime.now().strftime("%Y-%m-%d")])[0]
+cutoff = day_numbers([args.cutoff])[0] if args.cutoff else None
+
+# The statistics are computed on integer day numbers of whole chunks of IPs,
+# the transition log is either read from the binary log or parsed chunk-wise
+# from the csv
+def chunks():
+    if args.input.endswith(STABILITY_BIN_EXT):
+        keys, dates, offsets, days = load_transitions(args.input)
+        values = day_numbers(dates)[days]
+        for i in range(0, len(keys), CHUNK_SIZE):
+            chunk_offsets = offsets[i:i + CHUNK_SIZE + 1]
+            yield keys[i:i + CHUNK_SIZE], chunk_offsets - chunk_offsets[0], values[chunk_offsets[0]:chunk_offsets[-1]]
+    else:
+        for names, offsets, values in iter_transitions_text(args.input):
+            yield names, offsets, values
+
+# Category of every ASN, looked up once per distinct ASN
+def categories(names):
+    asns = np.array([name.rsplit(",", 1)[1] for name in names])
+    uniq, inverse = np.unique(asns, return_inverse=True)
+    cats = np.array([lookup_peeringdb(asn, peeringdb, shorten=True) for asn in uniq.tolist()])
+    return cats[inverse]
+
+if args.cats:
+    from hitlist_utils import load_peeringdb, lookup_peeringdb
+    peeringdb = load_peeringdb(args.cats)
+cat_data = dict()
 
 outfile = args.input + ".ipdata" if not args.outfile else args.outfile
-with open(outfile, "w") as f:
-    for key, val in data.items():
-        f.write(f"{key},{','.join([str(el) for el in val])}\n")
+with open(outfile, "w") as f, tqdm.tqdm(total=args.lines) as progress:
+    for names, offsets, values in chunks():
+        stats, keep = stability_stats(offsets, values, now, cutoff)
+        if isinstance(names, np.ndarray):
+            names = format_keys(names[keep])
+        else:
+            names = [name for name, k in zip(names, keep.tolist()) if k]
+        f.write("".join(format_stats(names, stats[keep])))
+        progress.update(len(keep))
+
+        if args.cats:
+            cats = categories(names)
+            for cat in np.unique(cats).tolist():
+                cat_data.setdefault(cat, []).append(stats[keep][cats == cat])
+
+# Changes, uptime and downtime sums per category for generate_stability_plot.py
+if args.cats:
+    cat_stats = dict((cat, np.concatenate(parts)) for cat, parts in cat_data.items())
+    np.savez(outfile + ".cats" + STABILITY_BIN_EXT, **dict(
+        (f"{cat}.{field}", stats[field]) for cat, stats in cat_stats.items() for field in ("changes", "up_sum", "down_sum")))
@@ -5,8 +5,8 @@ from hitlist_utils import load_peeringdb, lookup_peeringdb
 from plot_utils import rc_setting, set_size, CATS_ORDER_SHORT
 
 parser = argparse.ArgumentParser()
-parser.add_argument("input")
-parser.add_argument("cats")
+parser.add_argument("input", help=".ipdata csv or the .ipdata.cats.npz of generate_stability_histo.py --cats")
+parser.add_argument("cats", nargs="?", default="")
 parser.add_argument("--lines", type=int, default=0)
 args = parser.parse_args()
 
@@ -14,25 +14,32 @@ height, width = set_size("doublecolumn")
 plt.rcParams.update(rc_setting(fontsize=8))
 plt.rcParams["figure.figsize"] = (height, width)
 
-peeringdb = load_peeringdb(args.cats)
-
 change_data = dict()
 up_sum_data = dict()
 down_sum_data = dict()
-with open(args.input) as f:
-    for line in f:
-        ipa, asn, changes, up_avg, down_avg, up_sum, down_sum = line.strip().split(",")
-
-        ascat = lookup_peeringdb(asn, peeringdb, shorten=True)
-
-        if not ascat in change_data:
-            change_data[ascat] = []
-            up_sum_data[ascat] = []
-            down_sum_data[ascat] = []
-
-        change_data[ascat].append(int(changes))
-        up_sum_data[ascat].append(int(up_sum))
-        down_sum_data[ascat].append(int(down_sum))
+if args.input.endswith(".npz"):
+    # per category statistics written by generate_stability_histo.py --cats
+    with np.load(args.input) as cat_stats:
+        for key in cat_stats.files:
+            ascat, field = key.rsplit(".", 1)
+            data = {"changes": change_data, "up_sum": up_sum_data, "down_sum": down_sum_data}[field]
+            data[ascat] = cat_stats[key]
+else:
+    peeringdb = load_peeringdb(args.cats)
+    with open(args.input) as f:
+        for line in f:
+            ipa, asn, changes, up_avg, down_avg, up_sum, down_sum = line.strip().split(",")
+
+            ascat = lookup_peeringdb(asn, peeringdb, shorten=True)
+
+            if not ascat in change_data:
+                change_data[ascat] = []
+                up_sum_data[ascat] = []
+                down_sum_data[ascat] = []
+
+            change_data[ascat].append(int(changes))
+            up_sum_data[ascat].append(int(up_sum))
+            down_sum_data[ascat].append(int(down_sum))
 
 fig, axes = plt.subplots(1, 3)
 for ax, data in zip(axes, [change_data, up_sum_data, down_sum_data]):
@@ -0,0 +1,182 @@
+import io
+import os
+import sys
+import multiprocessing
+from contextlib import redirect_stdout
+import numpy as np
+
+# Space partitioning (DHC) of seed nibble matrices
+# Seeds are given as uint8 matrix with one row of 32 nibbles per address (see
+# addr_utils.to_nibbles). Regions are kept as (lo, hi) ranges of a single
+# permutation of the seed rows instead of copies of the rows. Splitting a
+# region stably reorders its rows by the nibble of the split dimension, so
+# every child is a contiguous range again and the rows of every region stay in
+# input order. All regions of one tree level are split together, the 32 nibble
+# histograms of a region are counted by a single bincount
+NIBBLE_DIMS = 32
+BATCH_ROWS = 1 << 18
+
+
+# Concatenated row indices of the ranges [los[i], his[i])
+def ranges_index(los, his):
+    sizes = his - los
+    offsets = np.cumsum(sizes) - sizes
+    return np.arange(sizes.sum()) + np.repeat(los - offsets, sizes)
+
+
+# Counts the nibbles of every dimension for consecutive regions, rows holds
+# the seed rows of all regions one after another
+# Returns a regions x 32 x 16 matrix of counts
+def nibble_histograms(rows, sizes):
+    rid = np.repeat(np.arange(len(sizes)), sizes)
+    hist = np.zeros(len(sizes) * NIBBLE_DIMS * 16, dtype=np.int64)
+    # chunks of rows only count into the histograms of their own regions
+    step = BATCH_ROWS // 8
+    for i in range(0, len(rows), step):
+        first, last = rid[i], rid[min(i + step, len(rows)) - 1]
+        base = ((rid[i:i + step] - first) * NIBBLE_DIMS)[:, None] + np.arange(NIBBLE_DIMS)
+        keys = base * 16 + rows[i:i + step]
+        hist[first * NIBBLE_DIMS * 16:(last + 1) * NIBBLE_DIMS * 16] += np.bincount(keys.ravel(), minlength=(last + 1 - first) * NIBBLE_DIMS * 16)
+    return hist.reshape(len(sizes), NIBBLE_DIMS, 16)
+
+
+# Splits batches of regions until all regions are smaller than min_split or
+# cannot be split anymore (all rows identical)
+# choose_dims gets the nibble histograms of a batch of regions and returns the
+# split dimension of every region
+# The regions are returned in the order a stack (lifo) or a queue of regions
+# would produce them: a stack yields the leaves depth-first with the highest
+# nibble first, a queue yields them level by level with the lowest nibble first
+# Returns the reordered seed rows and the (lo, hi) row ranges of the regions
+def dhc_ranges(arrs, choose_dims, min_split=16, lifo=True):
+    arrs = np.ascontiguousarray(arrs, dtype=np.uint8)
+    perm = np.arange(len(arrs))
+    los = np.zeros(1, dtype=np.int64)
+    his = np.full(1, len(arrs), dtype=np.int64)
+    leaves = []
+    depth = 0
+    while len(los) > 0:
+        split = his - los >= min_split
+        leaves.append((los[~split], his[~split], np.full((~split).sum(), depth)))
+        los, his = los[split], his[split]
+
+        child_los, child_his = [], []
+        ends = np.cumsum(his - los)
+        start = 0
+        while start < len(los):
+            done = ends[start - 1] if start > 0 else 0
+            stop = max(start + 1, np.searchsorted(ends, done + BATCH_ROWS, "right"))
+            blos, bhis = los[start:stop], his[start:stop]
+            sizes = bhis - blos
+            idx = ranges_index(blos, bhis)
+            rows = arrs[perm[idx]]
+            hist = nibble_histograms(rows, sizes)
+
+            # regions with a single nibble in every dimension cannot be split
+            splittable = (np.count_nonzero(hist, axis=2) > 1).any(axis=1)
+            leaves.append((blos[~splittable], bhis[~splittable], np.full((~splittable).sum(), depth)))
+            dims = choose_dims(hist)
+
+            # stable reorder of the rows by region and nibble of the split dimension
+            rid = np.repeat(np.arange(len(sizes)), sizes)
+            keys = rid * 16 + rows[np.arange(len(rows)), dims[rid]]
+            perm[idx] = perm[idx][np.argsort(keys, kind="stable")]
+
+            counts = hist[np.arange(len(sizes)), dims][splittable]
+            starts = (blos[splittable][:, None] + np.cumsum(counts, axis=1) - counts).ravel()
+            counts = counts.ravel()
+            child_los.append(starts[counts > 0])
+            child_his.append(starts[counts > 0] + counts[counts > 0])
+            start = stop
+
+        los = np.concatenate([np.zeros(0, dtype=np.int64)] + child_los)
+        his = np.concatenate([np.zeros(0, dtype=np.int64)] + child_his)
+        depth += 1
+
+    los, his, depths = (np.concatenate(x) for x in zip(*leaves))
+    order = np.argsort(-los, kind="stable") if lifo else np.lexsort((los, depths))
+    return arrs[perm], los[order], his[order]
+
+
+# Returns the regions of dhc_ranges as (views of) row blocks of one array
+def dhc_regions(arrs, choose_dims, min_split=16, lifo=True):
+    data, los, his = dhc_ranges(arrs, choose_dims, min_split, lifo)
+    return [data[lo:hi] for lo, hi in zip(los, his)]
+
+
+# Returns the first dimension of every region with more than one nibble value
+def leftmost_dims(hist):
+    return np.argmax(np.count_nonzero(hist, axis=2) > 1, axis=1)
+
+
+# Seed matrix of a worker process, attached to the shared memory block or
+# handed over when the pool starts
+_shared = {}
+
+
+def _attach_shared(name, shape, dtype):
+    from multiprocessing import shared_memory
+    _shared["shm"] = shared_memory.SharedMemory(name=name)
+    _shared["data"] = np.ndarray(shape, dtype=dtype, buffer=_shared["shm"].buf)
+
+
+def _set_shared(data):
+    _shared["data"] = data
+
+
+# Runs func on one region, whatever it prints is captured and returned with
+# the result, so the parent can print it in region order
+def _run_region(task):
+    func, index, lo, hi = task
+    out = io.StringIO()
+    with redirect_stdout(out):
+        result = func(_shared["data"][lo:hi])
+    return index, result, out.getvalue()
+
+
+# Applies func to every region (rows lo:hi of data) and returns the results in
+# region order, whatever the number of workers. With several workers the seed
+# matrix is copied into shared memory once and the workers only get row ranges
+# (before Python 3.8, without multiprocessing.shared_memory, the workers
+# inherit the matrix when they are started instead).
+# The regions are handed out largest first to the next idle worker, so a few
+# large regions do not hold up the pool. The output func prints in the workers
+# is written to stdout in region order, as soon as all earlier regions are done
+def map_regions(func, data, los, his, workers=1):
+    if workers is None:
+        workers = os.cpu_count()
+    workers = min(workers, len(los))
+    if workers <= 1:
+        return [func(data[lo:hi]) for lo, hi in zip(los, his)]
+
+    data = np.ascontiguousarray(data)
+    try:
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[...] = data
+        initializer, initargs = _attach_shared, (shm.name, data.shape, data.dtype.str)
+    except ImportError:
+        shm = None
+        initializer, initargs = _set_shared, (data,)
+    try:
+        order = np.argsort(-(np.asarray(his) - np.asarray(los)), kind="stable")
+        tasks = [(func, int(i), int(los[i]), int(his[i])) for i in order]
+        # the many small regions at the end are handed out in chunks
+        chunksize = max(1, len(tasks) // (workers * 64))
+        results = [None] * len(los)
+        texts = [None] * len(los)
+        printed = 0
+        with multiprocessing.Pool(workers, initializer=initializer, initargs=initargs) as pool:
+            for index, result, text in pool.imap_unordered(_run_region, tasks, chunksize):
+                results[index] = result
+                texts[index] = text
+                while printed < len(texts) and texts[printed] is not None:
+                    sys.stdout.write(texts[printed])
+                    texts[printed] = ""
+                    printed += 1
+        sys.stdout.flush()
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    return results
@@ -0,0 +1,190 @@
+import os
+import sys
+import argparse
+import numpy as np
+from addr_utils import ADDR_DTYPE, MASK64, parse_buffer, parse_bulk, file_hash, addr_keys, searchsorted_addrs
+
+# Prefix index
+# Prefixes (e.g. aliased prefixes, blocklists or routed prefixes) are flattened
+# into sorted, disjoint address ranges. Every range carries the value of the
+# most specific prefix covering it, so a single binary search per address
+# gives the longest prefix match
+PREFIX_INDEX_EXT = ".lpm.npz"
+NO_VALUE = -1
+
+
+# Returns a mask of all addresses of arr1 which are less than or equal to
+# the addresses of arr2 (element-wise)
+def addr_le(arr1, arr2):
+    return (arr1["hi"] < arr2["hi"]) | ((arr1["hi"] == arr2["hi"]) & (arr1["lo"] <= arr2["lo"]))
+
+
+# Returns the network masks (hi and lo half) for an array of prefix lengths
+def prefix_masks(lengths):
+    lengths = np.asarray(lengths, dtype=np.int64)
+    masks = []
+    for bits in (np.clip(lengths, 0, 64), np.clip(lengths - 64, 0, 64)):
+        mask = np.full(len(lengths), MASK64, dtype=np.uint64) << (64 - np.maximum(bits, 1)).astype(np.uint64)
+        masks.append(np.where(bits == 0, np.uint64(0), mask))
+    return masks
+
+
+# Returns the first and last address of each prefix
+def prefix_ranges(addrs, lengths):
+    mask_hi, mask_lo = prefix_masks(lengths)
+    starts = np.zeros(len(addrs), dtype=ADDR_DTYPE)
+    ends = np.zeros(len(addrs), dtype=ADDR_DTYPE)
+    starts["hi"] = addrs["hi"] & mask_hi
+    starts["lo"] = addrs["lo"] & mask_lo
+    ends["hi"] = starts["hi"] | ~mask_hi
+    ends["lo"] = starts["lo"] | ~mask_lo
+    return starts, ends
+
+
+# Parses a list of prefixes in CIDR notation, single addresses count as /128
+# like in grepcidr. Returns addresses, prefix lengths and a mask of valid rows
+def parse_prefixes(tokens):
+    tokens = [t.decode("ascii", "replace") if isinstance(t, bytes) else t for t in tokens]
+    parts = [t.strip().split("/", 1) for t in tokens]
+    addrs, valid = parse_bulk([p[0] for p in parts])
+    lengths = np.full(len(parts), 128, dtype=np.int64)
+    for i, p in enumerate(parts):
+        if len(p) == 2:
+            lengths[i] = int(p[1]) if p[1].strip().isdigit() else -1
+    valid &= (lengths >= 0) & (lengths <= 128)
+    return addrs, lengths, valid
+
+
+# Loads the valid prefixes of a text file with one prefix per line, taking
+# the prefix from the given comma-separated field
+def load_prefixes(fn, field=0):
+    with open(fn) as f:
+        tokens = [line.split(",")[field] if line.count(",") >= field else "" for line in f if not line.startswith("#")]
+    addrs, lengths, valid = parse_prefixes(tokens)
+    return addrs[valid], lengths[valid]
+
+
+# Adds one to every address, the last address of the address space wraps to ::
+def _addr_next(arr):
+    nxt = arr.copy()
+    nxt["lo"] += np.uint64(1)
+    nxt["hi"] += (nxt["lo"] == 0).astype(np.uint64)
+    return nxt
+
+
+# Subtracts one from every address, :: wraps to the last address
+def _addr_prev(arr):
+    prev = arr.copy()
+    prev["hi"] -= (prev["lo"] == 0).astype(np.uint64)
+    prev["lo"] -= np.uint64(1)
+    return prev
+
+
+# Builds a prefix index from prefix addresses and lengths. values (integers,
+# default: index of the prefix) are assigned to the ranges, longer prefixes
+# override shorter ones. Returns starts, ends and values of the ranges,
+# neighbouring ranges with the same value are merged
+def build_index(addrs, lengths, values=None):
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if values is None:
+        values = np.arange(len(addrs), dtype=np.int64)
+    values = np.asarray(values, dtype=np.int64)
+    starts, ends = prefix_ranges(addrs, lengths)
+
+    # elementary ranges: no prefix starts or ends within them
+    after = _addr_next(ends)
+    wraps = (after["hi"] == 0) & (after["lo"] == 0)
+    bounds = np.unique(np.concatenate([starts, after[~wraps], np.zeros(1, dtype=ADDR_DTYPE)]))
+    seg_starts = bounds
+    seg_ends = np.zeros(len(bounds), dtype=ADDR_DTYPE)
+    seg_ends[:-1] = _addr_prev(bounds[1:])
+    seg_ends[-1] = (MASK64, MASK64)
+
+    # paint the ranges with the values of the prefixes, shortest prefixes
+    # first. Prefixes of the same length never overlap, so every level
+    # touches each range at most once
+    seg_keys = addr_keys(seg_starts)
+    first_seg = np.searchsorted(seg_keys, addr_keys(starts))
+    end_seg = np.where(wraps, len(bounds), np.searchsorted(seg_keys, addr_keys(after)))
+    seg_values = np.full(len(bounds), NO_VALUE, dtype=np.int64)
+    for length in np.unique(lengths):
+        sel = np.flatnonzero(lengths == length)
+        counts = end_seg[sel] - first_seg[sel]
+        offsets = np.repeat(first_seg[sel] - (np.cumsum(counts) - counts), counts)
+        seg_values[offsets + np.arange(counts.sum())] = np.repeat(values[sel], counts)
+
+    # drop uncovered ranges and merge neighbours with the same value
+    keep = seg_values != NO_VALUE
+    seg_starts, seg_ends, seg_values = seg_starts[keep], seg_ends[keep], seg_values[keep]
+    if len(seg_starts) == 0:
+        return seg_starts, seg_ends, seg_values
+    adjacent = (seg_values[1:] == seg_values[:-1]) & (_addr_next(seg_ends[:-1]) == seg_starts[1:])
+    first = np.concatenate([[True], ~adjacent])
+    last = np.concatenate([~adjacent, [True]])
+    return seg_starts[first], seg_ends[last], seg_values[first]
+
+
+# Looks up a sorted or unsorted address array in a prefix index, returns the
+# value of the longest matching prefix or NO_VALUE for each address
+def lookup_index(index, arr):
+    starts, ends, values = index
+    if len(starts) == 0 or len(arr) == 0:
+        return np.full(len(arr), NO_VALUE, dtype=np.int64)
+    idx = searchsorted_addrs(starts, arr, side="right") - 1
+    hit = (idx >= 0) & addr_le(arr, ends[np.maximum(idx, 0)])
+    return np.where(hit, values[np.maximum(idx, 0)], NO_VALUE)
+
+
+# Returns a mask of all addresses covered by any prefix of the index
+def covered_index(index, arr):
+    return lookup_index(index, arr) != NO_VALUE
+
+
+# Removes all addresses covered by the prefix index (like grepcidr -v)
+def filter_index(index, arr):
+    return arr[~covered_index(index, arr)]
+
+
+# Returns the file name of the cached index of the given prefix files
+def prefix_index_path(fns, cachedir=None):
+    name = "_".join(os.path.basename(fn) for fn in fns) + PREFIX_INDEX_EXT
+    return os.path.join(cachedir or os.path.dirname(os.path.abspath(fns[0])), name)
+
+
+# Builds a filter index over all prefixes of the given files. The index is
+# kept on disk and reused as long as the hashes of the prefix files match
+def load_prefix_index(fns, cachedir=None):
+    fn_index = prefix_index_path(fns, cachedir)
+    source_hash = np.frombuffer(b"".join(file_hash(fn) for fn in fns), dtype=np.uint8)
+    if os.path.isfile(fn_index):
+        with np.load(fn_index) as cached:
+            if np.array_equal(cached["source_hash"], source_hash):
+                return cached["starts"], cached["ends"], cached["values"]
+
+    prefixes = [load_prefixes(fn) for fn in fns]
+    addrs = np.concatenate([np.zeros(0, dtype=ADDR_DTYPE)] + [p[0] for p in prefixes])
+    lengths = np.concatenate([np.zeros(0, dtype=np.int64)] + [p[1] for p in prefixes])
+    index = build_index(addrs, lengths, np.zeros(len(addrs), dtype=np.int64))
+    np.savez(fn_index, starts=index[0], ends=index[1], values=index[2], source_hash=source_hash)
+    return index
+
+
+# Drop-in for grepcidr [-v] -f patterns input: prints all lines of the input
+# file whose first field is (or is not) covered by one of the prefixes
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--patterns", nargs="+", required=True)
+    parser.add_argument("-v", "--invert", action="store_true")
+    parser.add_argument("--cachedir", type=str, default=None)
+    parser.add_argument("input")
+    args = parser.parse_args()
+
+    index = load_prefix_index(args.patterns, args.cachedir)
+    with open(args.input, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    out = sys.stdout.buffer
+    for i in range(0, len(lines), 1 << 20):
+        chunk = lines[i:i + (1 << 20)]
+        addrs, valid = parse_buffer(b"".join(chunk))
+        match = valid & covered_index(index, addrs)
+        out.writelines(line for line, m in zip(chunk, match) if m != args.invert)
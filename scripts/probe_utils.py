@@ -0,0 +1,153 @@
+import sys
+import asyncio
+import argparse
+import numpy as np
+from addr_utils import ADDR_DTYPE, CHUNK_SIZE, parse_addrs, unique_sorted, isin_sorted, load_addrs_cached, format_compressed
+from prefix_utils import covered_index
+
+# Probers
+# A prober sends probes to target addresses, given as address array or as
+# iterable of address arrays (e.g. a generator of chunks), and returns the
+# sorted array of addresses which responded. The backends share one interface, so
+# the feedback loops of the TGAs can be run against a real scanner or
+# offline against a simulated network
+
+
+# Runs a coroutine to completion in a fresh event loop (asyncio.run is not
+# available before Python 3.7)
+def run_async(coro):
+    if hasattr(asyncio, "run"):
+        return asyncio.run(coro)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+# Yields the targets in chunks of at most CHUNK_SIZE addresses
+def iter_chunks(targets):
+    if isinstance(targets, np.ndarray):
+        targets = [targets]
+    for addrs in targets:
+        for i in range(0, len(addrs), CHUNK_SIZE):
+            yield addrs[i:i + CHUNK_SIZE]
+
+
+# Base class of all probers, subclasses implement probe_async
+class Prober:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+
+    # Probes the addresses and returns the responsive ones (sorted, unique)
+    def probe(self, addrs):
+        return run_async(self.probe_async(addrs))
+
+    async def probe_async(self, addrs):
+        raise NotImplementedError
+
+    # Keeps track of the number of probes and responses
+    def count(self, sent, active):
+        self.sent += sent
+        self.received += len(active)
+        return active
+
+
+# Runs a scanner as subprocess, targets are streamed to its stdin and
+# responses are read from its stdout while the scan is running. The scanner
+# has to read targets from stdin and write one responsive address per line
+class SubprocessProber(Prober):
+    def __init__(self, command):
+        super().__init__()
+        self.command = command
+
+    async def probe_async(self, addrs):
+        proc = await asyncio.create_subprocess_exec(*self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+
+        sent = 0
+
+        async def feed():
+            nonlocal sent
+            try:
+                for chunk in iter_chunks(addrs):
+                    if len(chunk) == 0:
+                        continue
+                    proc.stdin.write(("\n".join(format_compressed(chunk)) + "\n").encode())
+                    sent += len(chunk)
+                    await proc.stdin.drain()
+                proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                # the scanner exited early, its return code tells why
+                pass
+
+        async def collect():
+            return [line async for line in proc.stdout]
+
+        _, lines = await asyncio.gather(feed(), collect())
+        returncode = await proc.wait()
+        if returncode != 0:
+            raise Exception(f"command\n\n{' '.join(self.command)}\n\nreturned code {returncode}")
+        return self.count(sent, unique_sorted(parse_addrs(lines)))
+
+
+# zmap with IPv6 support (https://github.com/tumi8/zmap), reads the target
+# list from stdin and prints the responsive addresses to stdout
+class ZmapProber(SubprocessProber):
+    def __init__(self, config, extra_args=()):
+        super().__init__(["zmap", "--config", config, "--ipv6-target-file=-", "-q", "-o", "-"] + list(extra_args))
+
+
+# Simulated network: answers from a ground-truth set of responsive addresses.
+# Each responsive address answers with probability response_rate (probe or
+# reply loss), addresses covered by the optional aliased prefix index always
+# answer. The random generator is seeded, so repeated runs see the same losses
+class SimulatedProber(Prober):
+    def __init__(self, truth, response_rate=1.0, aliased_index=None, seed=0):
+        super().__init__()
+        self.truth = unique_sorted(truth)
+        self.response_rate = response_rate
+        self.aliased_index = aliased_index
+        self.rng = np.random.RandomState(seed)
+
+    async def probe_async(self, addrs):
+        return self.respond(addrs)
+
+    def respond(self, targets):
+        sent = 0
+        active = [np.zeros(0, dtype=ADDR_DTYPE)]
+        for addrs in iter_chunks(targets):
+            sent += len(addrs)
+            addrs = unique_sorted(addrs)
+            hit = isin_sorted(addrs, self.truth)
+            if self.response_rate < 1.0:
+                hit &= self.rng.random_sample(len(addrs)) < self.response_rate
+            if self.aliased_index is not None:
+                hit |= covered_index(self.aliased_index, addrs)
+            active.append(addrs[hit])
+        return self.count(sent, unique_sorted(np.concatenate(active)))
+
+
+# Creates a simulated prober from a file of responsive addresses (text or
+# .v6bin, see addr_utils.load_addrs)
+def load_simulated_prober(fn, response_rate=1.0, aliased_index=None, seed=0, cachedir=None):
+    return SimulatedProber(load_addrs_cached(fn, cachedir=cachedir), response_rate, aliased_index, seed)
+
+
+# Probes a target list with the simulated prober and prints the responsive
+# addresses, e.g. to replay the target list of a TGA against a ground truth
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("truth", type=str, help="file of responsive addresses")
+    parser.add_argument("targets", type=str, help="file of target addresses")
+    parser.add_argument("--response-rate", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    prober = load_simulated_prober(args.truth, args.response_rate, seed=args.seed)
+    with open(args.targets) as f:
+        active = prober.probe(parse_addrs(f))
+    sys.stdout.writelines(addr + "\n" for addr in format_compressed(active))
+    print(f"{prober.received} of {prober.sent} targets responded", file=sys.stderr)
@@ -0,0 +1,308 @@
+import os
+from itertools import islice
+import numpy as np
+from addr_utils import ADDR_DTYPE, CHUNK_SIZE, parse_buffer, parse_uint_buffer, format_compressed
+
+# IP stability engine
+# Every (address, ASN) pair of the hitlist snapshots gets a dense id in the
+# order in which the pairs are seen for the first time. A snapshot is a sorted
+# array of ids, so an id below the number of ids known before a snapshot is in
+# the cumulative set of all earlier snapshots
+# Changes are logged as (id, day) events, day being the index of the snapshot
+# date. The final log is stored CSR-style: the events of id i are
+# days[offsets[i]:offsets[i + 1]], the first one is the day the pair was added,
+# every other one marks a change (i.e. online/offline)
+# The .npz file of the log doubles as state file: together with the ids of the
+# last snapshot it is all that is needed to continue with later snapshots
+KEY_DTYPE = np.dtype([("hi", "<u8"), ("lo", "<u8"), ("asn", "<u8")])
+ID_DTYPE = np.uint32
+DAY_DTYPE = np.uint16
+NO_ASN = np.uint64((1 << 64) - 1)
+STABILITY_BIN_EXT = ".npz"
+
+# Per pair statistics of a transition log: number of changes, average and
+# total up- and downtime in days
+STATS_DTYPE = np.dtype([("changes", "<i8"), ("up_avg", "<f8"), ("down_avg", "<f8"), ("up_sum", "<i8"), ("down_sum", "<i8")])
+
+
+# Returns big-endian 24 byte keys of a key array, sorting like (address, ASN)
+def pair_keys(keys):
+    raw = np.empty((len(keys), 3), dtype=">u8")
+    raw[:, 0] = keys["hi"]
+    raw[:, 1] = keys["lo"]
+    raw[:, 2] = keys["asn"]
+    return raw.view("S24").ravel()
+
+
+# Reads a snapshot file (address, ASN per line) in blocks of whole lines and
+# returns the sorted and deduplicated byte keys of all (address, ASN) pairs
+# Lines without a valid address (e.g. headers) are skipped, ASNs which are not
+# a number (pyasn writes "None") are stored as NO_ASN
+def load_snapshot(fn, block_size=1 << 26):
+    chunks = [np.zeros(0, dtype="S24")]
+    rest = b""
+    with open(fn, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            buf = rest + block
+            if block:
+                cut = buf.rfind(b"\n") + 1
+                buf, rest = buf[:cut], buf[cut:]
+            if buf:
+                addrs, valid = parse_buffer(buf, 0)
+                asns, asn_valid = parse_uint_buffer(buf, 1)
+                keys = np.zeros(int(valid.sum()), dtype=KEY_DTYPE)
+                keys["hi"] = addrs["hi"][valid]
+                keys["lo"] = addrs["lo"][valid]
+                keys["asn"] = np.where(asn_valid, asns, NO_ASN)[valid]
+                chunks.append(np.unique(pair_keys(keys)))
+            if not block:
+                break
+    return np.unique(np.concatenate(chunks))
+
+
+# Turns byte keys back into a key array
+def unpack_keys(raw):
+    raw = np.ascontiguousarray(raw, dtype="S24").view(">u8").reshape(-1, 3)
+    keys = np.zeros(len(raw), dtype=KEY_DTYPE)
+    keys["hi"] = raw[:, 0]
+    keys["lo"] = raw[:, 1]
+    keys["asn"] = raw[:, 2]
+    return keys
+
+
+# Formats a key array as "ip,asn" strings like the hitlist files
+def format_keys(keys):
+    addrs = np.zeros(len(keys), dtype=ADDR_DTYPE)
+    addrs["hi"] = keys["hi"]
+    addrs["lo"] = keys["lo"]
+    asns = ["None" if asn == NO_ASN else str(asn) for asn in keys["asn"].tolist()]
+    return [f"{ip},{asn}" for ip, asn in zip(format_compressed(addrs), asns)]
+
+
+# Matches two sorted and deduplicated key arrays by merging them, returns the
+# positions of the common keys in both arrays. The stable sort of the
+# concatenation only has to merge two sorted runs and puts a key of the first
+# array right in front of the same key of the second one
+def merge_matches(keys1, keys2):
+    merged = np.concatenate([keys1, keys2])
+    order = np.argsort(merged, kind="stable")
+    merged = merged[order]
+    hit = np.flatnonzero(merged[1:] == merged[:-1])
+    return order[hit], order[hit + 1] - len(keys1)
+
+
+# Dense id dictionary of byte keys. The keys are kept as sorted runs together
+# with their ids, a new run is merged into the previous one as long as that one
+# is at most twice as large (see AddrSet), so a lookup only merges against
+# O(log n) runs
+class IdIndex:
+    def __init__(self):
+        self.runs = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # Returns the ids of a sorted and deduplicated key array, keys which are
+    # not in the index yet get the next free ids in key order
+    def lookup_add(self, keys):
+        ids = np.zeros(len(keys), dtype=ID_DTYPE)
+        found = np.zeros(len(keys), dtype=bool)
+        for run_keys, run_ids in self.runs:
+            run_pos, key_pos = merge_matches(run_keys, keys)
+            ids[key_pos] = run_ids[run_pos]
+            found[key_pos] = True
+        new = ~found
+        count = int(new.sum())
+        if count:
+            ids[new] = np.arange(self.size, self.size + count, dtype=ID_DTYPE)
+            self.size += count
+            self.runs.append((keys[new], ids[new]))
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= 2 * len(self.runs[-1][0]):
+            run_keys, run_ids = self.runs.pop()
+            merged_keys = np.concatenate([self.runs[-1][0], run_keys])
+            order = np.argsort(merged_keys, kind="stable")
+            self.runs[-1] = (merged_keys[order], np.concatenate([self.runs[-1][1], run_ids])[order])
+        return ids
+
+    # Builds an index from byte keys ordered by id
+    @classmethod
+    def from_keys(cls, keys):
+        index = cls()
+        if len(keys):
+            order = np.argsort(keys, kind="stable")
+            index.runs.append((keys[order], order.astype(ID_DTYPE)))
+            index.size = len(keys)
+        return index
+
+    # Returns the byte keys ordered by id
+    def keys_by_id(self):
+        keys = np.zeros(self.size, dtype="S24")
+        for run_keys, run_ids in self.runs:
+            keys[run_ids] = run_keys
+        return keys
+
+
+# Follows the hitlist snapshot by snapshot and logs when pairs are added,
+# leave or come back
+class StabilityTracker:
+    def __init__(self):
+        self.index = IdIndex()
+        self.dates = []
+        self.previous = np.zeros(0, dtype=ID_DTYPE)
+        self.event_ids = []
+        self.event_days = []
+
+    # Applies the snapshot of the next date given as sorted and deduplicated
+    # byte keys, returns the size of the cumulative set and the snapshot and
+    # the number of stayed, readded, totally new and gone pairs
+    def update(self, date, keys):
+        day = len(self.dates)
+        if day > np.iinfo(DAY_DTYPE).max:
+            raise ValueError(f"Too many snapshots for the {DAY_DTYPE.__name__} day index")
+        self.dates.append(date)
+
+        known = len(self.index)
+        current = np.sort(self.index.lookup_add(keys))
+        present = np.zeros(len(self.index), dtype=bool)
+        present[current] = True
+        was_present = np.zeros(len(self.index), dtype=bool)
+        was_present[self.previous] = True
+
+        new = current[~was_present[current]]
+        gone = self.previous[~present[self.previous]]
+        totally_new = new[new >= known]
+        readded = new[new < known]
+
+        # the log only needs to know that something changed for an id on a day,
+        # totally new, gone and readded ids are disjoint
+        changed = np.concatenate([new, gone])
+        self.event_ids.append(changed)
+        self.event_days.append(np.full(len(changed), day, dtype=DAY_DTYPE))
+        self.previous = current
+        return len(self.index), len(current), len(current) - len(new), len(readded), len(totally_new), len(gone)
+
+    # Builds the CSR transition log, the events of every id stay in date order
+    def transitions(self):
+        ids = np.concatenate([np.zeros(0, dtype=ID_DTYPE)] + self.event_ids)
+        days = np.concatenate([np.zeros(0, dtype=DAY_DTYPE)] + self.event_days)
+        order = np.argsort(ids, kind="stable")
+        offsets = np.zeros(len(self.index) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=len(self.index)), out=offsets[1:])
+        self.event_ids = [ids[order]]
+        self.event_days = [days[order]]
+        return offsets, days[order]
+
+    # Writes keys, dates, the transition log and the ids of the last snapshot
+    # to a binary .npz file. The file is replaced atomically, so a crash while
+    # writing a checkpoint keeps the previous one
+    def save(self, fn):
+        offsets, days = self.transitions()
+        tmp = fn + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, keys=self.index.keys_by_id(), dates=np.array(self.dates, dtype="S10"),
+                     offsets=offsets, days=days, previous=self.previous)
+        os.replace(tmp, fn)
+
+    # Restores a tracker from a file written by save to apply later snapshots
+    @classmethod
+    def load(cls, fn):
+        tracker = cls()
+        with np.load(fn) as data:
+            tracker.index = IdIndex.from_keys(data["keys"])
+            tracker.dates = data["dates"].astype(str).tolist()
+            tracker.previous = data["previous"]
+            offsets = data["offsets"]
+            tracker.event_ids = [np.repeat(np.arange(len(offsets) - 1, dtype=ID_DTYPE), np.diff(offsets))]
+            tracker.event_days = [data["days"]]
+        return tracker
+
+
+# Loads a binary transition log written by StabilityTracker.save, returns the
+# key array, the list of dates, the offsets and the day indices
+def load_transitions(fn):
+    with np.load(fn) as data:
+        return unpack_keys(data["keys"]), data["dates"].astype(str).tolist(), data["offsets"], data["days"]
+
+
+# Writes a transition log as text, one line per pair: "ip,asn,date;date;..."
+# The file is replaced atomically once it is complete
+def save_transitions_text(fn, keys, dates, offsets, days):
+    dates = np.array(dates)
+    tmp = fn + ".tmp"
+    with open(tmp, "w") as fw:
+        for i in range(0, len(keys), CHUNK_SIZE):
+            names = format_keys(keys[i:i + CHUNK_SIZE])
+            lo, hi = offsets[i], offsets[min(i + CHUNK_SIZE, len(keys))]
+            day_strs = dates[days[lo:hi]].tolist()
+            bounds = (offsets[i:i + CHUNK_SIZE + 1] - lo).tolist()
+            fw.write("".join(f"{name},{';'.join(day_strs[s:e])}\n" for name, s, e in zip(names, bounds[:-1], bounds[1:])))
+    os.replace(tmp, fn)
+
+
+# Turns "YYYY-MM-DD" date strings into day numbers
+def day_numbers(dates):
+    return np.array(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+# Computes the statistics of a CSR transition log given as offsets and day
+# numbers. The events of a pair alternate between up and down, the last state
+# lasts until now. Pairs added after the cutoff day (if given) are masked out
+# Returns the statistics and the mask of the kept pairs
+def stability_stats(offsets, values, now, cutoff=None):
+    counts = np.diff(offsets)
+    n = len(counts)
+    values = np.asarray(values, dtype=np.int64)
+    seg = np.repeat(np.arange(n), counts)
+    pos = np.arange(len(values)) - np.repeat(offsets[:-1], counts)
+
+    # gap between an event and the one before it, odd positions end an uptime
+    gaps = np.zeros(len(values), dtype=np.int64)
+    gaps[1:] = values[1:] - values[:-1]
+    gaps[pos == 0] = 0
+    odd = pos % 2 == 1
+    up_sum = np.bincount(seg, weights=np.where(odd, gaps, 0), minlength=n).astype(np.int64)
+    down_sum = np.bincount(seg, weights=np.where(odd, 0, gaps), minlength=n).astype(np.int64)
+
+    # the open interval from the last event until now
+    nonempty = counts > 0
+    first = np.where(nonempty, values[np.minimum(offsets[:-1], len(values) - 1)], now)
+    last = np.where(nonempty, values[np.maximum(offsets[1:] - 1, 0)], now)
+    extend = last != now
+    up_sum += np.where(extend & (counts % 2 == 1), now - last, 0)
+    down_sum += np.where(extend & (counts % 2 == 0), now - last, 0)
+    length = counts + extend
+
+    stats = np.zeros(n, dtype=STATS_DTYPE)
+    stats["changes"] = counts
+    stats["up_sum"] = up_sum
+    stats["down_sum"] = down_sum
+    stats["up_avg"] = np.where(length > 1, up_sum / np.maximum(length // 2, 1), 0)
+    stats["down_avg"] = np.where(length > 2, down_sum / np.maximum((length - 1) // 2, 1), 0)
+    keep = np.ones(n, dtype=bool) if cutoff is None else first <= cutoff
+    return stats, keep
+
+
+# Parses a text transition log ("ip,asn,date;date;...") in chunks of lines,
+# yields the "ip,asn" names, offsets and day numbers of every chunk
+def iter_transitions_text(fn):
+    with open(fn) as f:
+        while True:
+            lines = list(islice(f, CHUNK_SIZE))
+            if not lines:
+                break
+            parts = [line.rstrip("\n").rsplit(",", 1) for line in lines]
+            dates = ";".join(p[1] for p in parts).split(";")
+            counts = np.array([p[1].count(";") + 1 for p in parts], dtype=np.int64)
+            offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            yield [p[0] for p in parts], offsets, day_numbers(dates)
+
+
+# Formats statistics like the .ipdata files, averages of pairs without a
+# complete interval are written as 0
+def format_stats(names, stats):
+    cols = [stats[field].tolist() for field in STATS_DTYPE.names]
+    return [f"{name},{changes},{up_avg if up_avg else 0},{down_avg if down_avg else 0},{up_sum},{down_sum}\n"
+            for name, changes, up_avg, down_avg, up_sum, down_sum in zip(names, *cols)]
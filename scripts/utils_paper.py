@@ -1,12 +1,12 @@
 import subprocess
-import tqdm
 import json
-import pyasn
 import itertools
 import functools
 import numpy as np
 import matplotlib.pyplot as plt
 from cycler import cycler
+from addr_utils import iter_parse_file
+from asn_utils import NO_ASN, load_asn_index, count_asns
 
 # Spelling unification of PeeringDB categories
 def clean_peeringdb(cat):
@@ -62,36 +62,24 @@ def lookup_peeringdb(asn, db, filter=True, shorten=False):
 wc = lambda x: int(subprocess.check_output(["wc", "-l", x]).decode().strip().split(" ")[0])
 
 # Analyze a file of addresses for the distribution of contained network categories
+# The addresses are looked up block-wise in the ASN index (see asn_utils), so
+# the categories are only determined once per AS. Header lines are skipped
 # Returns two dictionaries:
 #  - one contains the amount of addresses for each network category
 #  - one returns the set of contained ASes for each network category
-def categ(fn, asndb, peeringdb, total=0, dofilter=False):
-    total = 0
+def categ(fn, asndb, peeringdb, dofilter=False):
+    asn_counts = dict()
+    for arr in iter_parse_file(fn):
+        for asn, count in zip(*[el.tolist() for el in count_asns(asndb, arr)]):
+            asn_counts[asn] = asn_counts.get(asn, 0) + count
+
     cat_distr = dict()
     cat_distr_ases = dict()
-    with open(fn) as f:
-        try:
-            next(f)
-        except StopIteration:
-            return 0, cat_distr
-        
-        for line in tqdm.tqdm(f, total=total):
-            total += 1
-            ip = line.strip().split(",")[0]
-            asn, pfx = asndb.lookup(ip)
+    for asn, count in asn_counts.items():
+        ascat = lookup_peeringdb(None if asn == NO_ASN else asn, peeringdb, filter=dofilter)
+        cat_distr[ascat] = cat_distr.get(ascat, 0) + count
+        cat_distr_ases[ascat] = cat_distr_ases.get(ascat, 0) + 1
 
-            ascat = lookup_peeringdb(asn, peeringdb, filter=dofilter)
-
-            if not ascat in cat_distr:
-                cat_distr[ascat] = 0
-                cat_distr_ases[ascat] = set()
-
-            cat_distr[ascat] += 1
-            cat_distr_ases[ascat].add(asn)
-    
-    for cat in cat_distr_ases:
-        cat_distr_ases[cat] = len(cat_distr_ases[cat])
-            
     return cat_distr_ases, cat_distr
 
 